@@ -0,0 +1,41 @@
+from fastapi import APIRouter, HTTPException
+from .. import config, crud, ingest, replica, sharding
+from ..database import pool_metrics
+
+router = APIRouter(
+    prefix="/admin",
+    tags=["Admin"]
+)
+
+@router.get("/cache", summary="In-process cache statistics")
+def cache_stats():
+    return crud.cache_stats()
+
+@router.post("/rates/reload", summary="Reload exchange rates from EXPENSE_RATES_FILE")
+def reload_rates():
+    try:
+        return {"currencies": crud.reload_rates()}
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/pool", summary="Database connection pool metrics")
+def pool_stats():
+    return pool_metrics.snapshot()
+
+@router.get("/ingest", summary="Expense ingestion queue statistics")
+def ingest_stats():
+    if not config.INGEST_QUEUE:
+        return {"enabled": False}
+    return {"enabled": True, **ingest.get_queue().stats()}
+
+@router.get("/reads", summary="Reads served by the read pool vs. sent to the primary")
+def read_stats():
+    if not config.READ_POOL:
+        return {"enabled": False}
+    return {"enabled": True, **replica.get_pool().stats()}
+
+@router.get("/shards", summary="Groups, expenses and pool metrics per shard")
+def shard_stats():
+    if config.SHARDS <= 1:
+        return {"enabled": False}
+    return {"enabled": True, "shards": sharding.get_router().status()}
@@ -0,0 +1,97 @@
+# app/async_crud.py
+"""Async counterparts of the functions in crud.py.
+
+Each one runs the sync implementation on the AsyncSession's underlying
+Session via ``run_sync``. Validation, split logic and the balance ledger
+therefore have a single implementation, while the calling coroutine yields
+to the event loop on every database round trip. Writes that crud retries on
+StaleVersion are retried here instead, so the backoff between attempts is an
+``asyncio.sleep`` rather than a ``time.sleep`` on the event loop.
+"""
+import asyncio
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import config, crud, metrics, schemas
+
+
+async def _retry_stale(db: AsyncSession, fn, group_id: int, *args):
+    """crud._retry_stale for coroutines: runs ``fn.once`` and awaits the backoff."""
+    for attempt in range(config.WRITE_RETRIES):
+        try:
+            return await db.run_sync(fn.once, group_id, *args)
+        except crud.StaleVersion:
+            await db.rollback()
+            await asyncio.sleep(crud._retry_delay(attempt))
+    raise crud.GroupBusy("Group is being updated concurrently, retry later")
+
+
+async def create_user(db: AsyncSession, name: str, email: str = None):
+    return await db.run_sync(crud.create_user, name, email)
+
+async def create_group(db: AsyncSession, name: str, base_currency: str = "USD"):
+    return await db.run_sync(crud.create_group, name, base_currency)
+
+async def add_member(db: AsyncSession, group_id: int, user_id: int):
+    return await db.run_sync(crud.add_member, group_id, user_id)
+
+async def get_group_members(db: AsyncSession, group_id: int):
+    return await db.run_sync(crud.get_group_members, group_id)
+
+async def validate_expense(db: AsyncSession, group_id: int, expense_in: schemas.ExpenseCreate):
+    return await db.run_sync(crud.validate_expense, group_id, expense_in)
+
+async def add_expense(db: AsyncSession, group_id: int, expense_in: schemas.ExpenseCreate):
+    return await db.run_sync(crud.add_expense, group_id, expense_in)
+
+async def add_expenses_bulk(db: AsyncSession, group_id: int, expenses_in, atomic: bool = False):
+    return await db.run_sync(crud.add_expenses_bulk, group_id, expenses_in, atomic)
+
+async def compute_group_balances(db: AsyncSession, group_id: int):
+    return await db.run_sync(crud.compute_group_balances, group_id)
+
+async def get_group_balances(db: AsyncSession, group_id: int):
+    return await db.run_sync(crud.get_group_balances, group_id)
+
+async def current_balances_etag(db: AsyncSession, group_id: int):
+    return await db.run_sync(crud.current_balances_etag, group_id)
+
+async def cached_group_balances(db: AsyncSession, group_id: int, version: int = None):
+    return await db.run_sync(crud.cached_group_balances, group_id, version)
+
+async def get_currency_balances(db: AsyncSession, group_id: int):
+    return await db.run_sync(crud.get_currency_balances, group_id)
+
+async def get_group_debts(db: AsyncSession, group_id: int):
+    return await db.run_sync(crud.get_group_debts, group_id)
+
+async def rebuild_balances(db: AsyncSession, group_id: int):
+    return await db.run_sync(crud.rebuild_balances, group_id)
+
+async def check_balances(db: AsyncSession, group_id: int):
+    return await db.run_sync(crud.check_balances, group_id)
+
+async def add_settlement(db: AsyncSession, group_id: int, payer_id: int, payee_id: int, amount,
+                         currency: str = None):
+    with metrics.span("add_settlement"):
+        return await _retry_stale(db, crud.add_settlement, group_id, payer_id, payee_id, amount, currency)
+
+async def add_settlements_batch(db: AsyncSession, group_id: int, transfers, idempotency_key: str = None):
+    return await _retry_stale(db, crud.add_settlements_batch, group_id, transfers, idempotency_key)
+
+async def simplify_debts(db: AsyncSession, group_id: int, strategy: str = "auto", currencies: str = "base"):
+    with metrics.span("simplify_debts"):
+        return await _retry_stale(db, crud.simplify_debts, group_id, strategy, currencies)
+
+async def plan_simplification(db: AsyncSession, group_id: int, strategy: str = "auto", currencies: str = "base"):
+    return await db.run_sync(crud.plan_simplification, group_id, strategy, currencies)
+
+async def list_expenses(db: AsyncSession, group_id: int, **filters):
+    return await db.run_sync(crud.list_expenses, group_id, **filters)
+
+async def list_settlements(db: AsyncSession, group_id: int, **filters):
+    return await db.run_sync(crud.list_settlements, group_id, **filters)
+
+async def balances_as_of(db: AsyncSession, group_id: int, as_of):
+    return await db.run_sync(crud.balances_as_of, group_id, as_of)
+
+async def take_checkpoint(db: AsyncSession, group_id: int, at=None):
+    return await db.run_sync(crud.take_checkpoint, group_id, at)
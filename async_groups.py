@@ -0,0 +1,88 @@
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from .. import async_crud, config, crud, ingest, schemas
+from ..cache import etag_matches
+from ..database import get_async_db
+from decimal import Decimal
+import asyncio
+from typing import Optional
+
+# Async versions of the hot endpoints in groups.py. Mounted ahead of
+# groups.router when EXPENSE_ASYNC_DB is set, so these paths take precedence
+# and everything else falls through to the sync router.
+router = APIRouter(
+    prefix="/groups",
+    tags=["Groups"]
+)
+
+@router.post("/{group_id}/expenses", summary="Add expense to group")
+async def add_expense(group_id: int, expense: schemas.ExpenseCreate, db: AsyncSession = Depends(get_async_db)):
+    try:
+        if not config.INGEST_QUEUE:
+            return await async_crud.add_expense(db, group_id, expense)
+        currency, shares = await async_crud.validate_expense(db, group_id, expense)
+        # Enqueueing may wait for room in the queue, so keep it off the event loop.
+        future = await run_in_threadpool(ingest.get_queue().enqueue, group_id, expense, currency, shares)
+        return await asyncio.wrap_future(future)
+    except ingest.QueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/{group_id}/expenses/balances", summary="Get group balances")
+async def get_balances(group_id: int, if_none_match: Optional[str] = Header(None),
+                       db: AsyncSession = Depends(get_async_db)):
+    try:
+        version, etag = await async_crud.current_balances_etag(db, group_id)
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers={"ETag": etag})
+        version, balances = await async_crud.cached_group_balances(db, group_id, version)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    body = [{"user_id": uid, "net": float(net)} for uid, net in balances.items()]
+    return JSONResponse(body, headers={"ETag": etag})
+
+@router.post("/{group_id}/settle", summary="Settle a debt between two users")
+async def settle_debt(group_id: int, settlement: schemas.SettlementCreate, db: AsyncSession = Depends(get_async_db)):
+    try:
+        return await async_crud.add_settlement(
+            db,
+            group_id=group_id,
+            payer_id=settlement.payer_id,
+            payee_id=settlement.payee_id,
+            amount=Decimal(settlement.amount),
+            currency=settlement.currency
+        )
+    except crud.GroupBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/{group_id}/simplify/plan", summary="Preview the transfers simplify would record")
+async def simplify_plan(group_id: int, strategy: str = "auto", currencies: str = "base", db: AsyncSession = Depends(get_async_db)):
+    try:
+        version, transfers = await async_crud.plan_simplification(db, group_id, strategy, currencies)
+        return {
+            "group_id": group_id,
+            "version": version,
+            "strategy": strategy,
+            "currencies": currencies,
+            "transfers": [
+                {"payer_id": payer, "payee_id": payee, "amount": float(amount), "currency": currency}
+                for payer, payee, amount, currency in transfers
+            ],
+        }
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/{group_id}/simplify", summary="Simplify debts in a group")
+async def simplify(group_id: int, strategy: str = "auto", currencies: str = "base",
+                   db: AsyncSession = Depends(get_async_db)):
+    try:
+        return await async_crud.simplify_debts(db, group_id, strategy, currencies)
+    except crud.GroupBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
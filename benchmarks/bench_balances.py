@@ -0,0 +1,80 @@
+# app/benchmarks/bench_balances.py
+"""Balance computation latency as group size grows.
+
+Compares the grouped-aggregate engine in ``crud.compute_group_balances``
+against the previous per-member query loop.
+
+    python -m app.benchmarks.bench_balances
+"""
+import random
+from decimal import Decimal
+from sqlalchemy import func
+from .. import crud, models
+from .common import memory_session, best_of
+
+GROUP_SIZES = [10, 50, 200, 500]
+EXPENSES_PER_MEMBER = 5
+
+
+def per_member_balances(db, group_id):
+    """The original implementation: four aggregate queries per member."""
+    members = db.query(models.GroupMember).filter(models.GroupMember.group_id == group_id).all()
+    balances = {}
+    for m in members:
+        uid = m.user_id
+        paid = db.query(func.coalesce(func.sum(models.ExpensePayer.amount), 0)).join(
+            models.Expense, models.Expense.id == models.ExpensePayer.expense_id
+        ).filter(models.Expense.group_id == group_id, models.ExpensePayer.user_id == uid).scalar() or 0
+        share = db.query(func.coalesce(func.sum(models.ExpenseShare.amount), 0)).join(
+            models.Expense, models.Expense.id == models.ExpenseShare.expense_id
+        ).filter(models.Expense.group_id == group_id, models.ExpenseShare.user_id == uid).scalar() or 0
+        received = db.query(func.coalesce(func.sum(models.Settlement.amount), 0)).filter(
+            models.Settlement.group_id == group_id, models.Settlement.payee_id == uid
+        ).scalar() or 0
+        paid_sett = db.query(func.coalesce(func.sum(models.Settlement.amount), 0)).filter(
+            models.Settlement.group_id == group_id, models.Settlement.payer_id == uid
+        ).scalar() or 0
+        net = Decimal(paid) - Decimal(share) + Decimal(paid_sett) - Decimal(received)
+        balances[uid] = net.quantize(Decimal("0.01"))
+    return balances
+
+
+def seed_group(db, size: int, rng: random.Random) -> int:
+    group = models.Group(name=f"bench-{size}")
+    db.add(group)
+    db.flush()
+    users = [models.User(name=f"u{i}") for i in range(size)]
+    db.add_all(users)
+    db.flush()
+    db.add_all(models.GroupMember(group_id=group.id, user_id=u.id) for u in users)
+    for _ in range(size * EXPENSES_PER_MEMBER):
+        payer = rng.choice(users)
+        sharers = rng.sample(users, min(size, 4))
+        cents = rng.randint(100, 10000) * len(sharers)
+        expense = models.Expense(group_id=group.id, amount=Decimal(cents) / 100)
+        db.add(expense)
+        db.flush()
+        db.add(models.ExpensePayer(expense_id=expense.id, user_id=payer.id, amount=expense.amount))
+        for u in sharers:
+            db.add(models.ExpenseShare(
+                expense_id=expense.id, user_id=u.id, amount=Decimal(cents // len(sharers)) / 100
+            ))
+    db.commit()
+    return group.id
+
+
+def main():
+    rng = random.Random(42)
+    print(f"{'members':>8} {'per-member (ms)':>16} {'grouped (ms)':>13} {'speedup':>8}")
+    for size in GROUP_SIZES:
+        db = memory_session()
+        gid = seed_group(db, size, rng)
+        assert per_member_balances(db, gid) == crud.compute_group_balances(db, gid)
+        old = best_of(lambda: per_member_balances(db, gid), repeat=3)
+        new = best_of(lambda: crud.compute_group_balances(db, gid), repeat=3)
+        print(f"{size:>8} {old * 1000:>16.1f} {new * 1000:>13.1f} {old / new:>7.1f}x")
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
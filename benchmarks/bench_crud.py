@@ -0,0 +1,86 @@
+# app/benchmarks/bench_crud.py
+"""Latency of the core crud functions on a generated dataset, as JSON.
+
+Seeds a database with ``generator.generate`` and times add_expense,
+compute_group_balances, get_group_balances, add_settlement and
+simplify_debts call by call against random groups, reporting p50/p90/p99
+and throughput per function. simplify_debts settles a group, so each call
+gets a group of its own.
+
+    python -m app.benchmarks.bench_crud [--groups 200] [--expenses 500] [--iterations 500] [--out crud.json]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from .. import crud, schemas
+from .common import emit, latency_stats
+from .generator import generate, layout
+
+
+def sample(fn, calls) -> dict:
+    """Run ``fn(arg)`` for every arg in ``calls`` and summarize the latencies."""
+    samples = []
+    start = time.perf_counter()
+    for arg in calls:
+        t = time.perf_counter()
+        fn(arg)
+        samples.append(time.perf_counter() - t)
+    return latency_stats(samples, time.perf_counter() - start)
+
+
+def run(db, groups: dict, iterations: int, rng: random.Random) -> dict:
+    group_ids = list(groups)
+
+    def add_expense(gid):
+        users = rng.sample(groups[gid], min(4, len(groups[gid])))
+        crud.add_expense(db, gid, schemas.ExpenseCreate(
+            amount=40.00, paid_by=[{"user_id": users[0], "amount": 40.00}], split_type="equal", users=users,
+        ))
+
+    def add_settlement(gid):
+        balances = crud.get_group_balances(db, gid)
+        debtor = min(balances, key=balances.get)
+        creditor = max(balances, key=balances.get)
+        crud.add_settlement(db, gid, debtor, creditor, min(-balances[debtor], balances[creditor], 1))
+
+    picks = [rng.choice(group_ids) for _ in range(iterations)]
+    results = {
+        "add_expense": sample(add_expense, picks),
+        "compute_group_balances": sample(lambda gid: crud.compute_group_balances(db, gid), picks),
+        "get_group_balances": sample(lambda gid: crud.get_group_balances(db, gid), picks),
+        "add_settlement": sample(add_settlement, picks),
+    }
+    results["simplify_debts"] = sample(lambda gid: crud.simplify_debts(db, gid), group_ids[:iterations])
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--groups", type=int, default=200)
+    parser.add_argument("--members", type=int, default=8)
+    parser.add_argument("--expenses", type=int, default=500, help="expenses per group")
+    parser.add_argument("--settlements", type=int, default=50, help="settlements per group")
+    parser.add_argument("--iterations", type=int, default=500, help="calls per function")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", help="also write the JSON report here")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        start = time.perf_counter()
+        counts = generate(engine, args.groups, args.members, args.expenses, args.settlements, seed=args.seed)
+        seeded = time.perf_counter() - start
+        crud.clear_caches()
+        db = sessionmaker(bind=engine, autoflush=False, autocommit=False)()
+        results = run(db, layout(args.groups, args.members), args.iterations, random.Random(args.seed))
+        db.close()
+        engine.dispose()
+    emit("crud", {**vars(args), "rows": counts, "seed_seconds": round(seeded, 2)}, results, args.out)
+
+
+if __name__ == "__main__":
+    main()
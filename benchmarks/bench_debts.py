@@ -0,0 +1,70 @@
+# app/benchmarks/bench_debts.py
+"""Pairwise debt graph: incremental reads vs. recomputing from history.
+
+Seeds groups through ``crud.add_expense`` so the group_debts edges are kept
+up to date by the normal write path, then compares reading them
+(``crud.get_group_debts``) against rebuilding the graph from every expense
+and settlement. Also reports the per-expense write cost of maintaining the
+graph by re-seeding with the edge updates switched off.
+
+    python -m app.benchmarks.bench_debts
+"""
+import random
+import time
+from unittest import mock
+from .. import crud, schemas
+from .common import memory_session, best_of
+
+GROUP_SIZES = [1_000, 5_000]
+MEMBERS = 20
+
+
+def seed(db, expenses: int, rng: random.Random):
+    """Create a group and add ``expenses`` expenses; returns (group_id, seconds per expense)."""
+    group = crud.create_group(db, f"debts-{expenses}")
+    users = [crud.create_user(db, f"u{i}") for i in range(MEMBERS)]
+    for u in users:
+        crud.add_member(db, group.id, u.id)
+    ids = [u.id for u in users]
+    start = time.perf_counter()
+    for _ in range(expenses):
+        sharers = rng.sample(ids, 4)
+        payers = rng.sample(ids, rng.choice((1, 1, 2)))
+        cents = rng.randint(100, 10000) * len(payers)
+        crud.add_expense(db, group.id, schemas.ExpenseCreate(
+            amount=cents / 100,
+            paid_by=[{"user_id": p, "amount": cents // len(payers) / 100} for p in payers],
+            split_type="equal",
+            users=sharers,
+        ))
+    return group.id, (time.perf_counter() - start) / expenses
+
+
+def recompute(db, group_id):
+    return {key: d for key, d in crud._history_debts(db, group_id).items() if d}
+
+
+def main():
+    print(f"{'expenses':>9} {'edges':>6} {'incremental (ms)':>17} {'recompute (ms)':>15} {'speedup':>8} "
+          f"{'add (ms)':>9} {'add w/o graph (ms)':>19}")
+    for size in GROUP_SIZES:
+        db = memory_session()
+        gid, per_add = seed(db, size, random.Random(size))
+        edges = crud.get_group_debts(db, gid)
+        stored = {(min(e["debtor_id"], e["creditor_id"]), max(e["debtor_id"], e["creditor_id"]), e["currency"])
+                  for e in edges}
+        assert stored == set(recompute(db, gid))
+        new = best_of(lambda: crud.get_group_debts(db, gid), repeat=5)
+        old = best_of(lambda: recompute(db, gid), repeat=3)
+        db.close()
+
+        db = memory_session()
+        with mock.patch.object(crud, "_apply_debt_deltas", lambda *args: None):
+            _, per_add_without = seed(db, size, random.Random(size))
+        db.close()
+        print(f"{size:>9} {len(edges):>6} {new * 1000:>17.2f} {old * 1000:>15.1f} {old / new:>7.0f}x "
+              f"{per_add * 1000:>9.2f} {per_add_without * 1000:>19.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# app/benchmarks/bench_export.py
+"""Peak Python memory of a full ledger export as the group grows.
+
+Compares the streaming export (crud.iter_ledger + export.ndjson_lines)
+against loading every expense as an ORM object with its payers and shares
+and serializing the lot. Peaks are measured with tracemalloc; SQLite's own
+page cache is not included.
+
+    python -m app.benchmarks.bench_export
+"""
+import json
+import time
+import tracemalloc
+from decimal import Decimal
+from sqlalchemy import insert
+from sqlalchemy.orm import selectinload
+from .. import crud, export, models
+from .common import memory_session
+
+GROUP_SIZES = [2_000, 20_000, 100_000]
+
+
+def seed(db, expenses: int) -> int:
+    group = models.Group(name=f"export-{expenses}")
+    db.add(group)
+    db.flush()
+    users = [models.User(name=f"u{i}") for i in range(10)]
+    db.add_all(users)
+    db.flush()
+    ids = [u.id for u in users]
+    db.execute(insert(models.Expense.__table__), [
+        {"group_id": group.id, "description": f"expense {i}", "amount": Decimal("30.00"), "currency": "USD"}
+        for i in range(expenses)
+    ])
+    expense_ids = [eid for (eid,) in db.query(models.Expense.id).filter(models.Expense.group_id == group.id)]
+    db.execute(insert(models.ExpensePayer.__table__), [
+        {"expense_id": eid, "user_id": ids[eid % 10], "amount": Decimal("30.00")} for eid in expense_ids
+    ])
+    db.execute(insert(models.ExpenseShare.__table__), [
+        {"expense_id": eid, "user_id": ids[(eid + k) % 10], "amount": Decimal("10.00")}
+        for eid in expense_ids for k in range(3)
+    ])
+    db.commit()
+    return group.id
+
+
+def streamed(db, group_id):
+    size = 0
+    for chunk in export.chunked(export.ndjson_lines(crud.iter_ledger(db, group_id))):
+        size += len(chunk)
+    return size
+
+
+def loaded(db, group_id):
+    expenses = db.query(models.Expense).filter(models.Expense.group_id == group_id).options(
+        selectinload(models.Expense.payers), selectinload(models.Expense.shares)
+    ).all()
+    body = "".join(json.dumps({
+        "id": e.id, "description": e.description, "amount": float(e.amount),
+        "payers": [{"user_id": p.user_id, "amount": float(p.amount)} for p in e.payers],
+        "shares": [{"user_id": s.user_id, "amount": float(s.amount)} for s in e.shares],
+    }) + "\n" for e in expenses)
+    return len(body)
+
+
+def measure(fn, db, group_id):
+    """Peak traced MiB, and wall time from a separate untraced run."""
+    db.expunge_all()
+    start = time.perf_counter()
+    fn(db, group_id)
+    elapsed = time.perf_counter() - start
+    db.expunge_all()
+    tracemalloc.start()
+    fn(db, group_id)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 2**20, elapsed
+
+
+def main():
+    print(f"{'expenses':>9} {'load-all peak (MiB)':>20} {'streamed peak (MiB)':>20} {'load-all (s)':>13} {'streamed (s)':>13}")
+    for size in GROUP_SIZES:
+        db = memory_session()
+        gid = seed(db, size)
+        old_peak, old_time = measure(loaded, db, gid)
+        new_peak, new_time = measure(streamed, db, gid)
+        print(f"{size:>9} {old_peak:>20.1f} {new_peak:>20.1f} {old_time:>13.2f} {new_time:>13.2f}")
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
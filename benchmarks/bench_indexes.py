@@ -0,0 +1,111 @@
+# app/benchmarks/bench_indexes.py
+"""Query plans and balance latency before and after the hot-path index migration.
+
+Seeds a file-backed SQLite database with the pre-index schema, times the
+balance queries, applies ``run_migrations`` and times them again.
+
+    python -m app.benchmarks.bench_indexes [--shares 1000000] [--groups 2000]
+"""
+import argparse
+import os
+import random
+import tempfile
+from decimal import Decimal
+from sqlalchemy import create_engine, insert, text
+from sqlalchemy.orm import sessionmaker
+from .. import crud, models
+from ..database import Base
+from ..migrations import MIGRATIONS, run_migrations
+from .common import best_of
+
+PLAN_QUERIES = {
+    "payers": "SELECT p.user_id, SUM(p.amount) FROM expense_payers p JOIN expenses e "
+              "ON e.id = p.expense_id WHERE e.group_id = :g GROUP BY p.user_id",
+    "shares": "SELECT s.user_id, SUM(s.amount) FROM expense_shares s JOIN expenses e "
+              "ON e.id = s.expense_id WHERE e.group_id = :g GROUP BY s.user_id",
+    "settlements": "SELECT payer_id, SUM(amount) FROM settlements WHERE group_id = :g GROUP BY payer_id",
+    "members": "SELECT user_id FROM group_members WHERE group_id = :g",
+}
+
+
+def create_legacy_schema(engine):
+    """Tables as they were before migration 2: no composite indexes."""
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                if index.name != f"ix_{table.name}_id":
+                    conn.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+        # Recreate group_members without the unique constraint.
+        conn.execute(text("DROP TABLE group_members"))
+        conn.execute(text(
+            "CREATE TABLE group_members (id INTEGER PRIMARY KEY, group_id INTEGER, user_id INTEGER)"
+        ))
+        conn.execute(text("CREATE TABLE schema_version (version INTEGER NOT NULL)"))
+        conn.execute(text("INSERT INTO schema_version (version) VALUES (1)"))
+
+
+def seed(engine, shares: int, groups: int, rng: random.Random):
+    members_per_group = 8
+    users = groups * members_per_group
+    expenses = shares // 4
+    with engine.begin() as conn:
+        conn.execute(insert(models.User), [{"id": i + 1, "name": f"u{i}"} for i in range(users)])
+        conn.execute(insert(models.Group), [{"id": g + 1, "name": f"g{g}"} for g in range(groups)])
+        conn.execute(insert(models.GroupMember), [
+            {"group_id": g + 1, "user_id": g * members_per_group + m + 1}
+            for g in range(groups) for m in range(members_per_group)
+        ])
+    batch = 50_000
+    for start in range(0, expenses, batch):
+        exp_rows, payer_rows, share_rows = [], [], []
+        for eid in range(start + 1, min(start + batch, expenses) + 1):
+            g = rng.randrange(groups)
+            base = g * members_per_group + 1
+            exp_rows.append({"id": eid, "group_id": g + 1, "amount": Decimal("40.00")})
+            payer_rows.append({"expense_id": eid, "user_id": base + rng.randrange(members_per_group),
+                               "amount": Decimal("40.00")})
+            for uid in rng.sample(range(base, base + members_per_group), 4):
+                share_rows.append({"expense_id": eid, "user_id": uid, "amount": Decimal("10.00")})
+        with engine.begin() as conn:
+            conn.execute(insert(models.Expense), exp_rows)
+            conn.execute(insert(models.ExpensePayer), payer_rows)
+            conn.execute(insert(models.ExpenseShare), share_rows)
+
+
+def report(engine, session, group_ids, label):
+    print(f"\n== {label} ==")
+    with engine.connect() as conn:
+        for name, sql in PLAN_QUERIES.items():
+            plan = conn.execute(text("EXPLAIN QUERY PLAN " + sql), {"g": group_ids[0]}).fetchall()
+            print(f"  {name:<12} " + " | ".join(row[-1] for row in plan))
+    elapsed = best_of(lambda: [crud.compute_group_balances(session, g) for g in group_ids], repeat=3)
+    print(f"  compute_group_balances x{len(group_ids)}: {elapsed * 1000:.1f} ms")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--shares", type=int, default=1_000_000)
+    parser.add_argument("--groups", type=int, default=2_000)
+    args = parser.parse_args()
+
+    crud.clear_caches()
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    engine = create_engine(f"sqlite:///{path}")
+    create_legacy_schema(engine)
+    seed(engine, args.shares, args.groups, random.Random(7))
+    session = sessionmaker(bind=engine)()
+    group_ids = random.Random(1).sample(range(1, args.groups + 1), 20)
+
+    before = report(engine, session, group_ids, "before migrations")
+    version = run_migrations(engine)
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE"))
+    after = report(engine, session, group_ids, f"after migrations (schema v{version})")
+    print(f"\nspeedup: {before / after:.1f}x  ({args.shares} share rows, db at {path})")
+    assert version == MIGRATIONS[-1][0]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# app/benchmarks/bench_ingest.py
+"""Bursty expense writes: one commit per expense vs. the write-behind queue.
+
+``--threads`` writers add expenses to a handful of groups at once on a
+file-backed SQLite database, first through crud.add_expense (a commit per
+expense), then through ingest.IngestQueue (one commit per group per batch).
+Prints a JSON report with throughput and p50/p99 per mode. Each mode runs in
+its own fresh database; EXPENSE_SQLITE_SYNCHRONOUS=FULL makes every commit
+an fsync, which is where coalescing pays most.
+
+    python -m app.benchmarks.bench_ingest [--threads 32] [--per-thread 50] [--groups 4]
+"""
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from .. import config, crud, ingest, schemas
+from ..database import apply_sqlite_pragmas, engine_options
+from .common import emit, latency_stats
+from .generator import generate, layout
+
+
+def run(mode: str, args) -> dict:
+    tmp = tempfile.TemporaryDirectory()
+    url = f"sqlite:///{os.path.join(tmp.name, 'ingest.db')}"
+    engine = create_engine(url, **engine_options(url))
+    apply_sqlite_pragmas(engine)
+    generate(engine, groups=args.groups, members=8, expenses=10, settlements=0)
+    crud.clear_caches()
+    Session = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+    groups = layout(args.groups, 8)
+    queue = ingest.IngestQueue(lambda group_id: Session(), batch_size=args.batch_size, batch_ms=args.batch_ms, maxsize=10_000)
+
+    def writer(i: int):
+        db = Session()
+        samples = []
+        try:
+            for n in range(args.per_thread):
+                gid = (i + n) % args.groups + 1
+                users = groups[gid][:4]
+                expense = schemas.ExpenseCreate(amount=40.0, paid_by=[{"user_id": users[0], "amount": 40.0}],
+                                                split_type="equal", users=users)
+                start = time.perf_counter()
+                if mode == "direct":
+                    crud.add_expense(db, gid, expense)
+                else:
+                    queue.submit(db, gid, expense).result()
+                samples.append(time.perf_counter() - start)
+        finally:
+            db.close()
+        return samples
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.threads) as pool:
+        samples = [s for batch in pool.map(writer, range(args.threads)) for s in batch]
+    elapsed = time.perf_counter() - start
+    queue.stop()
+    result = latency_stats(samples, elapsed)
+    if mode == "queued":
+        result["queue"] = queue.stats()
+    engine.dispose()
+    tmp.cleanup()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--per-thread", type=int, default=50)
+    parser.add_argument("--groups", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--batch-ms", type=int, default=5)
+    parser.add_argument("--out", help="also write the JSON report here")
+    args = parser.parse_args()
+    results = {mode: run(mode, args) for mode in ("direct", "queued")}
+    results["speedup"] = round(results["queued"]["ops_per_s"] / results["direct"]["ops_per_s"], 2)
+    emit("ingest", {**vars(args), "synchronous": config.SQLITE_SYNCHRONOUS}, results, args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# app/benchmarks/bench_money.py
+"""NUMERIC(12, 2) vs integer-cent money storage.
+
+The storage mode is read from EXPENSE_MONEY_CENTS at import time, so each
+mode runs in its own child process. Measures bulk-insert throughput, the
+grouped balance aggregate and raw row loading on one large group. The modes
+alternate for several rounds and the best figure per mode is kept, to damp
+noise from other load on the machine.
+
+    python -m app.benchmarks.bench_money [--shares 100000] [--rounds 3]
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from decimal import Decimal
+from sqlalchemy import insert
+from .. import config, crud, models
+from .common import memory_session, best_of
+
+MEMBERS = 200
+SHARES_PER_EXPENSE = 4
+
+
+def run(shares: int) -> dict:
+    rng = random.Random(7)
+    db = memory_session()
+    group = models.Group(name="bench-money")
+    db.add(group)
+    db.flush()
+    users = [models.User(name=f"u{i}") for i in range(MEMBERS)]
+    db.add_all(users)
+    db.flush()
+    db.add_all(models.GroupMember(group_id=group.id, user_id=u.id) for u in users)
+    expenses = [models.Expense(group_id=group.id, amount=Decimal("0")) for _ in range(shares // SHARES_PER_EXPENSE)]
+    db.add_all(expenses)
+    db.commit()
+
+    payer_rows, share_rows = [], []
+    for e in expenses:
+        cents = [rng.randint(1, 5000) for _ in range(SHARES_PER_EXPENSE)]
+        payer_rows.append({"expense_id": e.id, "user_id": rng.choice(users).id, "amount": Decimal(sum(cents)) / 100})
+        for c in cents:
+            share_rows.append({"expense_id": e.id, "user_id": rng.choice(users).id, "amount": Decimal(c) / 100})
+
+    start = time.perf_counter()
+    db.execute(insert(models.ExpensePayer.__table__), payer_rows)
+    db.execute(insert(models.ExpenseShare.__table__), share_rows)
+    db.commit()
+    loaded = time.perf_counter() - start
+
+    aggregate = best_of(lambda: crud.compute_group_balances(db, group.id), repeat=5)
+    fetch = best_of(lambda: db.query(models.ExpenseShare.amount).all(), repeat=3)
+    total = sum(crud.compute_group_balances(db, group.id).values())
+    db.close()
+    return {
+        "mode": "cents" if config.MONEY_AS_CENTS else "decimal",
+        "insert_rows_per_s": (len(payer_rows) + len(share_rows)) / loaded,
+        "aggregate_ms": aggregate * 1000,
+        "fetch_rows_per_s": len(share_rows) / fetch,
+        "balance_total": str(total),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--shares", type=int, default=100_000)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        print(json.dumps(run(args.shares)))
+        return
+
+    best = {}
+    for _ in range(args.rounds):
+        for cents in ("0", "1"):
+            env = dict(os.environ, EXPENSE_MONEY_CENTS=cents)
+            out = subprocess.run(
+                [sys.executable, "-m", __spec__.name, "--child", "--shares", str(args.shares)],
+                env=env, capture_output=True, text=True, check=True,
+            ).stdout
+            r = json.loads(out.strip().splitlines()[-1])
+            prev = best.setdefault(r["mode"], r)
+            prev["insert_rows_per_s"] = max(prev["insert_rows_per_s"], r["insert_rows_per_s"])
+            prev["aggregate_ms"] = min(prev["aggregate_ms"], r["aggregate_ms"])
+            prev["fetch_rows_per_s"] = max(prev["fetch_rows_per_s"], r["fetch_rows_per_s"])
+    results = [best["decimal"], best["cents"]]
+
+    print(f"{args.shares} share rows, {MEMBERS} members")
+    print(f"{'mode':>8} {'insert rows/s':>14} {'aggregate (ms)':>15} {'fetch rows/s':>13} {'sum of nets':>12}")
+    for r in results:
+        print(f"{r['mode']:>8} {r['insert_rows_per_s']:>14,.0f} {r['aggregate_ms']:>15.1f} "
+              f"{r['fetch_rows_per_s']:>13,.0f} {r['balance_total']:>12}")
+    dec, cents = results
+    print(f"cents vs decimal: insert {cents['insert_rows_per_s'] / dec['insert_rows_per_s']:.2f}x, "
+          f"aggregate {dec['aggregate_ms'] / cents['aggregate_ms']:.2f}x, "
+          f"fetch {cents['fetch_rows_per_s'] / dec['fetch_rows_per_s']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
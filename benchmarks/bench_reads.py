@@ -0,0 +1,107 @@
+# app/benchmarks/bench_reads.py
+"""Balance polling and history reads next to expense writes: one pool vs. a separate read pool.
+
+``--readers`` threads poll group balances and the first page of expense
+history while ``--writers`` threads add expenses, on a file-backed SQLite
+database seeded by the generator. In the "shared" mode every thread uses the
+primary pool of ``--pool-size`` connections, so readers and writers queue for
+the same connections. In the "split" mode readers use a replica.ReadPool on
+the same file opened read-only; under WAL they never block the writer.
+Prints p50/p99 and throughput for reads and writes in each mode as JSON.
+
+    python -m app.benchmarks.bench_reads [--readers 16] [--writers 4] [--seconds 5] [--pool-size 4]
+"""
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from .. import config, crud, replica, schemas
+from ..database import apply_sqlite_pragmas, engine_options
+from .common import emit, latency_stats
+from .generator import generate, layout
+
+
+def run(mode: str, args) -> dict:
+    tmp = tempfile.TemporaryDirectory()
+    url = f"sqlite:///{os.path.join(tmp.name, 'reads.db')}"
+    options = {**engine_options(url), "pool_size": args.pool_size, "max_overflow": 0}
+    engine = create_engine(url, **options)
+    apply_sqlite_pragmas(engine)
+    generate(engine, groups=args.groups, members=8, expenses=args.expenses, settlements=10)
+    crud.clear_caches()
+    Primary = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+    pool = replica.ReadPool(replica.read_url(url), args.pool_size) if mode == "split" else None
+    Reader = pool.sessions if pool else Primary
+    groups = layout(args.groups, 8)
+    deadline = time.perf_counter() + args.seconds
+
+    def reader(i: int):
+        samples = []
+        n = 0
+        while time.perf_counter() < deadline:
+            gid = (i + n) % args.groups + 1
+            n += 1
+            start = time.perf_counter()
+            db = Reader()
+            try:
+                crud.get_group_balances(db, gid)
+                crud.list_expenses(db, gid, limit=20)
+            finally:
+                db.close()
+            samples.append(time.perf_counter() - start)
+        return "read", samples
+
+    def writer(i: int):
+        samples = []
+        n = 0
+        while time.perf_counter() < deadline:
+            gid = (i + n) % args.groups + 1
+            n += 1
+            users = groups[gid][:4]
+            expense = schemas.ExpenseCreate(amount=40.0, paid_by=[{"user_id": users[0], "amount": 40.0}],
+                                            split_type="equal", users=users)
+            start = time.perf_counter()
+            db = Primary()
+            try:
+                crud.add_expense(db, gid, expense)
+            finally:
+                db.close()
+            samples.append(time.perf_counter() - start)
+        return "write", samples
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.readers + args.writers) as executor:
+        futures = [executor.submit(reader, i) for i in range(args.readers)]
+        futures += [executor.submit(writer, i) for i in range(args.writers)]
+        results = [f.result() for f in futures]
+    elapsed = time.perf_counter() - start
+    report = {
+        kind: latency_stats([s for k, batch in results if k == kind for s in batch], elapsed)
+        for kind in ("read", "write")
+    }
+    if pool:
+        pool.engine.dispose()
+    engine.dispose()
+    tmp.cleanup()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--readers", type=int, default=16)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--pool-size", type=int, default=4, help="connections per pool (no overflow)")
+    parser.add_argument("--groups", type=int, default=20)
+    parser.add_argument("--expenses", type=int, default=500, help="expenses per group when seeding")
+    parser.add_argument("--out", help="also write the JSON report here")
+    args = parser.parse_args()
+    results = {mode: run(mode, args) for mode in ("shared", "split")}
+    emit("reads", {**vars(args), "synchronous": config.SQLITE_SYNCHRONOUS}, results, args.out)
+
+
+if __name__ == "__main__":
+    main()
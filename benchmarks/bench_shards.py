@@ -0,0 +1,93 @@
+# app/benchmarks/bench_shards.py
+"""Concurrent expense writes across groups, with the ledger on 1, 2, 4... shard files.
+
+For each shard count, ``--threads`` writers add expenses to ``--groups``
+groups through the ShardRouter, one session and one commit per expense, as
+requests do. Each run uses fresh file-backed SQLite databases. Prints a JSON
+report with throughput and p50/p99 per shard count. SQLite allows one writer
+per file, so throughput should grow with the shard count until something
+else (the GIL, the disk) becomes the limit. EXPENSE_SQLITE_SYNCHRONOUS=FULL
+makes every commit an fsync, which widens the gap.
+
+    python -m app.benchmarks.bench_shards [--shards 1,2,4] [--threads 16] [--per-thread 100] [--groups 16]
+"""
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from .. import config, crud, schemas
+from ..database import apply_sqlite_pragmas, engine_options
+from ..migrations import run_migrations
+from ..sharding import ShardRouter
+from .common import emit, latency_stats
+
+
+def run(shards: int, args) -> dict:
+    tmp = tempfile.TemporaryDirectory()
+    url = f"sqlite:///{os.path.join(tmp.name, 'home.db')}"
+    home = create_engine(url, **engine_options(url))
+    apply_sqlite_pragmas(home)
+    run_migrations(home)
+    router = ShardRouter(home, [f"sqlite:///{os.path.join(tmp.name, f'shard{n}.db')}" for n in range(1, shards)])
+    router.migrate()
+    crud.clear_caches()
+
+    db = sessionmaker(bind=home, autoflush=False, autocommit=False)()
+    users = [crud.create_user(db, f"user{i}").id for i in range(8)]
+    db.close()
+    groups = []
+    for i in range(args.groups):
+        gid = router.create_group(f"group{i}").id
+        db = router.session_for(gid)
+        for uid in users:
+            crud.add_member(db, gid, uid)
+        db.close()
+        groups.append(gid)
+
+    def writer(i: int):
+        samples = []
+        for n in range(args.per_thread):
+            gid = groups[(i + n) % len(groups)]
+            sharers = users[(i + n) % 4:][:4]
+            expense = schemas.ExpenseCreate(amount=40.0, paid_by=[{"user_id": sharers[0], "amount": 40.0}],
+                                            split_type="equal", users=sharers)
+            start = time.perf_counter()
+            db = router.session_for(gid)
+            try:
+                crud.add_expense(db, gid, expense)
+            finally:
+                db.close()
+            samples.append(time.perf_counter() - start)
+        return samples
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.threads) as pool:
+        samples = [s for batch in pool.map(writer, range(args.threads)) for s in batch]
+    elapsed = time.perf_counter() - start
+    result = {**latency_stats(samples, elapsed), "groups_per_shard": [s["groups"] for s in router.status()]}
+    for engine in router.engines:
+        engine.dispose()
+    tmp.cleanup()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shards", default="1,2,4", help="comma-separated shard counts to compare")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--per-thread", type=int, default=100)
+    parser.add_argument("--groups", type=int, default=16)
+    parser.add_argument("--out", help="also write the JSON report here")
+    args = parser.parse_args()
+    counts = [int(n) for n in args.shards.split(",")]
+    results = {str(n): run(n, args) for n in counts}
+    base = results[str(counts[0])]["ops_per_s"]
+    results["speedup"] = {str(n): round(results[str(n)]["ops_per_s"] / base, 2) for n in counts}
+    emit("shards", {**vars(args), "synchronous": config.SQLITE_SYNCHRONOUS}, results, args.out)
+
+
+if __name__ == "__main__":
+    main()
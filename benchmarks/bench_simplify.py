@@ -0,0 +1,59 @@
+# app/benchmarks/bench_simplify.py
+"""Transfer count and runtime of the debt simplification strategies.
+
+Balances are generated as a union of small zero-sum cliques (the friends who
+shared a taxi, the ones who split a room), which is where greedy matching
+leaves transfers on the table.
+
+    python -m app.benchmarks.bench_simplify
+"""
+import random
+import time
+from decimal import Decimal
+from .. import config
+from ..simplify import STRATEGIES
+
+GROUP_SIZES = [6, 10, 14, 18, 50, 200, 1000]
+
+
+def clique_balances(members: int, rng: random.Random):
+    balances, uid = {}, 1
+    while uid <= members:
+        size = min(rng.randint(2, 4), members - uid + 1)
+        if size == 1:
+            # Fold a lone leftover member into the previous clique.
+            balances[uid] = Decimal("0.00")
+            break
+        values = [rng.randint(-20000, 20000) for _ in range(size - 1)]
+        values.append(-sum(values))
+        for v in values:
+            balances[uid] = Decimal(v) / 100
+            uid += 1
+    return balances
+
+
+def run(strategy, balances):
+    start = time.perf_counter()
+    try:
+        transfers = STRATEGIES[strategy](balances)
+    except ValueError:
+        return None, None
+    return len(transfers), time.perf_counter() - start
+
+
+def main():
+    rng = random.Random(3)
+    print(f"exact limit: {config.SIMPLIFY_EXACT_MAX_MEMBERS} open balances\n")
+    print(f"{'members':>8} {'open':>5} | {'greedy':>7} {'ms':>8} | {'exact':>7} {'ms':>8} | {'auto':>7} {'ms':>8}")
+    for size in GROUP_SIZES:
+        balances = clique_balances(size, rng)
+        open_count = sum(1 for v in balances.values() if v)
+        row = [f"{size:>8} {open_count:>5}"]
+        for strategy in ("greedy", "exact", "auto"):
+            count, elapsed = run(strategy, balances)
+            row.append(f"{'n/a':>7} {'-':>8}" if count is None else f"{count:>7} {elapsed * 1000:>8.2f}")
+        print(" | ".join(row))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# app/benchmarks/bench_splits.py
+"""Split computation and expense insert cost for very large splits.
+
+Compares the integer-cent split engine in ``splits.py`` against the previous
+per-user Decimal loops, then times a whole ``crud.add_expense`` call against
+the previous one-ORM-object-per-share insert.
+
+    python -m app.benchmarks.bench_splits [--participants 10000]
+"""
+import argparse
+from decimal import Decimal, ROUND_HALF_UP
+from .. import crud, models, schemas, splits
+from .common import memory_session, best_of
+
+
+def legacy_equal(amt: Decimal, users):
+    """The original equal split: quantize, then hand out pennies one at a time."""
+    n = len(users)
+    base = (amt / n).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+    shares = {uid: base for uid in users}
+    pennies = int((amt * 100) - int(base * 100) * n)
+    for i in range(pennies):
+        shares[users[i % n]] += Decimal("0.01")
+    return shares
+
+
+def legacy_percentage(amt: Decimal, percentages):
+    return {
+        uid: (amt * Decimal(pct) / Decimal(100)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+        for uid, pct in percentages.items()
+    }
+
+
+def engine_equal(amt: Decimal, users):
+    return splits.to_decimals(splits.equal(splits.to_cents(amt), users))
+
+
+def engine_percentage(amt: Decimal, percentages):
+    return splits.to_decimals(splits.percentage(splits.to_cents(amt), list(percentages.items())))
+
+
+def legacy_insert(db, group_id, expense_in: schemas.ExpenseCreate):
+    """The previous write path: one ExpensePayer/ExpenseShare ORM object per row."""
+    expense = models.Expense(group_id=group_id, amount=Decimal(expense_in.amount), currency="USD")
+    db.add(expense)
+    db.flush()
+    for p in expense_in.paid_by:
+        db.add(models.ExpensePayer(expense_id=expense.id, user_id=p.user_id, amount=Decimal(p.amount)))
+    for uid, a in legacy_equal(Decimal(expense_in.amount), expense_in.users).items():
+        db.add(models.ExpenseShare(expense_id=expense.id, user_id=uid, amount=a))
+    db.commit()
+
+
+def seed(db, participants: int):
+    group = models.Group(name="company-offsite")
+    db.add(group)
+    db.flush()
+    users = [models.User(name=f"u{i}") for i in range(participants)]
+    db.add_all(users)
+    db.flush()
+    db.add_all(models.GroupMember(group_id=group.id, user_id=u.id) for u in users)
+    db.commit()
+    return group.id, [u.id for u in users]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--participants", type=int, default=10_000)
+    args = parser.parse_args()
+    n = args.participants
+
+    users = list(range(1, n + 1))
+    amt = Decimal("123456.78")
+    # Uneven percentages that still add up to exactly 100.
+    pct = {uid: Decimal("0.01") * (1 + (uid % 3)) for uid in users}
+    pct[users[-1]] += Decimal(100) - sum(pct.values())
+    weights = [(uid, Decimal(1 + uid % 7)) for uid in users]
+    total = splits.to_cents(amt)
+
+    print(f"share computation, {n} participants (ms)")
+    print(f"{'split':>12} {'legacy':>10} {'engine':>10} {'speedup':>8}")
+    rows = [
+        ("equal", lambda: legacy_equal(amt, users), lambda: engine_equal(amt, users)),
+        ("percentage", lambda: legacy_percentage(amt, pct), lambda: engine_percentage(amt, pct)),
+    ]
+    for name, old_fn, new_fn in rows:
+        old, new = best_of(old_fn, repeat=3), best_of(new_fn, repeat=3)
+        drift = sum(old_fn().values()) - amt
+        print(f"{name:>12} {old * 1000:>10.1f} {new * 1000:>10.1f} {old / new:>7.1f}x"
+              f"   (legacy total off by {drift}, engine by {sum(new_fn().values()) - amt})")
+    weighted = best_of(lambda: splits.weighted(total, weights), repeat=3)
+    print(f"{'weighted':>12} {'-':>10} {weighted * 1000:>10.1f}")
+
+    db = memory_session()
+    gid, user_ids = seed(db, n)
+    expense_in = schemas.ExpenseCreate(
+        amount=amt, paid_by=[{"user_id": user_ids[0], "amount": amt}],
+        split_type="equal", users=user_ids,
+    )
+    old = best_of(lambda: legacy_insert(db, gid, expense_in), repeat=3)
+    new = best_of(lambda: crud.add_expense(db, gid, expense_in), repeat=3)
+    print(f"\nadd_expense, {n}-way equal split (ms)")
+    print(f"  per-row ORM: {old * 1000:.1f}   bulk insert: {new * 1000:.1f}   speedup: {old / new:.1f}x")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# app/benchmarks/common.py
+import json
+import platform
+import sys
+import time
+from contextlib import contextmanager
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from .. import crud
+from ..database import Base
+
+
+def memory_session():
+    """Fresh in-memory SQLite session with the full schema created.
+
+    Also clears crud's in-process caches, which would otherwise remember IDs
+    from a previous database.
+    """
+    crud.clear_caches()
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine, autoflush=False, autocommit=False)()
+
+
+@contextmanager
+def timer(results: dict, key: str):
+    start = time.perf_counter()
+    yield
+    results[key] = time.perf_counter() - start
+
+
+def best_of(fn, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def latency_stats(samples, elapsed: float = None) -> dict:
+    """p50/p90/p99/max in milliseconds for a list of per-call seconds, plus throughput."""
+    ordered = sorted(samples)
+    if not ordered:
+        return {"count": 0}
+
+    def pct(p):
+        return round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] * 1000, 3)
+
+    stats = {
+        "count": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3),
+        "p50_ms": pct(50), "p90_ms": pct(90), "p99_ms": pct(99),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+    if elapsed:
+        stats["ops_per_s"] = round(len(ordered) / elapsed, 1)
+    return stats
+
+
+def emit(name: str, params: dict, results: dict, path: str = None) -> dict:
+    """Print a benchmark report as JSON, and write it to ``path`` when given."""
+    report = {
+        "benchmark": name,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "params": params,
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if path:
+        with open(path, "w") as f:
+            f.write(text + "\n")
+    return report
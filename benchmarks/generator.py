@@ -0,0 +1,143 @@
+# app/benchmarks/generator.py
+"""Seeded synthetic data for benchmarks and load tests.
+
+Fills an empty database with groups, users, expenses and settlements using
+bulk inserts, so millions of rows take seconds rather than hours. IDs are
+assigned deterministically (see ``layout``), which lets a load driver talk to
+a server seeded by a separate process. The balance ledger and debt graph are
+written alongside the history, so the first read of a group does not pay for
+a backfill.
+
+    python -m app.benchmarks.generator --db /tmp/load.db --groups 1000 --expenses 1000
+"""
+import argparse
+import datetime
+import random
+import time
+from collections import defaultdict
+from decimal import Decimal
+from sqlalchemy import create_engine, insert
+from .. import crud, models
+from ..migrations import run_migrations
+
+START = datetime.datetime(2024, 1, 1)
+
+
+def layout(groups: int, members: int) -> dict:
+    """Group ID -> member user IDs for a database seeded with these sizes."""
+    return {g + 1: list(range(g * members + 1, (g + 1) * members + 1)) for g in range(groups)}
+
+
+class _Buffer:
+    """Row buffers per table, flushed with one executemany each when full."""
+
+    def __init__(self, engine, batch: int):
+        self.engine = engine
+        self.batch = batch
+        self.rows = defaultdict(list)
+        self.count = 0
+
+    def add(self, table, row: dict):
+        self.rows[table].append(row)
+        self.count += 1
+        if self.count >= self.batch:
+            self.flush()
+
+    def flush(self):
+        # Parents first, so the foreign keys resolve even with enforcement on.
+        with self.engine.begin() as conn:
+            for table in (models.User, models.Group, models.GroupMember, models.Expense, models.ExpensePayer,
+                          models.ExpenseShare, models.Settlement, models.GroupBalance, models.GroupDebt):
+                rows = self.rows.pop(table.__table__, None)
+                if rows:
+                    conn.execute(insert(table.__table__), rows)
+        self.count = 0
+
+
+def generate(engine, groups: int = 100, members: int = 8, expenses: int = 100, settlements: int = 10,
+             shares: int = 4, seed: int = 42, batch: int = 50_000) -> dict:
+    """Seed ``engine`` and return row counts.
+
+    Every group gets ``members`` users, ``expenses`` expenses split equally
+    between ``shares`` random members (one payer, sometimes two) and
+    ``settlements`` random transfers. All amounts are USD.
+    """
+    run_migrations(engine)
+    rng = random.Random(seed)
+    shares = min(shares, members)
+    out = _Buffer(engine, batch)
+    expense_id = settlement_id = 0
+    for gid, users in layout(groups, members).items():
+        out.add(models.Group.__table__, {"id": gid, "name": f"group {gid}", "base_currency": "USD",
+                                         "version": members + expenses + settlements})
+        for uid in users:
+            out.add(models.User.__table__, {"id": uid, "name": f"user {uid}"})
+            out.add(models.GroupMember.__table__, {"group_id": gid, "user_id": uid})
+
+        nets = defaultdict(lambda: Decimal("0"))
+        debts = defaultdict(lambda: Decimal("0"))
+        for i in range(expenses):
+            expense_id += 1
+            sharers = rng.sample(users, shares)
+            payers = rng.sample(users, 2 if rng.random() < 0.2 else 1)
+            each = Decimal(rng.randint(100, 20_000)).scaleb(-2)
+            total = each * shares
+            paid = [(payers[0], total)] if len(payers) == 1 else [
+                (payers[0], total - total // 2), (payers[1], total // 2)
+            ]
+            out.add(models.Expense.__table__, {
+                "id": expense_id, "group_id": gid, "description": f"expense {expense_id}", "amount": total,
+                "currency": "USD", "created_at": START + datetime.timedelta(minutes=expense_id),
+            })
+            for uid, amount in paid:
+                out.add(models.ExpensePayer.__table__, {"expense_id": expense_id, "user_id": uid, "amount": amount})
+                nets[uid] += amount
+            for uid in sharers:
+                out.add(models.ExpenseShare.__table__, {"expense_id": expense_id, "user_id": uid, "amount": each})
+                nets[uid] -= each
+            crud._add_expense_debts(debts, paid, ((uid, each) for uid in sharers), "USD")
+
+        for i in range(settlements):
+            settlement_id += 1
+            payer_id, payee_id = rng.sample(users, 2)
+            amount = Decimal(rng.randint(100, 5_000)).scaleb(-2)
+            out.add(models.Settlement.__table__, {
+                "id": settlement_id, "group_id": gid, "payer_id": payer_id, "payee_id": payee_id,
+                "amount": amount, "currency": "USD", "created_at": START + datetime.timedelta(minutes=settlement_id),
+            })
+            nets[payer_id] += amount
+            nets[payee_id] -= amount
+            crud._add_debt(debts, payer_id, payee_id, "USD", -amount)
+
+        for uid in users:
+            out.add(models.GroupBalance.__table__, {"group_id": gid, "user_id": uid, "currency": "USD",
+                                                    "net": nets[uid]})
+        for (a, b, currency), amount in debts.items():
+            if amount:
+                out.add(models.GroupDebt.__table__, {"group_id": gid, "user_a": a, "user_b": b,
+                                                     "currency": currency, "amount": amount})
+    out.flush()
+    return {
+        "groups": groups, "users": groups * members, "expenses": expense_id,
+        "shares": expense_id * shares, "settlements": settlement_id,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", required=True, help="SQLite file to create (must not already hold data)")
+    parser.add_argument("--groups", type=int, default=100)
+    parser.add_argument("--members", type=int, default=8)
+    parser.add_argument("--expenses", type=int, default=100, help="expenses per group")
+    parser.add_argument("--settlements", type=int, default=10, help="settlements per group")
+    parser.add_argument("--shares", type=int, default=4, help="participants per expense")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    engine = create_engine(f"sqlite:///{args.db}")
+    start = time.perf_counter()
+    counts = generate(engine, args.groups, args.members, args.expenses, args.settlements, args.shares, args.seed)
+    print(counts, f"in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+# app/benchmarks/load.py
+"""Concurrent HTTP load driver for the API, reporting p50/p99 and throughput as JSON.
+
+By default the app runs in process behind httpx's ASGI transport, on a
+fresh database seeded with ``generator.generate``. With ``--url`` requests
+go to a running server instead, e.g. uvicorn on localhost; seed its database
+first with the generator using the same --groups/--members:
+
+    python -m app.benchmarks.generator --db /tmp/load.db --groups 100
+    EXPENSE_DATABASE_URL=sqlite:////tmp/load.db uvicorn app.main:app
+    python -m app.benchmarks.load --url http://127.0.0.1:8000 --groups 100
+
+Each of ``--concurrency`` workers picks a random group and issues a request
+from the mix: balance reads (half of them conditional on the last ETag),
+expense writes, settlements and simplify previews.
+
+    python -m app.benchmarks.load [--requests 5000] [--concurrency 32] [--out load.json]
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from collections import defaultdict
+
+# App modules (including .common, which imports crud) are imported inside the
+# functions below: config reads EXPENSE_DATABASE_URL at import time.
+
+MIX = {"balances": 0.6, "add_expense": 0.25, "settle": 0.1, "simplify_plan": 0.05}
+
+
+async def drive(client, groups: dict, requests: int, concurrency: int, seed: int) -> dict:
+    samples = defaultdict(list)
+    statuses = defaultdict(lambda: defaultdict(int))
+    etags = {}
+    names, weights = list(MIX), list(MIX.values())
+    remaining = [requests]
+
+    async def one(rng: random.Random):
+        gid = rng.choice(list(groups))
+        users = groups[gid]
+        kind = rng.choices(names, weights)[0]
+        url = f"/groups/{gid}"
+        start = time.perf_counter()
+        if kind == "balances":
+            headers = {"If-None-Match": etags[gid]} if gid in etags and rng.random() < 0.5 else {}
+            r = await client.get(f"{url}/expenses/balances", headers=headers)
+            if "etag" in r.headers:
+                etags[gid] = r.headers["etag"]
+        elif kind == "add_expense":
+            sharers = rng.sample(users, min(4, len(users)))
+            r = await client.post(f"{url}/expenses", json={
+                "amount": 40.0, "paid_by": [{"user_id": sharers[0], "amount": 40.0}],
+                "split_type": "equal", "users": sharers,
+            })
+        elif kind == "settle":
+            # Random pairs, so some are rejected as over-settlement; those count as 400s.
+            payer, payee = rng.sample(users, 2)
+            r = await client.post(f"{url}/settle", json={"payer_id": payer, "payee_id": payee, "amount": 1.0})
+        else:
+            r = await client.get(f"{url}/simplify/plan")
+        samples[kind].append(time.perf_counter() - start)
+        statuses[kind][r.status_code] += 1
+
+    async def worker(i: int):
+        rng = random.Random(seed * 1000 + i)
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            await one(rng)
+
+    from .common import latency_stats
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    everything = [s for kind in samples.values() for s in kind]
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "overall": latency_stats(everything, elapsed),
+        "endpoints": {
+            kind: {**latency_stats(samples[kind], elapsed), "status": dict(statuses[kind])} for kind in names
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="base URL of a running server; in-process when omitted")
+    parser.add_argument("--groups", type=int, default=100)
+    parser.add_argument("--members", type=int, default=8)
+    parser.add_argument("--expenses", type=int, default=200, help="expenses per group when seeding")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", help="also write the JSON report here")
+    args = parser.parse_args()
+
+    tmp = None
+    if not args.url:
+        # config reads the database URL at import time, so set it before importing the app.
+        tmp = tempfile.TemporaryDirectory()
+        os.environ["EXPENSE_DATABASE_URL"] = f"sqlite:///{os.path.join(tmp.name, 'load.db')}"
+
+    import httpx
+    from ..database import engine
+    from .common import emit
+    from .generator import generate, layout
+
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=60)
+        counts = None
+    else:
+        counts = generate(engine, args.groups, args.members, args.expenses, seed=args.seed)
+        from ..main import app
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60)
+
+    async def go():
+        async with client:
+            return await drive(client, layout(args.groups, args.members), args.requests, args.concurrency, args.seed)
+
+    results = asyncio.run(go())
+    params = {**vars(args), "mode": "http" if args.url else "in-process", "mix": MIX, "rows": counts}
+    emit("load", params, results, args.out)
+    if tmp:
+        engine.dispose()
+        tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
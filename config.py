@@ -0,0 +1,97 @@
+# app/config.py
+"""Runtime settings, read once from the environment at import time."""
+import os
+
+
+def _flag(name: str, default: bool = False) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def _int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+
+DATABASE_URL = os.getenv("EXPENSE_DATABASE_URL", "sqlite:///./expense.db")
+
+# Connection pool (ignored for in-memory SQLite, which uses a single connection).
+DB_POOL_SIZE = _int("EXPENSE_DB_POOL_SIZE", 5)
+DB_MAX_OVERFLOW = _int("EXPENSE_DB_MAX_OVERFLOW", 10)
+DB_POOL_TIMEOUT = _int("EXPENSE_DB_POOL_TIMEOUT", 30)
+DB_POOL_RECYCLE = _int("EXPENSE_DB_POOL_RECYCLE", -1)
+
+# SQLite pragmas applied to every new connection.
+SQLITE_WAL = _flag("EXPENSE_SQLITE_WAL", True)
+SQLITE_SYNCHRONOUS = os.getenv("EXPENSE_SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = _int("EXPENSE_SQLITE_BUSY_TIMEOUT_MS", 5000)
+SQLITE_MMAP_SIZE = _int("EXPENSE_SQLITE_MMAP_SIZE", 256 * 1024 * 1024)
+
+# Largest number of members with open balances the exact debt simplifier
+# will take on; its cost doubles with each extra member.
+SIMPLIFY_EXACT_MAX_MEMBERS = _int("EXPENSE_SIMPLIFY_EXACT_MAX", 18)
+
+# Take a balance checkpoint every N writes to a group (0 disables); as-of
+# balance queries replay only the history after the nearest checkpoint.
+CHECKPOINT_EVERY = _int("EXPENSE_CHECKPOINT_EVERY", 500)
+
+# Exchange rates (CSV or JSON, see rates.py) for converting balances into a
+# group's base currency. Rates in the file are quoted against RATES_REFERENCE.
+RATES_FILE = os.getenv("EXPENSE_RATES_FILE")
+RATES_REFERENCE = os.getenv("EXPENSE_RATES_REFERENCE", "USD")
+
+# Rendered group balances, keyed on the group's version (0 disables).
+RESPONSE_CACHE_SIZE = _int("EXPENSE_RESPONSE_CACHE_SIZE", 10_000)
+RESPONSE_CACHE_TTL = _int("EXPENSE_RESPONSE_CACHE_TTL", 300)
+
+# Attempts for a settle/simplify whose balances changed underneath it (see
+# "GROUP WRITE CONTROL" in crud.py) before it gives up with GroupBusy.
+WRITE_RETRIES = _int("EXPENSE_WRITE_RETRIES", 20)
+
+# Write-behind expense ingestion (see ingest.py): POST /groups/{id}/expenses
+# validates, queues, and answers once a background worker has committed the
+# expense together with others for the same group. A batch closes after
+# INGEST_BATCH_MS or INGEST_BATCH_SIZE items; a full queue makes requests wait
+# up to INGEST_ENQUEUE_TIMEOUT_MS and then get a 503.
+INGEST_QUEUE = _flag("EXPENSE_INGEST_QUEUE")
+INGEST_BATCH_MS = _int("EXPENSE_INGEST_BATCH_MS", 5)
+INGEST_BATCH_SIZE = _int("EXPENSE_INGEST_BATCH_SIZE", 200)
+INGEST_QUEUE_SIZE = _int("EXPENSE_INGEST_QUEUE_SIZE", 2000)
+INGEST_ENQUEUE_TIMEOUT_MS = _int("EXPENSE_INGEST_ENQUEUE_TIMEOUT_MS", 100)
+
+# Horizontal sharding of group ledgers (see sharding.py). With SHARDS > 1 new
+# groups are spread over SHARDS databases by group ID: shard 0 is
+# DATABASE_URL, shard n is SHARD_URL_TEMPLATE with {n} filled in. Users and
+# the shard directory stay on shard 0. Directory lookups are cached for
+# SHARD_DIRECTORY_TTL seconds. Sync routers only; not with ASYNC_DB.
+SHARDS = _int("EXPENSE_SHARDS", 1)
+SHARD_URL_TEMPLATE = os.getenv("EXPENSE_SHARD_URL_TEMPLATE", "sqlite:///./expense.shard{n}.db")
+SHARD_DIRECTORY_TTL = _int("EXPENSE_SHARD_DIRECTORY_TTL", 30)
+
+# Read/write routing (see replica.py). With READ_POOL on, balance, debt,
+# history and plan reads use a separate read-only pool: READ_DATABASE_URL,
+# or by default the main SQLite file opened read-only, whose readers never
+# block the writer under WAL. The read pool may answer while it trails this
+# process's writes to the group by at most READ_MAX_STALENESS_MS, and only
+# when it has the version in the client's X-Min-Version token; otherwise
+# the primary answers. Not with SHARDS > 1 or ASYNC_DB.
+READ_POOL = _flag("EXPENSE_READ_POOL")
+READ_DATABASE_URL = os.getenv("EXPENSE_READ_DATABASE_URL")
+READ_POOL_SIZE = _int("EXPENSE_READ_POOL_SIZE", 10)
+READ_MAX_STALENESS_MS = _int("EXPENSE_READ_MAX_STALENESS_MS", 0)
+
+# Add X-Query-Count and Server-Timing headers (SQL statements, DB time and
+# hot-path spans for the request) to every response.
+QUERY_HEADERS = _flag("EXPENSE_QUERY_HEADERS")
+
+# Store money columns as 64-bit integer cents instead of NUMERIC(12, 2).
+# Existing data is converted at startup when this changes (see migrations.py).
+MONEY_AS_CENTS = _flag("EXPENSE_MONEY_CENTS")
+
+# Serve the hot group endpoints from async routers backed by an AsyncEngine.
+# Requires an async driver: aiosqlite for SQLite, asyncpg for PostgreSQL.
+ASYNC_DB = _flag("EXPENSE_ASYNC_DB")
+# Explicit async URL; derived from the sync URL when unset.
+ASYNC_DATABASE_URL = os.getenv("EXPENSE_ASYNC_DATABASE_URL")
@@ -1,42 +1,215 @@
-from sqlalchemy.orm import Session
-from . import models, schemas
-from decimal import Decimal, ROUND_HALF_UP
-from typing import Dict
-from sqlalchemy import func
-import heapq
+from sqlalchemy.orm import Session, selectinload
+from . import config, metrics, models, replica, schemas, splits
+from .cache import CacheBackend, TTLCache
+from .rates import normalize_currency, rate_table
+from .simplify import plan_transfers
+from decimal import Decimal
+from typing import Dict, List, Set, Tuple
+from collections import defaultdict
+from sqlalchemy import and_, func, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+import base64
+import datetime
+import functools
+import hashlib
+import json
+import random
+import time
+
+# ------------------ VALIDATION CACHE --------------------
+# Users and groups are never deleted, so existing IDs are safe to
+# cache. Only positive lookups are cached; writes below keep entries current.
+# known_groups maps a group ID to its base currency, which never changes.
+known_users = TTLCache(maxsize=100_000, ttl=600)
+known_groups = TTLCache(maxsize=10_000, ttl=600)
+# Member lists tagged with the group version they were read at: adding a
+# member bumps the version, in this process or any other.
+group_members_cache = TTLCache(maxsize=10_000, ttl=600)
+# Simplification previews keyed on (group_id, strategy, currencies), tagged
+# with the group version, rates generation and date they were computed at.
+plan_cache = TTLCache(maxsize=10_000, ttl=3600)
+# Cross-group summaries: user_id -> {currency: summary}. Every write drops
+# the entries of the users it touches.
+user_summary_cache = TTLCache(maxsize=100_000, ttl=600)
+# Group balance responses, see RESPONSE CACHE below. Swappable with use_response_cache.
+response_cache: CacheBackend = TTLCache(maxsize=config.RESPONSE_CACHE_SIZE, ttl=config.RESPONSE_CACHE_TTL)
+
+def cache_stats():
+    return {
+        "users": known_users.stats(),
+        "groups": known_groups.stats(),
+        "group_members": group_members_cache.stats(),
+        "simplify_plans": plan_cache.stats(),
+        "user_summaries": user_summary_cache.stats(),
+        "balance_responses": response_cache.stats(),
+    }
+
+def clear_caches():
+    for c in (known_users, known_groups, group_members_cache, plan_cache, user_summary_cache, response_cache):
+        c.clear()
+
+def _invalidate_user_summaries(user_ids):
+    for uid in set(user_ids):
+        user_summary_cache.invalidate(uid)
 
 def create_user(db: Session, name: str, email: str = None):
     u = models.User(name=name, email=email)
     db.add(u)
     db.commit()
     db.refresh(u)
+    known_users.set(u.id, True)
     return u
 
-def create_group(db: Session, name: str):
-    g = models.Group(name=name)
+def reload_rates():
+    """Reload the exchange-rate file and drop plans computed with the old rates."""
+    rate_table.clear()
+    if config.RATES_FILE:
+        rate_table.load_file(config.RATES_FILE)
+    plan_cache.clear()
+    user_summary_cache.clear()
+    return rate_table.currencies()
+
+def create_group(db: Session, name: str, base_currency: str = "USD", group_id: int = None):
+    # group_id is set by the shard router, which allocates IDs across shards.
+    g = models.Group(id=group_id, name=name, base_currency=normalize_currency(base_currency or "USD"))
     db.add(g)
     db.commit()
     db.refresh(g)
+    known_groups.set(g.id, g.base_currency)
     return g
 
+def _group_currency(db: Session, group_id: int):
+    """The group's base currency, or None if the group does not exist."""
+    currency = known_groups.get(group_id)
+    if currency is None:
+        currency = db.query(models.Group.base_currency).filter(models.Group.id == group_id).scalar()
+        if currency is not None:
+            known_groups.set(group_id, currency)
+    return currency
+
+def _group_exists(db: Session, group_id: int) -> bool:
+    return _group_currency(db, group_id) is not None
+
+def _resolve_currency(currency: str, base: str) -> str:
+    """Normalize ``currency`` (default: ``base``) and check it converts into ``base``."""
+    currency = normalize_currency(currency or base)
+    if currency != base:
+        try:
+            rate_table.rate(currency, base)
+        except ValueError:
+            raise ValueError(f"Currency {currency} cannot be converted to group currency {base}")
+    return currency
+
+def get_group_version(db: Session, group_id: int) -> int:
+    version = db.query(models.Group.version).filter(models.Group.id == group_id).scalar()
+    if version is None:
+        raise ValueError("Group does not exist")
+    return version
+
+# ------------------ GROUP WRITE CONTROL --------------------
+# Every write to a group bumps its version as the transaction's first
+# statement. That UPDATE holds the group's write lock until commit (the row
+# lock on PostgreSQL, the database write lock on SQLite), so the ledger
+# read-modify-writes after it never interleave with another write to the same
+# group, while other groups are untouched. Writes that validate against
+# balances (settle, settlement batches, simplify) also pass the version they
+# read before validating; if another write got in between, the bump matches
+# no row, the attempt is rolled back and retried against fresh balances.
+
+class StaleVersion(Exception):
+    """The group changed between reading its balances and writing."""
+
+class GroupBusy(ValueError):
+    """A write kept losing to concurrent writes on the same group."""
+
+def _bump_version(db: Session, group_id: int, expected: int = None) -> int:
+    """Increment the group's version and return the new value; raise StaleVersion if it is no longer ``expected``."""
+    query = db.query(models.Group).filter(models.Group.id == group_id)
+    if expected is not None:
+        query = query.filter(models.Group.version == expected)
+    if not query.update({models.Group.version: models.Group.version + 1}, synchronize_session=False):
+        if expected is not None:
+            raise StaleVersion(f"Group {group_id} changed since version {expected}")
+        raise ValueError("Group does not exist")
+    return expected + 1 if expected is not None else get_group_version(db, group_id)
+
+def _checkpoint_if_due(db: Session, group_id: int, version: int):
+    if config.CHECKPOINT_EVERY and version % config.CHECKPOINT_EVERY == 0:
+        db.flush()
+        take_checkpoint(db, group_id, commit=False)
+
+def _retry_delay(attempt: int) -> float:
+    """Jittered exponential backoff before retry number ``attempt + 1``."""
+    return random.uniform(0, 0.001 * 2 ** min(attempt, 6))
+
+def _retry_stale(fn):
+    """Re-run a validate-then-write from scratch when it raises StaleVersion, with jittered backoff.
+
+    The single attempt stays reachable as ``.once``, for callers that must
+    wait between attempts without blocking a thread (see async_crud).
+    """
+    @functools.wraps(fn)
+    def wrapper(db: Session, group_id: int, *args, **kwargs):
+        for attempt in range(config.WRITE_RETRIES):
+            try:
+                return fn(db, group_id, *args, **kwargs)
+            except StaleVersion:
+                db.rollback()
+                time.sleep(_retry_delay(attempt))
+        raise GroupBusy("Group is being updated concurrently, retry later")
+    wrapper.once = fn
+    return wrapper
+
 def add_member(db: Session, group_id: int, user_id: int):
+    if not _group_exists(db, group_id):
+        raise ValueError("Group does not exist")
+    existing = db.query(models.GroupMember).filter(
+        models.GroupMember.group_id == group_id, models.GroupMember.user_id == user_id
+    ).first()
+    if existing:
+        return existing
     gm = models.GroupMember(group_id=group_id, user_id=user_id)
     db.add(gm)
+    version = _bump_version(db, group_id)
+    _checkpoint_if_due(db, group_id, version)
     db.commit()
+    _publish_version(group_id, version)
     db.refresh(gm)
+    _invalidate_user_summaries([user_id])
     return gm
 
 def get_group_members(db: Session, group_id: int):
-    rows = db.query(models.GroupMember).filter(models.GroupMember.group_id == group_id).all()
-    return [r.user_id for r in rows]
+    # A read-pool session that checked its copy of the group says which version it holds.
+    version = db.info.get("group_version") or get_group_version(db, group_id)
+    cached = group_members_cache.get(group_id)
+    if cached is not None and cached[0] == version:
+        return list(cached[1])
+    rows = db.query(models.GroupMember.user_id).filter(models.GroupMember.group_id == group_id).all()
+    members = tuple(r[0] for r in rows)
+    group_members_cache.set(group_id, (version, members))
+    return list(members)
 
-def add_expense(db: Session, group_id: int, expense_in: schemas.ExpenseCreate):
-    # ------------------ NEW VALIDATION ---------------------
-    # Check group exists
-    group = db.query(models.Group).filter(models.Group.id == group_id).first()
-    if not group:
-        raise ValueError("Group does not exist")
+def _referenced_users(expense_in: schemas.ExpenseCreate) -> List[int]:
+    ids = [p.user_id for p in expense_in.paid_by]
+    ids += [sp.user_id for sp in expense_in.splits or []]
+    ids += list(expense_in.users or [])
+    ids += [int(uid) for uid in expense_in.percentages or {}]
+    ids += [int(uid) for uid in expense_in.weights or {}]
+    return ids
 
+def _existing_users(db: Session, user_ids) -> Set[int]:
+    """Which of ``user_ids`` exist: cached IDs first, then one IN query for the rest."""
+    user_ids = set(user_ids)
+    found = {uid for uid in user_ids if known_users.get(uid)}
+    missing = user_ids - found
+    if missing:
+        for (uid,) in db.query(models.User.id).filter(models.User.id.in_(missing)).all():
+            known_users.set(uid, True)
+            found.add(uid)
+    return found
+
+def _compute_shares(expense_in: schemas.ExpenseCreate, known_users: Set[int]) -> Dict[int, Decimal]:
+    """Validate an expense against the set of existing users and return its shares."""
     # Expense amount must be positive
     if Decimal(expense_in.amount) <= 0:
         raise ValueError("Expense amount must be positive")
@@ -45,8 +218,7 @@ def add_expense(db: Session, group_id: int, expense_in: schemas.ExpenseCreate):
     for p in expense_in.paid_by:
         if Decimal(p.amount) < 0:
             raise ValueError("Negative payment not allowed")
-        user = db.query(models.User).filter(models.User.id == p.user_id).first()
-        if not user:
+        if p.user_id not in known_users:
             raise ValueError(f"User {p.user_id} does not exist")
 
     # Validate splits
@@ -54,168 +226,986 @@ def add_expense(db: Session, group_id: int, expense_in: schemas.ExpenseCreate):
         for s in expense_in.splits:
             if Decimal(s.amount) < 0:
                 raise ValueError("Negative split not allowed")
-            user = db.query(models.User).filter(models.User.id == s.user_id).first()
-            if not user:
+            if s.user_id not in known_users:
                 raise ValueError(f"User {s.user_id} does not exist")
 
     # Validate users for equal split
     if expense_in.users:
         for uid in expense_in.users:
-            user = db.query(models.User).filter(models.User.id == uid).first()
-            if not user:
+            if uid not in known_users:
                 raise ValueError(f"User {uid} does not exist")
-                
+
     # Percentages check
     if expense_in.percentages:
         for uid, pct in expense_in.percentages.items():
             if Decimal(pct) < 0:
                 raise ValueError("Negative percentage not allowed")
-            user = db.query(models.User).filter(models.User.id == int(uid)).first()
-            if not user:
+            if int(uid) not in known_users:
+                raise ValueError(f"User {uid} does not exist")
+
+    # Weights check
+    if expense_in.weights:
+        for uid, w in expense_in.weights.items():
+            if Decimal(w) < 0:
+                raise ValueError("Negative weight not allowed")
+            if int(uid) not in known_users:
                 raise ValueError(f"User {uid} does not exist")
 
     # ------------------ CORE SPLIT LOGIC --------------------
+    # Shares are computed in integer cents by the split engine (splits.py).
     total_paid = sum([p.amount for p in expense_in.paid_by])
     if Decimal(total_paid) != Decimal(expense_in.amount):
         raise ValueError("Sum of paid_by amounts must equal total amount")
 
-    shares: Dict[int, Decimal] = {}
-    amt = Decimal(expense_in.amount)
+    total = splits.to_cents(expense_in.amount)
 
     if expense_in.split_type == "equal":
-        users = expense_in.users
-        if not users:
+        if not expense_in.users:
             raise ValueError("Provide users for equal split")
-        n = len(users)
-        base = (amt / n).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
-        shares = {uid: base for uid in users}
-        pennies = int((amt * 100) - int(base * 100) * n)
-        for i in range(pennies):
-            uid = users[i % n]
-            shares[uid] += Decimal("0.01")
+        cents = splits.equal(total, expense_in.users)
 
     elif expense_in.split_type == "exact":
         if not expense_in.splits:
             raise ValueError("Exact split requires splits list")
-        ssum = sum([s.amount for s in expense_in.splits])
-        if Decimal(ssum) != amt:
-            raise ValueError("Sum of exact splits must equal total amount")
-        for s in expense_in.splits:
-            shares[s.user_id] = Decimal(s.amount)
+        cents = splits.exact(total, [(s.user_id, splits.to_cents(s.amount)) for s in expense_in.splits])
 
     elif expense_in.split_type == "percentage":
         if not expense_in.percentages:
             raise ValueError("percentages required")
-        total_pct = sum([Decimal(v) for v in expense_in.percentages.values()])
-        if total_pct != Decimal("100"):
-            raise ValueError("Percentages must sum to 100")
-        for uid, pct in expense_in.percentages.items():
-            shares[int(uid)] = (amt * Decimal(pct) / Decimal(100)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+        cents = splits.percentage(total, [(int(uid), pct) for uid, pct in expense_in.percentages.items()])
+
+    elif expense_in.split_type == "weighted":
+        if not expense_in.weights:
+            raise ValueError("weights required")
+        cents = splits.weighted(total, [(int(uid), w) for uid, w in expense_in.weights.items()])
     else:
         raise ValueError("Unknown split_type")
+    return splits.to_decimals(cents)
 
-    expense = models.Expense(
-        group_id=group_id,
-        description=expense_in.description,
-        amount=amt,
-        currency=expense_in.currency
-    )
-    db.add(expense)
+def validate_expense(db: Session, group_id: int, expense_in: schemas.ExpenseCreate) -> Tuple[str, Dict[int, Decimal]]:
+    """Validate an expense for a group; returns its currency and shares."""
+    base = _group_currency(db, group_id)
+    if base is None:
+        raise ValueError("Group does not exist")
+    currency = _resolve_currency(expense_in.currency, base)
+    return currency, _compute_shares(expense_in, _existing_users(db, _referenced_users(expense_in)))
+
+@metrics.timed("add_expense")
+def add_expense(db: Session, group_id: int, expense_in: schemas.ExpenseCreate):
+    currency, shares = validate_expense(db, group_id, expense_in)
+    # The same write path as bulk imports, with a batch of one.
+    (expense,), version, touched = write_expenses(db, group_id, [(expense_in, currency, shares)])
     db.commit()
+    after_expense_commit(group_id, version, touched)
     db.refresh(expense)
+    return expense
 
-    for p in expense_in.paid_by:
-        db.add(models.ExpensePayer(expense_id=expense.id, user_id=p.user_id, amount=Decimal(p.amount)))
+class BulkValidationError(ValueError):
+    """Raised by an all-or-nothing bulk import when any item is invalid."""
+    def __init__(self, errors):
+        super().__init__(f"{len(errors)} expense(s) failed validation")
+        self.errors = errors
+
+def add_expenses_bulk(db: Session, group_id: int, expenses_in: List[schemas.ExpenseCreate], atomic: bool = False):
+    """Validate and insert many expenses in one transaction.
+
+    All referenced users are checked with one IN query, and payers and shares
+    are written with executemany. Returns one result per input, either
+    ``{"index", "id"}`` or ``{"index", "error"}``. With ``atomic`` any invalid
+    item raises BulkValidationError and nothing is written.
+    """
+    base = _group_currency(db, group_id)
+    if base is None:
+        raise ValueError("Group does not exist")
 
-    for uid, a in shares.items():
-        db.add(models.ExpenseShare(expense_id=expense.id, user_id=uid, amount=a))
+    known = _existing_users(db, (uid for e in expenses_in for uid in _referenced_users(e)))
+    results, valid = [], []
+    for i, expense_in in enumerate(expenses_in):
+        try:
+            currency = _resolve_currency(expense_in.currency, base)
+            valid.append((i, expense_in, currency, _compute_shares(expense_in, known)))
+        except ValueError as e:
+            results.append({"index": i, "error": str(e)})
+    if atomic and results:
+        raise BulkValidationError(results)
+    if not valid:
+        return results
 
+    expenses, version, touched = write_expenses(db, group_id, [(e, currency, shares) for _, e, currency, shares in valid])
+    results += [{"index": i, "id": expense.id} for expense, (i, *_) in zip(expenses, valid)]
     db.commit()
-    return expense
+    after_expense_commit(group_id, version, touched)
+    return sorted(results, key=lambda r: r["index"])
+
+def write_expenses(db: Session, group_id: int, prepared):
+    """Insert validated expenses without committing.
+
+    ``prepared`` holds (expense_in, currency, shares) as returned by
+    validate_expense. Payers and shares go in with one executemany each and
+    the ledger, debt graph and version are updated once for the lot. Returns
+    (expenses, new version, touched user IDs); the caller commits and then
+    calls after_expense_commit.
+    """
+    version = _bump_version(db, group_id)
+    _ensure_ledger(db, group_id)
+    expenses = [
+        models.Expense(group_id=group_id, description=e.description,
+                       amount=Decimal(e.amount), currency=currency)
+        for e, currency, _ in prepared
+    ]
+    db.add_all(expenses)
+    db.flush()
+
+    deltas: Dict[Tuple[int, str], Decimal] = defaultdict(lambda: Decimal("0"))
+    debts: Dict[Tuple[int, int, str], Decimal] = defaultdict(lambda: Decimal("0"))
+    payer_rows, share_rows = [], []
+    for expense, (expense_in, currency, shares) in zip(expenses, prepared):
+        _add_expense_debts(debts, [(p.user_id, p.amount) for p in expense_in.paid_by], shares.items(), currency)
+        for p in expense_in.paid_by:
+            payer_rows.append({"expense_id": expense.id, "user_id": p.user_id, "amount": Decimal(p.amount)})
+            deltas[(p.user_id, currency)] += Decimal(p.amount)
+        for uid, a in shares.items():
+            share_rows.append({"expense_id": expense.id, "user_id": uid, "amount": a})
+            deltas[(uid, currency)] -= a
+    db.execute(insert(models.ExpensePayer.__table__), payer_rows)
+    db.execute(insert(models.ExpenseShare.__table__), share_rows)
+    _apply_balance_deltas(db, group_id, deltas)
+    _apply_debt_deltas(db, group_id, debts)
+    _checkpoint_if_due(db, group_id, version)
+    return expenses, version, {uid for uid, _ in deltas}
+
+def after_expense_commit(group_id: int, version: int, touched):
+    """Cache upkeep once write_expenses' transaction has committed."""
+    _publish_version(group_id, version)
+    _invalidate_user_summaries(touched)
+
+def _window(query, column, after=None, until=None):
+    if after is not None:
+        query = query.filter(column > after)
+    if until is not None:
+        query = query.filter(column <= until)
+    return query
+
+def _group_nets(db: Session, group_id: int, after=None, until=None) -> Dict[Tuple[int, str], Decimal]:
+    """Net position per (user, currency) of every user touched by the group's history.
+
+    Runs one grouped aggregate per source table, so the number of queries does
+    not depend on the size of the group. ``after``/``until`` restrict it to
+    rows created in (after, until].
+    """
+    nets: Dict[Tuple[int, str], Decimal] = defaultdict(lambda: Decimal("0"))
+
+    paid = _window(db.query(models.ExpensePayer.user_id, models.Expense.currency,
+                            func.sum(models.ExpensePayer.amount)).join(
+        models.Expense, models.Expense.id == models.ExpensePayer.expense_id
+    ).filter(models.Expense.group_id == group_id), models.Expense.created_at, after, until
+    ).group_by(models.ExpensePayer.user_id, models.Expense.currency)
+    for uid, currency, total in paid:
+        nets[(uid, currency)] += Decimal(total or 0)
+
+    share = _window(db.query(models.ExpenseShare.user_id, models.Expense.currency,
+                             func.sum(models.ExpenseShare.amount)).join(
+        models.Expense, models.Expense.id == models.ExpenseShare.expense_id
+    ).filter(models.Expense.group_id == group_id), models.Expense.created_at, after, until
+    ).group_by(models.ExpenseShare.user_id, models.Expense.currency)
+    for uid, currency, total in share:
+        nets[(uid, currency)] -= Decimal(total or 0)
 
+    paid_sett = _window(db.query(models.Settlement.payer_id, models.Settlement.currency,
+                                 func.sum(models.Settlement.amount)).filter(
+        models.Settlement.group_id == group_id
+    ), models.Settlement.created_at, after, until).group_by(models.Settlement.payer_id, models.Settlement.currency)
+    for uid, currency, total in paid_sett:
+        nets[(uid, currency)] += Decimal(total or 0)
+
+    received = _window(db.query(models.Settlement.payee_id, models.Settlement.currency,
+                                func.sum(models.Settlement.amount)).filter(
+        models.Settlement.group_id == group_id
+    ), models.Settlement.created_at, after, until).group_by(models.Settlement.payee_id, models.Settlement.currency)
+    for uid, currency, total in received:
+        nets[(uid, currency)] -= Decimal(total or 0)
+
+    return dict(nets)
+
+def _in_currency(nets: Dict[Tuple[int, str], Decimal], currency: str, on: datetime.date = None) -> Dict[int, Decimal]:
+    """Collapse per-currency nets into one net per user in ``currency``.
+
+    Each (user, currency) total is converted once at the rate in effect on
+    ``on`` (default today), so the cost follows the number of currencies,
+    not the number of expenses.
+    """
+    totals: Dict[int, Decimal] = defaultdict(lambda: Decimal("0"))
+    for (uid, cur), net in nets.items():
+        totals[uid] += rate_table.convert(net, cur, currency, on)
+    return totals
+
+def _member_balances(db: Session, group_id: int, nets, on: datetime.date = None) -> Dict[int, Decimal]:
+    totals = _in_currency(nets, _group_currency(db, group_id), on) if nets else {}
+    return {
+        uid: totals.get(uid, Decimal("0")).quantize(Decimal("0.01"))
+        for uid in get_group_members(db, group_id)
+    }
+
+@metrics.timed("compute_group_balances")
 def compute_group_balances(db: Session, group_id: int):
-    members = db.query(models.GroupMember).filter(models.GroupMember.group_id == group_id).all()
-    user_ids = [m.user_id for m in members]
-    balances = {}
-    for uid in user_ids:
-        paid = db.query(func.coalesce(func.sum(models.ExpensePayer.amount), 0)).join(
-            models.Expense, models.Expense.id == models.ExpensePayer.expense_id
-        ).filter(models.Expense.group_id == group_id, models.ExpensePayer.user_id == uid).scalar() or 0
-
-        share = db.query(func.coalesce(func.sum(models.ExpenseShare.amount), 0)).join(
-            models.Expense, models.Expense.id == models.ExpenseShare.expense_id
-        ).filter(models.Expense.group_id == group_id, models.ExpenseShare.user_id == uid).scalar() or 0
-
-        received = db.query(func.coalesce(func.sum(models.Settlement.amount), 0)).filter(
-            models.Settlement.group_id == group_id, models.Settlement.payee_id == uid
-        ).scalar() or 0
-
-        paid_sett = db.query(func.coalesce(func.sum(models.Settlement.amount), 0)).filter(
-            models.Settlement.group_id == group_id, models.Settlement.payer_id == uid
-        ).scalar() or 0
-
-        net = Decimal(paid) - Decimal(share) + Decimal(paid_sett) - Decimal(received)
-        balances[uid] = net.quantize(Decimal("0.01"))
+    """Recompute member balances in the base currency from the full history."""
+    return _member_balances(db, group_id, _group_nets(db, group_id))
+
+# ------------------ BALANCE LEDGER --------------------
+# group_balances holds each user's running net per group and currency. Every
+# write updates it in the same transaction, so reads cost O(members) instead
+# of O(history). Groups created before the ledger existed are backfilled on
+# first touch.
+
+def _ledger_nets(db: Session, group_id: int) -> Dict[Tuple[int, str], Decimal]:
+    rows = db.query(models.GroupBalance.user_id, models.GroupBalance.currency, models.GroupBalance.net).filter(
+        models.GroupBalance.group_id == group_id
+    ).all()
+    return {(uid, currency): Decimal(net) for uid, currency, net in rows}
+
+def _ensure_ledger(db: Session, group_id: int) -> bool:
+    """Backfill the ledger for a group that has none. Must run before new rows are added."""
+    exists = db.query(models.GroupBalance.id).filter(models.GroupBalance.group_id == group_id).first()
+    if exists:
+        return False
+    primary = db.info.get("primary")
+    if primary is not None:
+        # A read-only session: backfill on the primary; the read pool shows it once it has caught up.
+        with primary() as primary_db:
+            if _ensure_ledger(primary_db, group_id):
+                primary_db.commit()
+        return False
+    rebuild_balances(db, group_id, commit=False)
+    return True
+
+def _apply_balance_deltas(db: Session, group_id: int, deltas: Dict[Tuple[int, str], Decimal]):
+    """Add ``deltas`` to the ledger with one executemany UPDATE and one INSERT."""
+    deltas = {key: d for key, d in deltas.items() if d}
+    if not deltas:
+        return
+    query = db.query(models.GroupBalance.id, models.GroupBalance.user_id, models.GroupBalance.currency,
+                     models.GroupBalance.net).filter(models.GroupBalance.group_id == group_id)
+    user_ids = {uid for uid, _ in deltas}
+    if len(user_ids) <= 500:
+        query = query.filter(models.GroupBalance.user_id.in_(user_ids))
+    updates = []
+    for row_id, uid, currency, net in query:
+        d = deltas.pop((uid, currency), None)
+        if d is not None:
+            updates.append({"id": row_id, "net": (Decimal(net) + d).quantize(Decimal("0.01"))})
+    if updates:
+        db.execute(update(models.GroupBalance), updates)
+    if deltas:
+        db.execute(insert(models.GroupBalance.__table__), [
+            {"group_id": group_id, "user_id": uid, "currency": currency, "net": d.quantize(Decimal("0.01"))}
+            for (uid, currency), d in deltas.items()
+        ])
+
+def get_group_balances(db: Session, group_id: int) -> Dict[int, Decimal]:
+    """Member balances read from the ledger, converted into the group's base currency."""
+    if _ensure_ledger(db, group_id):
+        db.commit()
+    return _member_balances(db, group_id, _ledger_nets(db, group_id))
+
+def get_currency_balances(db: Session, group_id: int) -> Dict[int, Dict[str, Decimal]]:
+    """Member balances read from the ledger, one unconverted net per currency."""
+    if not _group_exists(db, group_id):
+        raise ValueError("Group does not exist")
+    if _ensure_ledger(db, group_id):
+        db.commit()
+    balances = {uid: {} for uid in get_group_members(db, group_id)}
+    for (uid, currency), net in sorted(_ledger_nets(db, group_id).items()):
+        if uid in balances and net:
+            balances[uid][currency] = net.quantize(Decimal("0.01"))
     return balances
 
-def add_settlement(db: Session, group_id: int, payer_id: int, payee_id: int, amount):
-    # Validate group exists
-    group = db.query(models.Group).filter(models.Group.id == group_id).first()
-    if not group:
+def rebuild_balances(db: Session, group_id: int, commit: bool = True) -> Dict[Tuple[int, str], Decimal]:
+    """Discard the group's ledger and debt graph rows and rebuild them from full history.
+
+    With ``commit`` this is a write of its own: it bumps the group's version,
+    so balances cached for the old ledger are no longer served.
+    """
+    version = _bump_version(db, group_id) if commit else None
+    db.query(models.GroupBalance).filter(models.GroupBalance.group_id == group_id).delete(
+        synchronize_session=False
+    )
+    db.query(models.GroupDebt).filter(models.GroupDebt.group_id == group_id).delete(
+        synchronize_session=False
+    )
+    nets = {key: net.quantize(Decimal("0.01")) for key, net in _group_nets(db, group_id).items()}
+    db.add_all(
+        models.GroupBalance(group_id=group_id, user_id=uid, currency=currency, net=net)
+        for (uid, currency), net in nets.items()
+    )
+    _apply_debt_deltas(db, group_id, _history_debts(db, group_id))
+    db.flush()
+    if commit:
+        db.commit()
+        _publish_version(group_id, version)
+        _invalidate_user_summaries(uid for uid, _ in nets)
+    return nets
+
+def check_balances(db: Session, group_id: int):
+    """Compare the ledger against a full recompute.
+
+    Returns a list of {"user_id", "currency", "ledger", "recomputed"} for every
+    entry whose values differ; an empty list means the ledger is consistent.
+    """
+    ledger = _ledger_nets(db, group_id)
+    actual = _group_nets(db, group_id)
+    mismatches = []
+    for uid, currency in sorted(set(ledger) | set(actual)):
+        have = ledger.get((uid, currency), Decimal("0")).quantize(Decimal("0.01"))
+        want = actual.get((uid, currency), Decimal("0")).quantize(Decimal("0.01"))
+        if have != want:
+            mismatches.append({"user_id": uid, "currency": currency, "ledger": have, "recomputed": want})
+    return mismatches
+
+# ------------------ RESPONSE CACHE --------------------
+# Balance responses are cached under (group_id, version, rates generation,
+# date), so any write or rate change moves readers to a new key and stale
+# entries simply age out. The version itself is read from groups.version on
+# every request (a primary-key lookup), never from the cache, so writes made
+# by other workers or processes are seen at once. The backend is any
+# CacheBackend; with a shared one workers also share the rendered balances.
+
+def use_response_cache(backend: CacheBackend) -> CacheBackend:
+    """Swap the response cache backend; returns the previous one."""
+    global response_cache
+    previous, response_cache = response_cache, backend
+    return previous
+
+def _publish_version(group_id: int, version: int):
+    if version is not None:
+        replica.note_write(group_id, version)
+
+def _rates_key() -> tuple:
+    """What converted figures depend on besides the group's version: the loaded rates and the date."""
+    return (rate_table.generation, datetime.date.today().isoformat())
+
+def _balances_key(group_id: int, version: int) -> tuple:
+    return ("balances", group_id, version, *_rates_key())
+
+def balances_etag(group_id: int, version: int) -> str:
+    return '"%s"' % "-".join(str(part) for part in _balances_key(group_id, version)[1:])
+
+def current_balances_etag(db: Session, group_id: int) -> Tuple[int, str]:
+    """(version, ETag) of the group's balances as they are in the database now."""
+    # A read-pool session that checked its copy of the group says which version it holds.
+    version = db.info.get("group_version") or get_group_version(db, group_id)
+    return version, balances_etag(group_id, version)
+
+def cached_group_balances(db: Session, group_id: int, version: int = None) -> Tuple[int, Dict[int, Decimal]]:
+    """(version, balances) at ``version`` (default: the current one), read through the response cache."""
+    if version is None:
+        version = current_balances_etag(db, group_id)[0]
+    key = _balances_key(group_id, version)
+    balances = response_cache.get(key)
+    if balances is None:
+        balances = get_group_balances(db, group_id)
+        response_cache.set(key, balances)
+    return version, balances
+
+# ------------------ DEBT GRAPH --------------------
+# group_debts holds one signed edge per (pair, currency): who owes whom inside
+# a group. Keys are stored as (user_a, user_b) with user_a < user_b; a
+# positive amount means user_a owes user_b. Writes apply their edge deltas in
+# the same transaction as the ledger, and edges that reach zero are deleted,
+# so the table only holds pairs with an open debt. Each user's edges add up
+# to their net in that currency.
+
+def _add_debt(debts, debtor_id: int, creditor_id: int, currency: str, amount: Decimal):
+    if debtor_id == creditor_id:
+        return
+    if debtor_id < creditor_id:
+        debts[(debtor_id, creditor_id, currency)] += amount
+    else:
+        debts[(creditor_id, debtor_id, currency)] -= amount
+
+def _attribute_shares(payers, shares) -> List[Tuple[int, int, Decimal]]:
+    """(sharer, payer, amount) for one expense: each share split across the payers in proportion to what they paid.
+
+    Shares are apportioned in cents one after another, with largest-remainder
+    rounding, over what each payer is still owed. Every share and every
+    payer's amount therefore add up exactly; the last share takes what is
+    left. The debt graph, and so the user summary, is built with this rule.
+    """
+    if len(payers) == 1:
+        payer_id = payers[0][0]
+        return [(uid, payer_id, Decimal(amount)) for uid, amount in shares]
+    payer_ids = [uid for uid, _ in payers]
+    owed = [splits.to_cents(amount) for _, amount in payers]
+    parts = []
+    for uid, amount in shares:
+        cents = splits.to_cents(amount)
+        if not cents:
+            continue
+        split = splits.apportion(cents, list(range(len(payer_ids))), owed)
+        for i, c in split.items():
+            owed[i] -= c
+            if c:
+                parts.append((uid, payer_ids[i], splits.from_cents(c)))
+    return parts
+
+def _add_expense_debts(debts, payers, shares, currency: str):
+    """Record who owes which payer for one expense (see _attribute_shares)."""
+    for uid, payer_id, amount in _attribute_shares(list(payers), list(shares)):
+        _add_debt(debts, uid, payer_id, currency, amount)
+
+def _history_debts(db: Session, group_id: int) -> Dict[Tuple[int, int, str], Decimal]:
+    debts: Dict[Tuple[int, int, str], Decimal] = defaultdict(lambda: Decimal("0"))
+    for record in _ledger_records(db, group_id):
+        if record["type"] == "expense":
+            _add_expense_debts(debts, record["payers"], record["shares"], record["currency"])
+        else:
+            _add_debt(debts, record["payer_id"], record["payee_id"], record["currency"], -Decimal(record["amount"]))
+    return debts
+
+def _apply_debt_deltas(db: Session, group_id: int, debts: Dict[Tuple[int, int, str], Decimal]):
+    """Add ``debts`` to the group's edges; edges that cancel out are deleted."""
+    debts = {key: d for key, d in debts.items() if d}
+    if not debts:
+        return
+    D = models.GroupDebt
+    query = db.query(D.id, D.user_a, D.user_b, D.currency, D.amount).filter(D.group_id == group_id)
+    user_ids = {a for a, _, _ in debts}
+    if len(user_ids) <= 500:
+        query = query.filter(D.user_a.in_(user_ids))
+    updates, cleared = [], []
+    for row_id, a, b, currency, amount in query:
+        d = debts.pop((a, b, currency), None)
+        if d is None:
+            continue
+        amount = (Decimal(amount) + d).quantize(Decimal("0.01"))
+        if amount:
+            updates.append({"id": row_id, "amount": amount})
+        else:
+            cleared.append(row_id)
+    if updates:
+        db.execute(update(D), updates)
+    if cleared:
+        db.query(D).filter(D.id.in_(cleared)).delete(synchronize_session=False)
+    if debts:
+        db.execute(insert(D.__table__), [
+            {"group_id": group_id, "user_a": a, "user_b": b, "currency": currency, "amount": d.quantize(Decimal("0.01"))}
+            for (a, b, currency), d in debts.items()
+        ])
+
+def get_group_debts(db: Session, group_id: int):
+    """Open pairwise debts in a group as {"debtor_id", "creditor_id", "currency", "amount"}."""
+    if not _group_exists(db, group_id):
         raise ValueError("Group does not exist")
-    
-    # Validate user exists
-    payer = db.query(models.User).filter(models.User.id == payer_id).first()
-    payee = db.query(models.User).filter(models.User.id == payee_id).first()
-    if not payer or not payee:
-        raise ValueError("Payer or payee does not exist")
+    if _ensure_ledger(db, group_id):
+        db.commit()
+    D = models.GroupDebt
+    rows = db.query(D.user_a, D.user_b, D.currency, D.amount).filter(D.group_id == group_id).order_by(
+        D.user_a, D.user_b, D.currency
+    )
+    debts = []
+    for a, b, currency, amount in rows:
+        amount = Decimal(amount)
+        debtor, creditor = (a, b) if amount > 0 else (b, a)
+        debts.append({"debtor_id": debtor, "creditor_id": creditor, "currency": currency, "amount": abs(amount)})
+    return debts
+
+# ------------------ CHECKPOINTS --------------------
+# A checkpoint stores every user's net per currency for a group as of
+# ``taken_at``. Balances as of any time T start from the latest checkpoint at
+# or before T and replay only the rows created after it, instead of all of
+# history. History is append-only; a row backdated behind an existing
+# checkpoint would not be seen by it. For the same reason checkpoints cannot
+# be taken in the future, and any that predate that rule are not used while
+# their time is still ahead.
+
+def _utc(moment: datetime.datetime) -> datetime.datetime:
+    """``moment`` as a naive UTC datetime, the way timestamps are stored."""
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return moment
+
+def _nets_as_of(db: Session, group_id: int, as_of: datetime.datetime) -> Dict[Tuple[int, str], Decimal]:
+    latest = min(as_of, datetime.datetime.utcnow())
+    checkpoint = db.query(models.BalanceCheckpoint).filter(
+        models.BalanceCheckpoint.group_id == group_id, models.BalanceCheckpoint.taken_at <= latest
+    ).order_by(models.BalanceCheckpoint.taken_at.desc()).first()
+    nets: Dict[Tuple[int, str], Decimal] = defaultdict(lambda: Decimal("0"))
+    after = None
+    if checkpoint:
+        after = checkpoint.taken_at
+        for entry in checkpoint.entries:
+            nets[(entry.user_id, entry.currency)] = Decimal(entry.net)
+    for key, delta in _group_nets(db, group_id, after=after, until=as_of).items():
+        nets[key] += delta
+    return dict(nets)
+
+def balances_as_of(db: Session, group_id: int, as_of: datetime.datetime) -> Dict[int, Decimal]:
+    """Member balances including only expenses and settlements created at or before ``as_of``.
+
+    Foreign-currency totals are converted at the rates in effect on that date.
+    """
+    if not _group_exists(db, group_id):
+        raise ValueError("Group does not exist")
+    as_of = _utc(as_of)
+    return _member_balances(db, group_id, _nets_as_of(db, group_id, as_of), on=as_of.date())
 
-    balances = compute_group_balances(db, group_id)
+def take_checkpoint(db: Session, group_id: int, at: datetime.datetime = None, commit: bool = True):
+    """Snapshot every user's net per currency for the group as of ``at`` (default: now).
+
+    On its own (``commit``) it first bumps the group's version like any other
+    write. That takes the write lock, so a writer that has flushed rows but not
+    committed them finishes first and its rows are in the snapshot rather than
+    skipped by every later replay. With ``commit=False`` the caller already holds it.
+    """
+    if at is not None and _utc(at) > datetime.datetime.utcnow():
+        raise ValueError("Checkpoint time cannot be in the future")
+    version = _bump_version(db, group_id) if commit else None
+    if not commit and not _group_exists(db, group_id):
+        raise ValueError("Group does not exist")
+    at = _utc(at) if at else datetime.datetime.utcnow()
+    nets = _nets_as_of(db, group_id, at)
+    checkpoint = models.BalanceCheckpoint(group_id=group_id, taken_at=at)
+    checkpoint.entries = [
+        models.BalanceCheckpointEntry(user_id=uid, currency=currency, net=net.quantize(Decimal("0.01")))
+        for (uid, currency), net in nets.items()
+    ]
+    db.add(checkpoint)
+    db.flush()
+    if commit:
+        db.commit()
+        _publish_version(group_id, version)
+    return checkpoint
+
+def _check_transfer(balances: Dict[int, Decimal], payer_id: int, payee_id: int, amount: Decimal):
     payer_net = balances.get(payer_id, Decimal('0'))
     payee_net = balances.get(payee_id, Decimal('0'))
 
+    if amount <= 0:
+        raise ValueError("Settlement amount must be positive")
     if payer_net >= 0:
         raise ValueError("Payer does not owe anything")
     if payee_net <= 0:
         raise ValueError("Payee not owed anything")
-
-    amount = Decimal(amount)
     if amount > min(abs(payer_net), payee_net):
         raise ValueError("Cannot settle more than outstanding")
 
-    s = models.Settlement(group_id=group_id, payer_id=payer_id, payee_id=payee_id, amount=amount)
+def _settlement_view(db: Session, group_id: int, currency: str, base: str) -> Dict[int, Decimal]:
+    """Balances a settlement in ``currency`` is checked against.
+
+    Paying in the base currency pays down a user's overall position; paying
+    in another currency pays down only what is owed in that currency.
+    """
+    if currency == base:
+        return get_group_balances(db, group_id)
+    return {
+        uid: nets.get(currency, Decimal("0"))
+        for uid, nets in get_currency_balances(db, group_id).items()
+    }
+
+@metrics.timed("add_settlement")
+@_retry_stale
+def add_settlement(db: Session, group_id: int, payer_id: int, payee_id: int, amount, currency: str = None):
+    # Validate group exists
+    base = _group_currency(db, group_id)
+    if base is None:
+        raise ValueError("Group does not exist")
+    # Balances are validated as of this version; the write below only lands if it still holds.
+    expected = get_group_version(db, group_id)
+
+    # Validate user exists
+    existing = _existing_users(db, [payer_id, payee_id])
+    if payer_id not in existing or payee_id not in existing:
+        raise ValueError("Payer or payee does not exist")
+
+    currency = _resolve_currency(currency, base)
+    amount = Decimal(amount)
+    _check_transfer(_settlement_view(db, group_id, currency, base), payer_id, payee_id, amount)
+
+    version = _bump_version(db, group_id, expected)
+    s = models.Settlement(group_id=group_id, payer_id=payer_id, payee_id=payee_id, amount=amount, currency=currency)
     db.add(s)
+    _apply_balance_deltas(db, group_id, {(payer_id, currency): amount, (payee_id, currency): -amount})
+    debts: Dict[Tuple[int, int, str], Decimal] = defaultdict(lambda: Decimal("0"))
+    _add_debt(debts, payer_id, payee_id, currency, -amount)
+    _apply_debt_deltas(db, group_id, debts)
+    _checkpoint_if_due(db, group_id, version)
     db.commit()
-    return compute_group_balances(db, group_id)
+    _publish_version(group_id, version)
+    _invalidate_user_summaries([payer_id, payee_id])
+    return get_group_balances(db, group_id)
 
-def simplify_debts(db: Session, group_id: int):
-    balances = compute_group_balances(db, group_id)
+class IdempotencyMismatch(ValueError):
+    """Raised when an idempotency key is reused with a different request."""
 
-    # Build min-heap for debtors and max-heap for creditors (negated for heapq)
-    debtors = []
-    creditors = []
-    for uid, amt in balances.items():
-        if amt < 0:
-            heapq.heappush(debtors, (amt, uid))        # amt negative
-        elif amt > 0:
-            heapq.heappush(creditors, (-amt, uid))     # amt positive, negate for max-heap
+def _batch_hash(transfers: List[schemas.SettlementCreate]) -> str:
+    canonical = [
+        [t.payer_id, t.payee_id, str(Decimal(t.amount).quantize(Decimal("0.01"))), (t.currency or "").strip().upper()]
+        for t in transfers
+    ]
+    return hashlib.sha256(json.dumps(canonical).encode()).hexdigest()
+
+def _stored_batch(db: Session, group_id: int, key: str, request_hash: str):
+    row = db.query(models.IdempotencyKey).filter(
+        models.IdempotencyKey.group_id == group_id, models.IdempotencyKey.key == key
+    ).first()
+    if not row:
+        return None
+    if row.request_hash is not None and row.request_hash != request_hash:
+        raise IdempotencyMismatch("Idempotency-Key was already used with different transfers")
+    stored = json.loads(row.response)
+    return {
+        "settlement_ids": stored["settlement_ids"],
+        "balances": {int(uid): Decimal(net) for uid, net in stored["balances"].items()},
+        "replayed": True,
+    }
+
+@_retry_stale
+def add_settlements_batch(db: Session, group_id: int, transfers: List[schemas.SettlementCreate],
+                          idempotency_key: str = None):
+    """Validate a list of transfers against one balance snapshot and record them together.
+
+    Transfers are checked in order, each against the balances left by the ones
+    before it, with the same rules as add_settlement. Either all are recorded
+    in one transaction or none are. When ``idempotency_key`` is given, the
+    first successful result is stored and returned unchanged for any retry
+    with the same key and transfers; reusing the key with different transfers
+    raises IdempotencyMismatch.
+    """
+    base = _group_currency(db, group_id)
+    if base is None:
+        raise ValueError("Group does not exist")
+    request_hash = _batch_hash(transfers)
+    if idempotency_key:
+        stored = _stored_batch(db, group_id, idempotency_key, request_hash)
+        if stored:
+            return stored
+    if not transfers:
+        raise ValueError("No transfers given")
 
-    while debtors and creditors:
-        debt_amt, debtor_uid = heapq.heappop(debtors)
-        credit_amt, creditor_uid = heapq.heappop(creditors)
-        settle_amt = min(-debt_amt, -credit_amt)
+    existing = _existing_users(db, [uid for t in transfers for uid in (t.payer_id, t.payee_id)])
+    expected = get_group_version(db, group_id)
+    views = {base: dict(get_group_balances(db, group_id))}
+    deltas: Dict[Tuple[int, str], Decimal] = defaultdict(lambda: Decimal("0"))
+    debts: Dict[Tuple[int, int, str], Decimal] = defaultdict(lambda: Decimal("0"))
+    rows = []
+    for i, t in enumerate(transfers):
+        if t.payer_id not in existing or t.payee_id not in existing:
+            raise ValueError(f"Transfer {i}: Payer or payee does not exist")
+        amount = Decimal(t.amount)
+        try:
+            currency = _resolve_currency(t.currency, base)
+            if currency not in views:
+                views[currency] = _settlement_view(db, group_id, currency, base)
+            _check_transfer(views[currency], t.payer_id, t.payee_id, amount)
+        except ValueError as e:
+            raise ValueError(f"Transfer {i}: {e}")
+        views[currency][t.payer_id] += amount
+        views[currency][t.payee_id] -= amount
+        if currency != base:
+            converted = rate_table.convert(amount, currency, base)
+            views[base][t.payer_id] += converted
+            views[base][t.payee_id] -= converted
+        deltas[(t.payer_id, currency)] += amount
+        deltas[(t.payee_id, currency)] -= amount
+        _add_debt(debts, t.payer_id, t.payee_id, currency, -amount)
+        rows.append(models.Settlement(group_id=group_id, payer_id=t.payer_id, payee_id=t.payee_id,
+                                      amount=amount, currency=currency))
 
+    version = _bump_version(db, group_id, expected)
+    db.add_all(rows)
+    db.flush()
+    _apply_balance_deltas(db, group_id, deltas)
+    _apply_debt_deltas(db, group_id, debts)
+    _checkpoint_if_due(db, group_id, version)
+    balances = views[base]
+    result = {"settlement_ids": [r.id for r in rows], "balances": balances, "replayed": False}
+    if idempotency_key:
+        response = json.dumps({
+            "settlement_ids": result["settlement_ids"],
+            "balances": {str(uid): str(net) for uid, net in balances.items()},
+        })
+        db.add(models.IdempotencyKey(group_id=group_id, key=idempotency_key, request_hash=request_hash,
+                                     response=response))
+    try:
+        db.commit()
+    except IntegrityError:
+        # A concurrent retry with the same key committed first; return its result.
+        db.rollback()
+        stored = _stored_batch(db, group_id, idempotency_key, request_hash) if idempotency_key else None
+        if stored is None:
+            raise
+        return stored
+    _publish_version(group_id, version)
+    _invalidate_user_summaries(uid for uid, _ in deltas)
+    return result
+
+def _plan(db: Session, group_id: int, strategy: str, currencies: str):
+    """Transfers as (payer, payee, amount, currency).
+
+    ``currencies="base"`` settles each user's overall position in the group's
+    base currency; ``"each"`` settles every currency separately, in that
+    currency, so no conversion is involved.
+    """
+    base = _group_currency(db, group_id)
+    if base is None:
+        raise ValueError("Group does not exist")
+    if currencies == "base":
+        return [(p, q, a, base) for p, q, a in plan_transfers(get_group_balances(db, group_id), strategy)]
+    if currencies != "each":
+        raise ValueError("Unknown currencies mode; use 'base' or 'each'")
+    by_currency: Dict[str, Dict[int, Decimal]] = defaultdict(dict)
+    for uid, nets in get_currency_balances(db, group_id).items():
+        for currency, net in nets.items():
+            by_currency[currency][uid] = net
+    return [
+        (p, q, a, currency)
+        for currency in sorted(by_currency)
+        for p, q, a in plan_transfers(by_currency[currency], strategy)
+    ]
+
+@metrics.timed("simplify_debts")
+@_retry_stale
+def simplify_debts(db: Session, group_id: int, strategy: str = "auto", currencies: str = "base"):
+    deltas: Dict[Tuple[int, str], Decimal] = defaultdict(lambda: Decimal("0"))
+    debts: Dict[Tuple[int, int, str], Decimal] = defaultdict(lambda: Decimal("0"))
+
+    # The plan is computed from balances as of this version; recording it only lands if it still holds.
+    expected = get_group_version(db, group_id)
+    transfers = _plan(db, group_id, strategy, currencies)
+    version = _bump_version(db, group_id, expected) if transfers else None
+    for payer_id, payee_id, amount, currency in transfers:
         # Record settlement in DB
         db.add(models.Settlement(
-            group_id=group_id, payer_id=debtor_uid, payee_id=creditor_uid, amount=settle_amt
+            group_id=group_id, payer_id=payer_id, payee_id=payee_id, amount=amount, currency=currency
         ))
+        deltas[(payer_id, currency)] += amount
+        deltas[(payee_id, currency)] -= amount
+        _add_debt(debts, payer_id, payee_id, currency, -amount)
 
-        new_debt = debt_amt + settle_amt
-        new_credit = credit_amt + settle_amt
-        if new_debt < 0:
-            heapq.heappush(debtors, (new_debt, debtor_uid))
-        if new_credit < 0:
-            heapq.heappush(creditors, (new_credit, creditor_uid))
-
+    if transfers:
+        _apply_balance_deltas(db, group_id, deltas)
+        _apply_debt_deltas(db, group_id, debts)
+        _checkpoint_if_due(db, group_id, version)
     db.commit()
-    return compute_group_balances(db, group_id)
+    _publish_version(group_id, version)
+    _invalidate_user_summaries(uid for uid, _ in deltas)
+    return get_group_balances(db, group_id)
+
+def plan_simplification(db: Session, group_id: int, strategy: str = "auto", currencies: str = "base"):
+    """The transfers simplify_debts would record, without writing anything.
+
+    Plans are cached per (group, strategy, currencies) and reused until the
+    group's version, the rates or the date change, like balance responses.
+    """
+    version = get_group_version(db, group_id)
+    key = (group_id, strategy, currencies)
+    tag = (version, *_rates_key())
+    cached = plan_cache.get(key)
+    if cached is not None and cached[0] == tag:
+        return version, cached[1]
+    transfers = _plan(db, group_id, strategy, currencies)
+    plan_cache.set(key, (tag, transfers))
+    return version, transfers
+
+# ------------------ USER SUMMARY --------------------
+
+def user_balance_summary(db: Session, user_id: int, currency: str = None, use_cache: bool = True,
+                         shard_dbs=()):
+    """A user's net in every group they belong to, and their net with each counterparty.
+
+    Group nets come from the ledger and pairwise nets from the debt graph of
+    the same groups, so /users/{id}/balances and /debts agree. A positive
+    pairwise net means the counterparty owes the user. ``total`` and pairwise
+    nets are converted into ``currency`` (default: the rate table's reference
+    currency) exactly and rounded once, the pairwise nets with largest
+    remainder so that they add up to ``total``. The number of queries is
+    fixed per database, however many groups or expenses the user has; with sharding,
+    ``shard_dbs`` are sessions on the other shards and their groups are summed in.
+    """
+    if user_id not in _existing_users(db, [user_id]):
+        raise ValueError("User does not exist")
+    currency = normalize_currency(currency or rate_table.reference)
+    if use_cache:
+        cached = user_summary_cache.get(user_id)
+        if cached is not None and currency in cached:
+            return cached[currency]
+
+    group_rows = []
+    nets: Dict[str, Decimal] = defaultdict(lambda: Decimal("0"))
+    pairwise: Dict[Tuple[int, str], Decimal] = defaultdict(lambda: Decimal("0"))
+    for part_db in (db, *shard_dbs):
+        _user_summary_part(part_db, user_id, group_rows, nets, pairwise)
+    group_rows.sort(key=lambda g: g["group_id"])
+
+    total = sum((n * rate_table.rate(cur, currency) for cur, n in nets.items()), Decimal("0"))
+    total = total.quantize(Decimal("0.01"))
+    exact: Dict[int, Decimal] = defaultdict(lambda: Decimal("0"))
+    for (other, cur), amount in sorted(pairwise.items()):
+        exact[other] += amount * rate_table.rate(cur, currency) * 100
+    cents = splits.round_to_total(splits.to_cents(total), exact)
+
+    summary = {
+        "user_id": user_id,
+        "currency": currency,
+        "total": total,
+        "groups": group_rows,
+        "counterparties": [
+            {"user_id": other, "net": splits.from_cents(c)} for other, c in sorted(cents.items()) if c
+        ],
+    }
+    entry = dict(user_summary_cache.get(user_id) or {})
+    entry[currency] = summary
+    user_summary_cache.set(user_id, entry)
+    return summary
+
+def _user_summary_part(db: Session, user_id: int, group_rows: list, nets, pairwise):
+    """Add what ``db`` holds for the user: their groups to ``group_rows``, their net per
+    currency to ``nets`` and, per (counterparty, currency), their pairwise nets to ``pairwise``."""
+    groups = db.query(models.Group.id, models.Group.name, models.Group.base_currency).join(
+        models.GroupMember, models.GroupMember.group_id == models.Group.id
+    ).filter(models.GroupMember.user_id == user_id).order_by(models.Group.id).all()
+    group_ids = [g.id for g in groups]
+    if group_ids:
+        with_ledger = {gid for (gid,) in db.query(models.GroupBalance.group_id).filter(
+            models.GroupBalance.group_id.in_(group_ids)).distinct()}
+        backfilled = [_ensure_ledger(db, gid) for gid in group_ids if gid not in with_ledger]
+        if any(backfilled):
+            db.commit()
+
+    group_nets: Dict[int, Dict[str, Decimal]] = defaultdict(dict)
+    if group_ids:
+        for gid, cur, net in db.query(models.GroupBalance.group_id, models.GroupBalance.currency,
+                                      models.GroupBalance.net).filter(
+            models.GroupBalance.user_id == user_id, models.GroupBalance.group_id.in_(group_ids)
+        ):
+            group_nets[gid][cur] = Decimal(net)
+
+    for g in groups:
+        by_currency = group_nets.get(g.id, {})
+        group_rows.append({
+            "group_id": g.id, "name": g.name, "currency": g.base_currency,
+            "net": sum((n * rate_table.rate(cur, g.base_currency) for cur, n in by_currency.items()),
+                       Decimal("0")).quantize(Decimal("0.01")),
+        })
+        for cur, n in by_currency.items():
+            nets[cur] += n
+
+    if group_ids:
+        # Pairwise nets are kept per group by the debt graph; sum the user's edges.
+        D = models.GroupDebt
+        edges = db.query(D.user_a, D.user_b, D.currency, func.sum(D.amount)).filter(
+            D.group_id.in_(group_ids), or_(D.user_a == user_id, D.user_b == user_id)
+        ).group_by(D.user_a, D.user_b, D.currency)
+        for a, b, cur, amount in edges:
+            # ``amount`` is what user_a owes user_b; positive pairwise nets are owed to the user.
+            if a == user_id:
+                pairwise[(b, cur)] -= Decimal(amount or 0)
+            else:
+                pairwise[(a, cur)] += Decimal(amount or 0)
+
+# ------------------ HISTORY --------------------
+# Newest first, paginated by a (created_at, id) keyset cursor so deep pages
+# cost the same as the first one.
+
+def _encode_cursor(created_at: datetime.datetime, row_id: int) -> str:
+    raw = json.dumps([created_at.isoformat(), row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+def _decode_cursor(cursor: str):
+    try:
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+def _page(query, model, limit: int, cursor: str = None, since=None, until=None):
+    if cursor:
+        created_at, row_id = _decode_cursor(cursor)
+        query = query.filter(or_(
+            model.created_at < created_at,
+            and_(model.created_at == created_at, model.id < row_id),
+        ))
+    if since is not None:
+        query = query.filter(model.created_at >= since)
+    if until is not None:
+        query = query.filter(model.created_at < until)
+    rows = query.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1).all()
+    next_cursor = _encode_cursor(rows[limit - 1].created_at, rows[limit - 1].id) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+def list_expenses(db: Session, group_id: int, limit: int = 50, cursor: str = None, user_id: int = None,
+                  currency: str = None, since=None, until=None):
+    """One page of a group's expenses with payers and shares loaded in two extra queries."""
+    if not _group_exists(db, group_id):
+        raise ValueError("Group does not exist")
+    query = db.query(models.Expense).filter(models.Expense.group_id == group_id).options(
+        selectinload(models.Expense.payers), selectinload(models.Expense.shares)
+    )
+    if user_id is not None:
+        query = query.filter(or_(
+            models.Expense.payers.any(models.ExpensePayer.user_id == user_id),
+            models.Expense.shares.any(models.ExpenseShare.user_id == user_id),
+        ))
+    if currency:
+        query = query.filter(models.Expense.currency == normalize_currency(currency))
+    return _page(query, models.Expense, limit, cursor, since, until)
+
+def list_settlements(db: Session, group_id: int, limit: int = 50, cursor: str = None, user_id: int = None,
+                     since=None, until=None):
+    if not _group_exists(db, group_id):
+        raise ValueError("Group does not exist")
+    query = db.query(models.Settlement).filter(models.Settlement.group_id == group_id)
+    if user_id is not None:
+        query = query.filter(or_(models.Settlement.payer_id == user_id, models.Settlement.payee_id == user_id))
+    return _page(query, models.Settlement, limit, cursor, since, until)
+
+# ------------------ EXPORT --------------------
+
+def iter_ledger(db: Session, group_id: int, batch_size: int = 1000):
+    """Yield a group's full ledger: every expense in id order, then every settlement.
+
+    Expenses come as {"type": "expense", ..., "payers", "shares"} and
+    settlements as {"type": "settlement", ...}. Rows are read with a
+    streaming cursor ``batch_size`` at a time, and each batch's payers and
+    shares are fetched with one IN query apiece, so memory is bounded by the
+    batch, not by the size of the group.
+    """
+    if not _group_exists(db, group_id):
+        raise ValueError("Group does not exist")
+    return _ledger_records(db, group_id, batch_size)
+
+def _ledger_records(db: Session, group_id: int, batch_size: int = 1000):
+    E = models.Expense
+    expenses = db.execute(
+        select(E.id, E.created_at, E.description, E.currency, E.amount)
+        .where(E.group_id == group_id).order_by(E.id)
+        .execution_options(yield_per=batch_size)
+    )
+    for batch in expenses.partitions():
+        ids = [row.id for row in batch]
+        parts = {eid: {"payers": [], "shares": []} for eid in ids}
+        for key, model in (("payers", models.ExpensePayer), ("shares", models.ExpenseShare)):
+            rows = db.execute(
+                select(model.expense_id, model.user_id, model.amount)
+                .where(model.expense_id.in_(ids)).order_by(model.id)
+            )
+            for eid, uid, amount in rows:
+                parts[eid][key].append((uid, amount))
+        for row in batch:
+            yield {
+                "type": "expense", "id": row.id, "created_at": row.created_at,
+                "description": row.description, "currency": row.currency, "amount": row.amount,
+                **parts[row.id],
+            }
+
+    S = models.Settlement
+    settlements = db.execute(
+        select(S.id, S.created_at, S.payer_id, S.payee_id, S.currency, S.amount)
+        .where(S.group_id == group_id).order_by(S.id)
+        .execution_options(yield_per=batch_size)
+    )
+    for row in settlements:
+        yield {
+            "type": "settlement", "id": row.id, "created_at": row.created_at,
+            "payer_id": row.payer_id, "payee_id": row.payee_id,
+            "currency": row.currency, "amount": row.amount,
+        }
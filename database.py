@@ -1,15 +1,171 @@
 # app/database.py
-from sqlalchemy import create_engine
+import threading
+import time
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import QueuePool, StaticPool
+from . import config, metrics
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./expense.db"
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+SQLALCHEMY_DATABASE_URL = config.DATABASE_URL
+
+
+def _is_memory_sqlite(url: str) -> bool:
+    return url.startswith("sqlite") and (url.split("://", 1)[1] in ("", "/", "/:memory:") or "mode=memory" in url)
+
+
+def engine_options(url: str) -> dict:
+    """Pool and driver options for ``url`` built from config."""
+    if _is_memory_sqlite(url):
+        return {"connect_args": {"check_same_thread": False}, "poolclass": StaticPool}
+    options = {
+        "pool_size": config.DB_POOL_SIZE,
+        "max_overflow": config.DB_MAX_OVERFLOW,
+        "pool_timeout": config.DB_POOL_TIMEOUT,
+        "pool_recycle": config.DB_POOL_RECYCLE,
+    }
+    if url.startswith("sqlite"):
+        options["connect_args"] = {"check_same_thread": False}
+        options["poolclass"] = QueuePool
+    return options
+
+
+def apply_sqlite_pragmas(engine: Engine, read_only: bool = False):
+    """Tune every new SQLite connection: WAL, synchronous, busy timeout, mmap.
+
+    ``read_only`` connections leave the journal mode to the writer and refuse writes (query_only).
+    """
+    if engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if read_only:
+            cursor.execute("PRAGMA query_only=1")
+        elif config.SQLITE_WAL:
+            cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA synchronous={config.SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={int(config.SQLITE_BUSY_TIMEOUT_MS)}")
+        cursor.execute(f"PRAGMA mmap_size={int(config.SQLITE_MMAP_SIZE)}")
+        cursor.close()
+
+
+class PoolMetrics:
+    """Checkout counters for a pool plus how long sessions waited for a connection."""
+
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        self.checkouts = 0
+        self.connects = 0
+        self.waits = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self._lock = threading.Lock()
+        event.listen(engine, "checkout", self._on_checkout)
+        event.listen(engine, "connect", self._on_connect)
+
+    def _on_checkout(self, *args):
+        with self._lock:
+            self.checkouts += 1
+
+    def _on_connect(self, *args):
+        with self._lock:
+            self.connects += 1
+
+    def record_wait(self, seconds: float):
+        with self._lock:
+            self.waits += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+
+    def snapshot(self) -> dict:
+        pool = self.engine.pool
+        with self._lock:
+            return {
+                "pool": type(pool).__name__,
+                "size": pool.size() if hasattr(pool, "size") else None,
+                "checked_out": pool.checkedout() if hasattr(pool, "checkedout") else None,
+                "overflow": pool.overflow() if hasattr(pool, "overflow") else None,
+                "checkouts": self.checkouts,
+                "connections_opened": self.connects,
+                "wait": {
+                    "count": self.waits,
+                    "total_ms": round(self.wait_total * 1000, 3),
+                    "avg_ms": round(self.wait_total * 1000 / self.waits, 3) if self.waits else 0.0,
+                    "max_ms": round(self.wait_max * 1000, 3),
+                },
+            }
+
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **engine_options(SQLALCHEMY_DATABASE_URL))
+apply_sqlite_pragmas(engine)
+metrics.instrument_engine(engine)
+pool_metrics = PoolMetrics(engine)
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 Base = declarative_base()
 
 def get_db():
     db = SessionLocal()
     try:
+        # Check out the connection up front so pool waits are measured.
+        start = time.perf_counter()
+        db.connection()
+        pool_metrics.record_wait(time.perf_counter() - start)
+        yield db
+    finally:
+        db.close()
+
+# ------------------ SHARDS --------------------
+
+def group_session(group_id: int):
+    """A session on the database that holds ``group_id``'s ledger."""
+    if config.SHARDS <= 1:
+        return SessionLocal()
+    from .sharding import get_router
+    return get_router().session_for(group_id)
+
+def get_group_db(group_id: int):
+    """get_db for routes under /groups/{group_id}: the session is on the group's shard."""
+    db = group_session(group_id)
+    try:
+        start = time.perf_counter()
+        db.connection()
+        pool_metrics.record_wait(time.perf_counter() - start)
         yield db
     finally:
         db.close()
+
+# ------------------ ASYNC ENGINE --------------------
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+def async_url(url: str) -> str:
+    """Map a sync database URL onto its async driver, e.g. sqlite:// -> sqlite+aiosqlite://."""
+    scheme, sep, rest = url.partition("://")
+    backend = scheme.split("+", 1)[0]
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for {backend!r}")
+    return ASYNC_DRIVERS[backend] + sep + rest
+
+async_engine = None
+AsyncSessionLocal = None
+
+def make_async_sessionmaker(url: str):
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+    options = engine_options(url)
+    options.pop("poolclass", None)
+    aengine = create_async_engine(url, **options)
+    apply_sqlite_pragmas(aengine.sync_engine)
+    metrics.instrument_engine(aengine.sync_engine)
+    # expire_on_commit=False: routers serialize ORM objects after the crud call
+    # has committed, and async sessions cannot lazy-load expired attributes.
+    return aengine, sessionmaker(bind=aengine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+if config.ASYNC_DB:
+    async_engine, AsyncSessionLocal = make_async_sessionmaker(
+        config.ASYNC_DATABASE_URL or async_url(SQLALCHEMY_DATABASE_URL)
+    )
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,51 @@
+# app/export.py
+"""Formatters for streaming a group's ledger (see crud.iter_ledger).
+
+Each formatter turns the record iterator into an iterator of text pieces
+without collecting it; ``chunked`` batches those pieces into ~64 KiB
+strings for the response body.
+"""
+import csv
+import io
+import json
+
+CSV_COLUMNS = ["type", "id", "created_at", "description", "currency", "total", "user_id", "payee_id", "amount"]
+
+
+def ndjson_lines(records):
+    for r in records:
+        out = dict(r, created_at=r["created_at"].isoformat(), amount=float(r["amount"]))
+        if r["type"] == "expense":
+            out["payers"] = [{"user_id": uid, "amount": float(a)} for uid, a in r["payers"]]
+            out["shares"] = [{"user_id": uid, "amount": float(a)} for uid, a in r["shares"]]
+        yield json.dumps(out) + "\n"
+
+
+def csv_lines(records):
+    """One row per payer and per share of each expense, and one per settlement."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(CSV_COLUMNS)
+    for r in records:
+        created = r["created_at"].isoformat()
+        if r["type"] == "expense":
+            for kind, key in (("payer", "payers"), ("share", "shares")):
+                for uid, amount in r[key]:
+                    writer.writerow([kind, r["id"], created, r["description"], r["currency"], r["amount"], uid, "", amount])
+        else:
+            writer.writerow(["settlement", r["id"], created, "", r["currency"], "", r["payer_id"], r["payee_id"], r["amount"]])
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+
+
+def chunked(pieces, chunk_size: int = 64 * 1024):
+    chunk, size = [], 0
+    for piece in pieces:
+        chunk.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            yield "".join(chunk)
+            chunk, size = [], 0
+    if chunk:
+        yield "".join(chunk)
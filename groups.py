@@ -1,8 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from sqlalchemy.orm import Session
-from .. import crud, schemas
-from ..database import get_db
+from .. import config, crud, export, ingest, schemas, sharding
+from ..cache import etag_matches
+from ..database import get_db, get_group_db, group_session
+from ..replica import get_read_db
 from decimal import Decimal
+from typing import Optional
+from datetime import datetime
+import asyncio
+import json
 
 router = APIRouter(
     prefix="/groups",
@@ -11,47 +19,320 @@ router = APIRouter(
 
 @router.post("", summary="Create a group")
 def create_group(group: schemas.GroupCreate, db: Session = Depends(get_db)):
-    return crud.create_group(db, group.name)
+    try:
+        if config.SHARDS > 1:
+            return sharding.get_router().create_group(group.name, group.base_currency)
+        return crud.create_group(db, group.name, group.base_currency)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @router.post("/{group_id}/members", summary="Add member to group")
-def add_member(group_id: int, member: schemas.AddMember, db: Session = Depends(get_db)):
-    return crud.add_member(db, group_id, member.user_id)
+def add_member(group_id: int, member: schemas.AddMember, db: Session = Depends(get_group_db)):
+    try:
+        return crud.add_member(db, group_id, member.user_id)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @router.post("/{group_id}/expenses", summary="Add expense to group")
-def add_expense(group_id: int, expense: schemas.ExpenseCreate, db: Session = Depends(get_db)):
+async def add_expense(group_id: int, expense: schemas.ExpenseCreate, db: Session = Depends(get_group_db)):
+    """
+    With EXPENSE_INGEST_QUEUE on, the expense is validated here, committed
+    by the ingestion worker together with others for the group, and returned
+    once that commit is done; a full queue answers 503.
+    """
     try:
-        return crud.add_expense(db, group_id, expense)
+        if not config.INGEST_QUEUE:
+            return await run_in_threadpool(crud.add_expense, db, group_id, expense)
+        future = await run_in_threadpool(ingest.get_queue().submit, db, group_id, expense)
+        return await asyncio.wrap_future(future)
+    except ingest.QueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+def _expense_out(e):
+    return {
+        "id": e.id,
+        "description": e.description,
+        "amount": float(e.amount),
+        "currency": e.currency,
+        "created_at": e.created_at,
+        "payers": [{"user_id": p.user_id, "amount": float(p.amount)} for p in e.payers],
+        "shares": [{"user_id": s.user_id, "amount": float(s.amount)} for s in e.shares],
+    }
+
+def _settlement_out(s):
+    return {
+        "id": s.id,
+        "payer_id": s.payer_id,
+        "payee_id": s.payee_id,
+        "amount": float(s.amount),
+        "currency": s.currency,
+        "created_at": s.created_at,
+    }
+
+@router.get("/{group_id}/expenses", summary="List a group's expenses, newest first")
+def list_expenses(group_id: int, limit: int = Query(50, ge=1, le=500), cursor: Optional[str] = None,
+                  user_id: Optional[int] = None, currency: Optional[str] = None,
+                  since: Optional[datetime] = None, until: Optional[datetime] = None,
+                  db: Session = Depends(get_read_db)):
+    """
+    Pass the returned next_cursor back as ?cursor= to fetch the following page;
+    it is null on the last page. user_id matches expenses the user paid for or
+    shares in. since is inclusive, until exclusive.
+    """
+    try:
+        rows, next_cursor = crud.list_expenses(db, group_id, limit=limit, cursor=cursor, user_id=user_id,
+                                               currency=currency, since=since, until=until)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"items": [_expense_out(e) for e in rows], "next_cursor": next_cursor}
+
+@router.get("/{group_id}/settlements", summary="List a group's settlements, newest first")
+def list_settlements(group_id: int, limit: int = Query(50, ge=1, le=500), cursor: Optional[str] = None,
+                     user_id: Optional[int] = None, since: Optional[datetime] = None,
+                     until: Optional[datetime] = None, db: Session = Depends(get_read_db)):
+    try:
+        rows, next_cursor = crud.list_settlements(db, group_id, limit=limit, cursor=cursor, user_id=user_id,
+                                                  since=since, until=until)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"items": [_settlement_out(s) for s in rows], "next_cursor": next_cursor}
+
+NDJSON_TYPES = ("application/x-ndjson", "application/ndjson")
+
+async def _ndjson_lines(request: Request):
+    """Non-blank lines of an NDJSON body, split off as its chunks arrive."""
+    pending = b""
+    async for chunk in request.stream():
+        *lines, pending = (pending + chunk).split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line
+    if pending.strip():
+        yield pending
+
+@router.post("/{group_id}/expenses:bulk", summary="Bulk import expenses")
+async def bulk_add_expenses(group_id: int, request: Request, atomic: bool = False, db: Session = Depends(get_group_db)):
+    """
+    Accepts a JSON array of expenses, or one expense per line when sent as
+    application/x-ndjson. Invalid items are reported per index and the rest are
+    inserted, unless atomic=true, in which case any error rejects the batch.
+    NDJSON is parsed line by line as it streams in, so only the validated
+    expenses are held in memory, not the raw body; a JSON array is read whole.
+    """
+    results, parsed, positions = [], [], []
+
+    def parse(i, item):
+        try:
+            if isinstance(item, bytes):
+                item = json.loads(item)
+            parsed.append(schemas.ExpenseCreate(**item))
+            positions.append(i)
+        except (TypeError, ValueError) as e:
+            results.append({"index": i, "error": str(e)})
+
+    if request.headers.get("content-type", "").startswith(NDJSON_TYPES):
+        i = 0
+        async for line in _ndjson_lines(request):
+            parse(i, line)
+            i += 1
+    else:
+        try:
+            items = json.loads(await request.body())
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Malformed JSON body: {e}")
+        if not isinstance(items, list):
+            raise HTTPException(status_code=400, detail="Expected a JSON array of expenses")
+        for i, item in enumerate(items):
+            parse(i, item)
+    if atomic and results:
+        raise HTTPException(status_code=400, detail={"message": "Invalid expenses in batch", "errors": results})
+
+    try:
+        outcome = await run_in_threadpool(crud.add_expenses_bulk, db, group_id, parsed, atomic)
+    except crud.BulkValidationError as e:
+        errors = [{"index": positions[r["index"]], "error": r["error"]} for r in e.errors]
+        raise HTTPException(status_code=400, detail={"message": str(e), "errors": errors})
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    for r in outcome:
+        r["index"] = positions[r["index"]]
+    results = sorted(results + outcome, key=lambda r: r["index"])
+    return {"created": sum(1 for r in results if "id" in r), "results": results}
+
 @router.get("/{group_id}/expenses/balances", summary="Get group balances")
-def get_balances(group_id: int, db: Session = Depends(get_db)):
+def get_balances(group_id: int, if_none_match: Optional[str] = Header(None), db: Session = Depends(get_read_db)):
     """
     Returns balances in list of dicts format: [{"user_id": ..., "net": ...}]
+
+    Responses carry an ETag tied to the group's version; a request whose
+    If-None-Match still matches gets a 304 after a single version lookup.
+    """
+    try:
+        version, etag = crud.current_balances_etag(db, group_id)
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers={"ETag": etag})
+        version, balances = crud.cached_group_balances(db, group_id, version)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # Convert Decimal to float for JSON + make list of dicts
+    body = [{"user_id": uid, "net": float(net)} for uid, net in balances.items()]
+    return JSONResponse(body, headers={"ETag": etag})
+
+@router.get("/{group_id}/balances", summary="Get group balances, optionally as of a point in time")
+def get_balances_as_of(group_id: int, as_of: Optional[datetime] = None, db: Session = Depends(get_read_db)):
+    """
+    Without as_of this is the same as /expenses/balances. With as_of, only
+    expenses and settlements created at or before that time are counted.
     """
     try:
-        balances = crud.compute_group_balances(db, group_id)
-        # Convert Decimal to float for JSON + make list of dicts
+        if as_of is None:
+            balances = crud.get_group_balances(db, group_id)
+        else:
+            balances = crud.balances_as_of(db, group_id, as_of)
+        return [{"user_id": uid, "net": float(net)} for uid, net in balances.items()]
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/{group_id}/balances/currencies", summary="Get group balances per currency, unconverted")
+def get_currency_balances(group_id: int, db: Session = Depends(get_read_db)):
+    try:
+        balances = crud.get_currency_balances(db, group_id)
+        return [
+            {"user_id": uid, "balances": {cur: float(net) for cur, net in nets.items()}}
+            for uid, nets in balances.items()
+        ]
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/{group_id}/debts", summary="Get who owes whom in a group, pair by pair")
+def get_debts(group_id: int, db: Session = Depends(get_read_db)):
+    try:
+        return [{**debt, "amount": float(debt["amount"])} for debt in crud.get_group_debts(db, group_id)]
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/{group_id}/balances/checkpoints", summary="Take a balance checkpoint")
+def take_checkpoint(group_id: int, at: Optional[datetime] = None, db: Session = Depends(get_group_db)):
+    try:
+        checkpoint = crud.take_checkpoint(db, group_id, at)
+        return {"id": checkpoint.id, "group_id": group_id, "taken_at": checkpoint.taken_at}
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/{group_id}/balances/rebuild", summary="Rebuild the balance ledger from history")
+def rebuild_balances(group_id: int, db: Session = Depends(get_group_db)):
+    try:
+        crud.rebuild_balances(db, group_id)
+        balances = crud.get_group_balances(db, group_id)
         return [{"user_id": uid, "net": float(net)} for uid, net in balances.items()]
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@router.get("/{group_id}/balances/check", summary="Check the balance ledger against a full recompute")
+def check_balances(group_id: int, db: Session = Depends(get_group_db)):
+    mismatches = crud.check_balances(db, group_id)
+    return {
+        "consistent": not mismatches,
+        "mismatches": [
+            {"user_id": m["user_id"], "currency": m["currency"],
+             "ledger": float(m["ledger"]), "recomputed": float(m["recomputed"])}
+            for m in mismatches
+        ],
+    }
+
 @router.post("/{group_id}/settle", summary="Settle a debt between two users")
-def settle_debt(group_id: int, settlement: schemas.SettlementCreate, db: Session = Depends(get_db)):
+def settle_debt(group_id: int, settlement: schemas.SettlementCreate, db: Session = Depends(get_group_db)):
     try:
         return crud.add_settlement(
             db,
             group_id=group_id,
             payer_id=settlement.payer_id,
             payee_id=settlement.payee_id,
-            amount=Decimal(settlement.amount)
+            amount=Decimal(settlement.amount),
+            currency=settlement.currency
         )
+    except crud.GroupBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/{group_id}/simplify/plan", summary="Preview the transfers simplify would record")
+def simplify_plan(group_id: int, strategy: str = "auto", currencies: str = "base", db: Session = Depends(get_read_db)):
+    try:
+        version, transfers = crud.plan_simplification(db, group_id, strategy, currencies)
+        return {
+            "group_id": group_id,
+            "version": version,
+            "strategy": strategy,
+            "currencies": currencies,
+            "transfers": [
+                {"payer_id": payer, "payee_id": payee, "amount": float(amount), "currency": currency}
+                for payer, payee, amount, currency in transfers
+            ],
+        }
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/{group_id}/settlements:batch", summary="Record several settlements at once")
+def settle_batch(group_id: int, batch: schemas.SettlementBatch, db: Session = Depends(get_group_db),
+                 idempotency_key: Optional[str] = Header(None)):
+    """
+    All transfers are validated against one balance snapshot and recorded in a
+    single transaction. Retries that send the same Idempotency-Key header get
+    the original result back instead of settling twice; reusing a key with
+    different transfers gets a 422.
+    """
+    try:
+        result = crud.add_settlements_batch(db, group_id, batch.transfers, idempotency_key)
+    except crud.IdempotencyMismatch as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except crud.GroupBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "settlement_ids": result["settlement_ids"],
+        "balances": [{"user_id": uid, "net": float(net)} for uid, net in result["balances"].items()],
+        "replayed": result["replayed"],
+    }
 
 @router.post("/{group_id}/simplify", summary="Simplify debts in a group")
-def simplify(group_id: int, db: Session = Depends(get_db)):
+def simplify(group_id: int, strategy: str = "auto", currencies: str = "base", db: Session = Depends(get_group_db)):
+    try:
+        return crud.simplify_debts(db, group_id, strategy, currencies)
+    except crud.GroupBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# ------------------ EXPORT --------------------
+EXPORTERS = {
+    "ndjson": (export.ndjson_lines, "application/x-ndjson"),
+    "csv": (export.csv_lines, "text/csv"),
+}
+
+def _export_stream(group_id: int, formatter, chunk_size: int = 64 * 1024):
+    # The stream outlives the request's own session, so it opens its own.
+    db = group_session(group_id)
+    try:
+        yield from export.chunked(formatter(crud.iter_ledger(db, group_id)), chunk_size)
+    finally:
+        db.close()
+
+@router.get("/{group_id}/export", summary="Stream a group's full ledger as NDJSON or CSV")
+def export_ledger(group_id: int, fmt: str = Query("ndjson", alias="format"), db: Session = Depends(get_group_db)):
+    if fmt not in EXPORTERS:
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'csv'")
     try:
-        return crud.simplify_debts(db, group_id)
+        crud.get_group_version(db, group_id)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
+    formatter, media_type = EXPORTERS[fmt]
+    return StreamingResponse(
+        _export_stream(group_id, formatter),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="group-{group_id}.{fmt}"'},
+    )
@@ -0,0 +1,155 @@
+# app/ingest.py
+"""Write-behind expense ingestion with per-group coalesced commits.
+
+Requests validate their expense, put it on a bounded queue and wait on a
+future. One background worker takes items off the queue until the batch
+reaches ``batch_size`` items or ``batch_ms`` has passed since its first item,
+then writes each group's items with crud.write_expenses and a single commit,
+in a session from ``session_factory(group_id)``.
+Futures resolve only after that commit, so an acknowledged expense is
+durable; a full queue blocks the caller for ``enqueue_timeout_ms`` and then
+raises QueueFull.
+"""
+import atexit
+import queue
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future
+from . import config, crud, metrics
+
+
+class QueueFull(Exception):
+    """The ingestion queue stayed full for the whole enqueue timeout."""
+
+
+class IngestQueue:
+    def __init__(self, session_factory, batch_size: int = 200, batch_ms: int = 5, maxsize: int = 2000,
+                 enqueue_timeout_ms: int = 100):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.batch_ms = batch_ms
+        self.enqueue_timeout_ms = enqueue_timeout_ms
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._thread = None
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self.items = 0
+        self.batches = 0
+        self.commits = 0
+        self.rejected = 0
+
+    def submit(self, db, group_id: int, expense_in) -> Future:
+        """Validate ``expense_in`` with ``db`` and queue it; raises ValueError or QueueFull."""
+        currency, shares = crud.validate_expense(db, group_id, expense_in)
+        return self.enqueue(group_id, expense_in, currency, shares)
+
+    def enqueue(self, group_id: int, expense_in, currency: str, shares) -> Future:
+        """Queue an already validated expense; the future resolves to the committed Expense."""
+        self.start()
+        future = Future()
+        try:
+            self._queue.put((group_id, expense_in, currency, shares, future),
+                            timeout=self.enqueue_timeout_ms / 1000)
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            raise QueueFull("Expense queue is full, retry later")
+        return future
+
+    def start(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._stopping.clear()
+                    self._thread = threading.Thread(target=self._run, name="expense-ingest", daemon=True)
+                    self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        """Commit everything already queued, then stop the worker."""
+        thread = self._thread
+        if thread is not None:
+            self._stopping.set()
+            thread.join(timeout)
+            self._thread = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "running": self._thread is not None,
+                "depth": self._queue.qsize(),
+                "items": self.items,
+                "batches": self.batches,
+                "commits": self.commits,
+                "rejected": self.rejected,
+                "avg_batch": round(self.items / self.batches, 2) if self.batches else 0.0,
+            }
+
+    def _next_batch(self) -> list:
+        try:
+            batch = [self._queue.get(timeout=0.05)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.batch_ms / 1000
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                if self._stopping.is_set():
+                    return
+                continue
+            by_group = defaultdict(list)
+            for group_id, *item in batch:
+                by_group[group_id].append(item)
+            for group_id, items in by_group.items():
+                self._commit_group(group_id, items)
+            with self._lock:
+                self.items += len(batch)
+                self.batches += 1
+                self.commits += len(by_group)
+
+    def _commit_group(self, group_id: int, items):
+        db = self.session_factory(group_id)
+        # Keep the committed rows readable after the session closes; they are the responses.
+        db.expire_on_commit = False
+        try:
+            with metrics.span("ingest_commit"):
+                expenses, version, touched = crud.write_expenses(
+                    db, group_id, [(expense_in, currency, shares) for expense_in, currency, shares, _ in items]
+                )
+                db.commit()
+            crud.after_expense_commit(group_id, version, touched)
+        except Exception as e:
+            db.rollback()
+            for *_, future in items:
+                future.set_exception(e)
+            return
+        finally:
+            db.close()
+        for expense, (*_, future) in zip(expenses, items):
+            future.set_result(expense)
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_queue() -> IngestQueue:
+    """The process-wide queue, configured from config and started on first use."""
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                from .database import group_session
+                _queue = IngestQueue(group_session, config.INGEST_BATCH_SIZE, config.INGEST_BATCH_MS,
+                                     config.INGEST_QUEUE_SIZE, config.INGEST_ENQUEUE_TIMEOUT_MS)
+                atexit.register(_queue.stop)
+    return _queue
@@ -1,7 +1,28 @@
 from fastapi import FastAPI
-from app.routers import users, groups 
+from fastapi.responses import PlainTextResponse
+from app.routers import users, groups, admin
+from app.migrations import run_migrations
+from app import config, metrics, replica, sharding
+
+run_migrations()
+if config.SHARDS > 1:
+    if config.ASYNC_DB:
+        raise RuntimeError("EXPENSE_SHARDS > 1 is not supported with EXPENSE_ASYNC_DB")
+    sharding.get_router().migrate()
+if config.READ_POOL and (config.SHARDS > 1 or config.ASYNC_DB):
+    raise RuntimeError("EXPENSE_READ_POOL is not supported with EXPENSE_SHARDS > 1 or EXPENSE_ASYNC_DB")
 
 app = FastAPI()
+app.add_middleware(replica.ConsistencyMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
 
 app.include_router(users.router) 
+if config.ASYNC_DB:
+    from app.routers import async_groups
+    app.include_router(async_groups.router)
 app.include_router(groups.router)
+app.include_router(admin.router)
+
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
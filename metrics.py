@@ -0,0 +1,202 @@
+# app/metrics.py
+"""Request, query and span instrumentation, rendered in the Prometheus text format.
+
+- MetricsMiddleware times every request per route template and, when
+  EXPENSE_QUERY_HEADERS is on, adds X-Query-Count and Server-Timing headers.
+- instrument_engine counts SQL statements and their time, globally and for
+  the request in progress.
+- span / timed time a block or a function (the hot crud calls), also both
+  globally and per request.
+
+The per-request profile lives in a context variable, so it follows the
+request into the threadpool and into async sessions' greenlets.
+"""
+import bisect
+import contextvars
+import functools
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from sqlalchemy import event
+from . import config
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+class Histogram:
+    """Thread-safe labelled histogram with fixed buckets."""
+
+    def __init__(self, name: str, help: str, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][i] += 1
+            series[1] += value
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def _label_text(self, values, extra: str = None) -> str:
+        pairs = [f'{k}="{_escape(v)}"' for k, v in zip(self.labels, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((k, (list(c), s)) for k, (c, s) in self._series.items())
+        for values, (counts, total) in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{self._label_text(values, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{self._label_text(values)} {total}")
+            lines.append(f"{self.name}_count{self._label_text(values)} {cumulative}")
+        return lines
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+request_seconds = Histogram(
+    "expense_http_request_duration_seconds", "HTTP request latency by route template.",
+    ("method", "route", "status"),
+)
+request_queries = Histogram(
+    "expense_http_request_db_queries", "SQL statements executed per HTTP request.",
+    ("method", "route"), COUNT_BUCKETS,
+)
+query_seconds = Histogram("expense_db_query_duration_seconds", "SQL statement latency by verb.", ("verb",))
+span_seconds = Histogram("expense_span_duration_seconds", "Time spent in instrumented code paths.", ("span",))
+REGISTRY = [request_seconds, request_queries, query_seconds, span_seconds]
+
+
+def render() -> str:
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+
+def reset():
+    for metric in REGISTRY:
+        metric.clear()
+
+# ------------------ PER-REQUEST PROFILE --------------------
+
+class RequestProfile:
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.spans = defaultdict(float)
+
+    def server_timing(self, total: float) -> str:
+        parts = [f'db;dur={self.db_seconds * 1000:.2f};desc="{self.queries} queries"']
+        parts += [f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.spans.items()]
+        parts.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(parts)
+
+
+_profile: contextvars.ContextVar = contextvars.ContextVar("expense_request_profile", default=None)
+
+
+def current_profile():
+    return _profile.get()
+
+
+@contextmanager
+def span(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        span_seconds.observe(elapsed, name)
+        profile = _profile.get()
+        if profile is not None:
+            profile.spans[name] += elapsed
+
+
+def timed(name: str):
+    """Decorator form of ``span``."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+# ------------------ SQLALCHEMY HOOKS --------------------
+
+VERBS = {"SELECT", "INSERT", "UPDATE", "DELETE"}
+
+
+def instrument_engine(engine):
+    """Count statements and their time on ``engine`` (a sync Engine, or an AsyncEngine's sync_engine)."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._metrics_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, "_metrics_start", None)
+        if start is None:
+            return
+        elapsed = time.perf_counter() - start
+        verb = statement.lstrip()[:6].upper()
+        query_seconds.observe(elapsed, verb if verb in VERBS else "OTHER")
+        profile = _profile.get()
+        if profile is not None:
+            profile.queries += 1
+            profile.db_seconds += elapsed
+
+# ------------------ MIDDLEWARE --------------------
+
+class MetricsMiddleware:
+    """ASGI middleware: per-route latency and query histograms, optional profiling headers."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        profile = RequestProfile()
+        token = _profile.set(profile)
+        start = time.perf_counter()
+        status = [500]
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                if config.QUERY_HEADERS:
+                    message = {**message, "headers": list(message.get("headers", [])) + [
+                        (b"x-query-count", str(profile.queries).encode()),
+                        (b"server-timing", profile.server_timing(time.perf_counter() - start).encode()),
+                    ]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            _profile.reset(token)
+            # The route template, not the raw path, keeps label cardinality bounded.
+            route = getattr(scope.get("route"), "path", "unmatched")
+            request_seconds.observe(time.perf_counter() - start, scope["method"], route, str(status[0]))
+            request_queries.observe(profile.queries, scope["method"], route)
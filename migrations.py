@@ -0,0 +1,212 @@
+# app/migrations.py
+"""Versioned schema migrations, applied in order at startup.
+
+Each migration is a ``(version, description, fn)`` entry in ``MIGRATIONS``.
+``fn`` receives a connection inside the migration transaction. The highest
+applied version is recorded in the ``schema_version`` table.
+
+Version 1 runs ``create_all`` against the current models, so a fresh database
+already has everything later migrations would add. Later migrations must
+therefore check before altering, which the ``_has_*`` helpers make easy.
+
+Money storage (NUMERIC vs integer cents) is a setting rather than a schema
+version: ``convert_money_storage`` rewrites the money columns whenever the
+unit recorded in ``money_storage`` differs from ``config.MONEY_AS_CENTS``.
+"""
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+from .database import Base, engine as default_engine
+from . import config, models
+
+MONEY_COLUMNS = [
+    ("expenses", "amount"),
+    ("expense_payers", "amount"),
+    ("expense_shares", "amount"),
+    ("settlements", "amount"),
+    ("group_balances", "net"),
+    ("balance_checkpoint_entries", "net"),
+    ("group_debts", "amount"),
+]
+
+
+def _has_index(conn: Connection, table: str, name: str) -> bool:
+    return any(ix["name"] == name for ix in inspect(conn).get_indexes(table))
+
+
+def _has_unique(conn: Connection, table: str, columns) -> bool:
+    insp = inspect(conn)
+    columns = list(columns)
+    if any(uc["column_names"] == columns for uc in insp.get_unique_constraints(table)):
+        return True
+    return any(ix["unique"] and ix["column_names"] == columns for ix in insp.get_indexes(table))
+
+
+def _has_column(conn: Connection, table: str, name: str) -> bool:
+    return any(col["name"] == name for col in inspect(conn).get_columns(table))
+
+
+def _create_tables(conn: Connection):
+    Base.metadata.create_all(bind=conn)
+
+
+def _hot_path_indexes(conn: Connection):
+    # Duplicate memberships would block the unique index; keep the oldest row.
+    conn.execute(text(
+        "DELETE FROM group_members WHERE id NOT IN "
+        "(SELECT MIN(id) FROM group_members GROUP BY group_id, user_id)"
+    ))
+    if not _has_unique(conn, "group_members", ["group_id", "user_id"]):
+        conn.execute(text(
+            "CREATE UNIQUE INDEX uq_group_members_group_user ON group_members (group_id, user_id)"
+        ))
+    for model in (models.Expense, models.ExpensePayer, models.ExpenseShare, models.Settlement):
+        for index in model.__table__.indexes:
+            if not _has_index(conn, model.__tablename__, index.name):
+                index.create(bind=conn)
+
+
+def _group_version(conn: Connection):
+    if not _has_column(conn, "groups", "version"):
+        conn.execute(text("ALTER TABLE groups ADD COLUMN version INTEGER NOT NULL DEFAULT 0"))
+
+
+def _idempotency_keys(conn: Connection):
+    models.IdempotencyKey.__table__.create(bind=conn, checkfirst=True)
+
+
+def _history_indexes(conn: Connection):
+    for model, name in ((models.Expense, "ix_expenses_group_created_id"),
+                        (models.Settlement, "ix_settlements_group_created_id")):
+        index = next(ix for ix in model.__table__.indexes if ix.name == name)
+        if not _has_index(conn, model.__tablename__, name):
+            index.create(bind=conn)
+
+
+def _balance_checkpoints(conn: Connection):
+    models.BalanceCheckpoint.__table__.create(bind=conn, checkfirst=True)
+    models.BalanceCheckpointEntry.__table__.create(bind=conn, checkfirst=True)
+
+
+def _currencies(conn: Connection):
+    if not _has_column(conn, "groups", "base_currency"):
+        conn.execute(text("ALTER TABLE groups ADD COLUMN base_currency VARCHAR NOT NULL DEFAULT 'USD'"))
+    if not _has_column(conn, "settlements", "currency"):
+        conn.execute(text("ALTER TABLE settlements ADD COLUMN currency VARCHAR NOT NULL DEFAULT 'USD'"))
+    conn.execute(text("UPDATE expenses SET currency = UPPER(COALESCE(currency, 'USD'))"))
+    # The ledger and checkpoints gain a currency dimension. Both are derived
+    # from history, so they are recreated empty; the ledger is backfilled per
+    # group on first touch and new checkpoints accrue as groups are written.
+    for table in (models.BalanceCheckpointEntry.__table__, models.BalanceCheckpoint.__table__,
+                  models.GroupBalance.__table__):
+        table.drop(bind=conn, checkfirst=True)
+    for table in (models.GroupBalance.__table__, models.BalanceCheckpoint.__table__,
+                  models.BalanceCheckpointEntry.__table__):
+        table.create(bind=conn)
+
+
+USER_INDEXES = {
+    "ix_expense_payers_user_expense": ("expense_payers", "user_id, expense_id"),
+    "ix_expense_shares_user_expense": ("expense_shares", "user_id, expense_id"),
+    "ix_settlements_payer": ("settlements", "payer_id"),
+    "ix_settlements_payee": ("settlements", "payee_id"),
+}
+
+
+def _user_indexes(conn: Connection):
+    # Served the user summary's per-expense scan; migration 13 drops them again.
+    for name, (table, columns) in USER_INDEXES.items():
+        if not _has_index(conn, table, name):
+            conn.execute(text(f"CREATE INDEX {name} ON {table} ({columns})"))
+
+
+def _drop_user_indexes(conn: Connection):
+    # The user summary reads the debt graph now; nothing else queries by user across groups.
+    for name, (table, _) in USER_INDEXES.items():
+        if _has_index(conn, table, name):
+            conn.execute(text(f"DROP INDEX {name}"))
+
+
+def _group_debts(conn: Connection):
+    models.GroupDebt.__table__.create(bind=conn, checkfirst=True)
+    # The debt graph is derived like the ledger and rebuilt together with it.
+    # Clearing the ledger makes every group backfill both on first touch.
+    conn.execute(text("DELETE FROM group_balances"))
+
+
+def _group_shards(conn: Connection):
+    models.GroupShard.__table__.create(bind=conn, checkfirst=True)
+
+
+def _idempotency_request_hash(conn: Connection):
+    if not _has_column(conn, "idempotency_keys", "request_hash"):
+        conn.execute(text("ALTER TABLE idempotency_keys ADD COLUMN request_hash VARCHAR"))
+
+
+def _money_storage(conn: Connection):
+    conn.execute(text("CREATE TABLE IF NOT EXISTS money_storage (unit VARCHAR NOT NULL)"))
+    if conn.execute(text("SELECT COUNT(*) FROM money_storage")).scalar() == 0:
+        conn.execute(text("INSERT INTO money_storage (unit) VALUES ('decimal')"))
+
+
+MIGRATIONS = [
+    (1, "create base tables", _create_tables),
+    (2, "composite indexes on hot foreign keys", _hot_path_indexes),
+    (3, "group version counter", _group_version),
+    (4, "idempotency keys for settlement batches", _idempotency_keys),
+    (5, "keyset indexes for expense and settlement history", _history_indexes),
+    (6, "balance checkpoints", _balance_checkpoints),
+    (7, "currencies on groups, settlements, ledger and checkpoints", _currencies),
+    (8, "money storage unit", _money_storage),
+    (9, "per-user indexes for cross-group summaries", _user_indexes),
+    (10, "pairwise debt graph", _group_debts),
+    (11, "shard directory", _group_shards),
+    (12, "request hashes on idempotency keys", _idempotency_request_hash),
+    (13, "drop per-user summary indexes", _drop_user_indexes),
+]
+
+
+def current_version(conn: Connection) -> int:
+    conn.execute(text("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)"))
+    return conn.execute(text("SELECT COALESCE(MAX(version), 0) FROM schema_version")).scalar()
+
+
+def convert_money_storage(engine: Engine, unit: str) -> bool:
+    """Rewrite every money column into ``unit`` ("cents" or "decimal").
+
+    Does nothing and returns False if the data is already stored that way.
+    """
+    if unit not in ("cents", "decimal"):
+        raise ValueError("unit must be 'cents' or 'decimal'")
+    with engine.begin() as conn:
+        if conn.execute(text("SELECT unit FROM money_storage")).scalar() == unit:
+            return False
+        postgres = conn.dialect.name == "postgresql"
+        for table, column in MONEY_COLUMNS:
+            if postgres:
+                new_type, expr = ("BIGINT", f"ROUND({column} * 100)") if unit == "cents" \
+                    else ("NUMERIC(12, 2)", f"{column} / 100.0")
+                conn.execute(text(f"ALTER TABLE {table} ALTER COLUMN {column} TYPE {new_type} USING {expr}"))
+            else:
+                expr = f"CAST(ROUND({column} * 100) AS INTEGER)" if unit == "cents" else f"{column} / 100.0"
+                conn.execute(text(f"UPDATE {table} SET {column} = {expr}"))
+        conn.execute(text("UPDATE money_storage SET unit = :unit"), {"unit": unit})
+    return True
+
+
+def run_migrations(engine: Engine = None) -> int:
+    """Apply every pending migration and return the resulting schema version.
+
+    Also converts the money columns if EXPENSE_MONEY_CENTS has changed.
+    """
+    engine = engine or default_engine
+    with engine.begin() as conn:
+        version = current_version(conn)
+    for number, _, fn in MIGRATIONS:
+        if number <= version:
+            continue
+        with engine.begin() as conn:
+            fn(conn)
+            conn.execute(text("INSERT INTO schema_version (version) VALUES (:v)"), {"v": number})
+        version = number
+    convert_money_storage(engine, "cents" if config.MONEY_AS_CENTS else "decimal")
+    return version
@@ -1,15 +1,44 @@
 # app/models.py
-from sqlalchemy import Column, Integer, String, ForeignKey, Numeric, DateTime, Enum
+from sqlalchemy import Column, Integer, BigInteger, String, Text, ForeignKey, Numeric, DateTime, Enum, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
+from sqlalchemy.types import TypeDecorator
 from .database import Base
+from . import config
+from .splits import from_cents
 from decimal import Decimal
 import enum
 import datetime
 
+class Amount(TypeDecorator):
+    """Money column: Numeric(12, 2), or 64-bit integer cents with EXPENSE_MONEY_CENTS.
+
+    Python code always sees Decimal. In cents mode SUMs run over integers in
+    the database, and each result is turned into a Decimal once on the way out.
+    """
+    impl = Numeric(12, 2)
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        return dialect.type_descriptor(BigInteger() if config.MONEY_AS_CENTS else Numeric(12, 2))
+
+    def process_bind_param(self, value, dialect):
+        if value is None or not config.MONEY_AS_CENTS:
+            return value
+        if isinstance(value, float):
+            value = Decimal(repr(value))
+        # Amounts are validated/quantized to two places before they get here.
+        return int(value * 100)
+
+    def process_result_value(self, value, dialect):
+        if value is None or not config.MONEY_AS_CENTS:
+            return value
+        return from_cents(value)
+
 class SplitType(str, enum.Enum):
     equal = "equal"
     exact = "exact"
     percentage = "percentage"
+    weighted = "weighted"
 
 class User(Base):
     __tablename__ = "users"
@@ -21,41 +50,129 @@ class Group(Base):
     __tablename__ = "groups"
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False)
+    # Bumped by every write that can change the group's balances; read-side
+    # caches key on it.
+    version = Column(Integer, nullable=False, default=0, server_default="0")
+    # Balances are reported in this currency; expenses in other currencies
+    # are converted with the rate table (see rates.py).
+    base_currency = Column(String, nullable=False, default="USD", server_default="USD")
 
 class GroupMember(Base):
     __tablename__ = "group_members"
+    __table_args__ = (UniqueConstraint("group_id", "user_id", name="uq_group_members_group_user"),)
     id = Column(Integer, primary_key=True, index=True)
     group_id = Column(Integer, ForeignKey("groups.id"))
     user_id = Column(Integer, ForeignKey("users.id"))
 
 class Expense(Base):
     __tablename__ = "expenses"
+    __table_args__ = (
+        Index("ix_expenses_group_id_id", "group_id", "id"),
+        Index("ix_expenses_group_created_id", "group_id", "created_at", "id"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     group_id = Column(Integer, ForeignKey("groups.id"))
     description = Column(String, nullable=True)
-    amount = Column(Numeric(12, 2), nullable=False)
+    amount = Column(Amount, nullable=False)
     currency = Column(String, default="USD")
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    payers = relationship("ExpensePayer", order_by="ExpensePayer.id")
+    shares = relationship("ExpenseShare", order_by="ExpenseShare.id")
 
 class ExpensePayer(Base):
     __tablename__ = "expense_payers"
+    __table_args__ = (
+        Index("ix_expense_payers_expense_user_amount", "expense_id", "user_id", "amount"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     expense_id = Column(Integer, ForeignKey("expenses.id"))
     user_id = Column(Integer, ForeignKey("users.id"))
-    amount = Column(Numeric(12, 2), nullable=False)
+    amount = Column(Amount, nullable=False)
 
 class ExpenseShare(Base):
     __tablename__ = "expense_shares"
+    __table_args__ = (
+        Index("ix_expense_shares_expense_user_amount", "expense_id", "user_id", "amount"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     expense_id = Column(Integer, ForeignKey("expenses.id"))
     user_id = Column(Integer, ForeignKey("users.id"))
-    amount = Column(Numeric(12, 2), nullable=False)
+    amount = Column(Amount, nullable=False)
 
 class Settlement(Base):
     __tablename__ = "settlements"
+    __table_args__ = (
+        Index("ix_settlements_group_payer_amount", "group_id", "payer_id", "amount"),
+        Index("ix_settlements_group_payee_amount", "group_id", "payee_id", "amount"),
+        Index("ix_settlements_group_created_id", "group_id", "created_at", "id"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     group_id = Column(Integer, ForeignKey("groups.id"))
     payer_id = Column(Integer, ForeignKey("users.id"))
     payee_id = Column(Integer, ForeignKey("users.id"))
-    amount = Column(Numeric(12,2), nullable=False)
+    amount = Column(Amount, nullable=False)
+    currency = Column(String, nullable=False, default="USD", server_default="USD")
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class GroupBalance(Base):
+    """Running net balance per (group, user, currency), updated alongside every write."""
+    __tablename__ = "group_balances"
+    __table_args__ = (UniqueConstraint("group_id", "user_id", "currency"),)
+    id = Column(Integer, primary_key=True, index=True)
+    group_id = Column(Integer, ForeignKey("groups.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    currency = Column(String, nullable=False, default="USD")
+    net = Column(Amount, nullable=False, default=0)
+
+class GroupDebt(Base):
+    """What user_a owes user_b in a group and currency, updated alongside every write.
+
+    Each pair is stored once, with user_a < user_b; a negative amount means
+    user_b owes user_a.
+    """
+    __tablename__ = "group_debts"
+    __table_args__ = (UniqueConstraint("group_id", "user_a", "user_b", "currency", name="uq_group_debts_pair"),)
+    id = Column(Integer, primary_key=True, index=True)
+    group_id = Column(Integer, ForeignKey("groups.id"), nullable=False)
+    user_a = Column(Integer, ForeignKey("users.id"), nullable=False)
+    user_b = Column(Integer, ForeignKey("users.id"), nullable=False)
+    currency = Column(String, nullable=False, default="USD")
+    amount = Column(Amount, nullable=False, default=0)
+
+class IdempotencyKey(Base):
+    """Stored result of a keyed write, replayed when a client retries with the same key."""
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (UniqueConstraint("group_id", "key", name="uq_idempotency_keys_group_key"),)
+    id = Column(Integer, primary_key=True, index=True)
+    group_id = Column(Integer, ForeignKey("groups.id"), nullable=False)
+    key = Column(String, nullable=False)
+    # Hash of the request the key was first used with; NULL for keys stored before it was recorded.
+    request_hash = Column(String, nullable=True)
+    response = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class GroupShard(Base):
+    """Which shard database holds a group's ledger; lives in the home database (see sharding.py).
+
+    Groups without a row are on shard 0, the home database itself.
+    """
+    __tablename__ = "group_shards"
+    group_id = Column(Integer, primary_key=True, autoincrement=False)
+    shard = Column(Integer, nullable=False, index=True)
+
+class BalanceCheckpoint(Base):
+    """Every user's net balance in a group as of ``taken_at``."""
+    __tablename__ = "balance_checkpoints"
+    __table_args__ = (Index("ix_balance_checkpoints_group_taken", "group_id", "taken_at"),)
+    id = Column(Integer, primary_key=True, index=True)
+    group_id = Column(Integer, ForeignKey("groups.id"), nullable=False)
+    taken_at = Column(DateTime, nullable=False)
+    entries = relationship("BalanceCheckpointEntry")
+
+class BalanceCheckpointEntry(Base):
+    __tablename__ = "balance_checkpoint_entries"
+    id = Column(Integer, primary_key=True, index=True)
+    checkpoint_id = Column(Integer, ForeignKey("balance_checkpoints.id"), nullable=False, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    currency = Column(String, nullable=False, default="USD")
+    net = Column(Amount, nullable=False)
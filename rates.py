@@ -0,0 +1,108 @@
+# app/rates.py
+"""Exchange rates loaded from a local CSV or JSON file.
+
+Each row gives the value of one unit of ``currency`` in the reference
+currency (``config.RATES_REFERENCE``), effective from ``effective_date``
+until the next row for that currency:
+
+    currency,rate,effective_date
+    EUR,1.08,2024-01-01
+    EUR,1.11,2024-07-01
+
+JSON files hold a list of objects with the same keys. The reference
+currency always has rate 1. The table lives in memory, and cross rates
+are cached per (from, to, date) until the table is reloaded.
+"""
+import bisect
+import csv
+import datetime
+import json
+import threading
+from decimal import Decimal
+from typing import Dict, List, Tuple
+from . import config
+
+
+def normalize_currency(code: str) -> str:
+    code = (code or "").strip().upper()
+    if len(code) != 3 or not code.isalpha():
+        raise ValueError(f"Invalid currency code {code!r}")
+    return code
+
+
+class RateTable:
+    def __init__(self, reference: str = "USD"):
+        self.reference = normalize_currency(reference)
+        self._rates: Dict[str, Tuple[List[datetime.date], List[Decimal]]] = {}
+        self._cross: Dict[tuple, Decimal] = {}
+        self._lock = threading.Lock()
+        # Bumped on every change, so callers can tell when converted results are stale.
+        self.generation = 0
+
+    def add(self, currency: str, rate, effective_date: datetime.date):
+        currency = normalize_currency(currency)
+        rate = Decimal(str(rate))
+        if rate <= 0:
+            raise ValueError(f"Rate for {currency} must be positive")
+        with self._lock:
+            dates, values = self._rates.setdefault(currency, ([], []))
+            i = bisect.bisect_left(dates, effective_date)
+            if i < len(dates) and dates[i] == effective_date:
+                values[i] = rate
+            else:
+                dates.insert(i, effective_date)
+                values.insert(i, rate)
+            self._cross.clear()
+            self.generation += 1
+
+    def load_rows(self, rows):
+        for row in rows:
+            effective = row["effective_date"]
+            if isinstance(effective, str):
+                effective = datetime.date.fromisoformat(effective)
+            self.add(row["currency"], row["rate"], effective)
+
+    def load_file(self, path: str):
+        with open(path, newline="") as f:
+            if path.lower().endswith(".json"):
+                self.load_rows(json.load(f))
+            else:
+                self.load_rows(csv.DictReader(f))
+
+    def clear(self):
+        with self._lock:
+            self._rates.clear()
+            self._cross.clear()
+            self.generation += 1
+
+    def currencies(self) -> List[str]:
+        return sorted(set(self._rates) | {self.reference})
+
+    def _rate(self, currency: str, on: datetime.date) -> Decimal:
+        if currency == self.reference:
+            return Decimal(1)
+        dates, values = self._rates.get(currency, ((), ()))
+        i = bisect.bisect_right(dates, on)
+        if i == 0:
+            raise ValueError(f"No exchange rate for {currency} on {on.isoformat()}")
+        return values[i - 1]
+
+    def rate(self, from_currency: str, to_currency: str, on: datetime.date = None) -> Decimal:
+        """Units of ``to_currency`` per unit of ``from_currency`` on date ``on``."""
+        if from_currency == to_currency:
+            return Decimal(1)
+        on = on or datetime.date.today()
+        key = (from_currency, to_currency, on)
+        cached = self._cross.get(key)
+        if cached is None:
+            cached = self._rate(from_currency, on) / self._rate(to_currency, on)
+            self._cross[key] = cached
+        return cached
+
+    def convert(self, amount: Decimal, from_currency: str, to_currency: str, on: datetime.date = None) -> Decimal:
+        return (Decimal(amount) * self.rate(from_currency, to_currency, on)).quantize(Decimal("0.01"))
+
+
+rate_table = RateTable(config.RATES_REFERENCE)
+if config.RATES_FILE:
+    rate_table.load_file(config.RATES_FILE)
@@ -0,0 +1,216 @@
+# app/replica.py
+"""Read/write routing: group reads on a read-only pool, with bounded staleness and read-your-writes.
+
+Writes always go to the primary pool. That covers add_expense,
+add_settlement, simplify_debts and every other crud writer. The read
+endpoints get their session from get_read_db: balances, debts, expense and
+settlement history, and simplify plans. get_read_db hands out a read-pool
+session unless:
+
+- the client sent an ``X-Min-Version: <group_id>:<version>`` token and the
+  read pool's copy of that group is older. This is read-your-writes: group
+  responses carry ``X-Group-Version`` with the version written or read, and
+  the client sends it back on its next read. Tokens for other groups are
+  ignored; several can be given, comma-separated.
+- this process committed a write to the group that the read pool does not
+  show yet, and that write is older than READ_MAX_STALENESS_MS.
+
+In both cases the primary answers instead. The default read pool is the main
+SQLite file opened read-only. It sees every commit as soon as it happens, so
+under WAL it only takes load off the primary pool and never waits on the
+writer. The checks matter when READ_DATABASE_URL points at a real replica
+that can fall behind.
+"""
+import contextvars
+import threading
+import time
+from collections import deque
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+from . import config, metrics, models
+from .database import (PoolMetrics, SessionLocal, _is_memory_sqlite, apply_sqlite_pragmas, engine_options,
+                       get_group_db)
+
+
+def read_url(url: str) -> str:
+    """``url``'s SQLite file opened read-only, e.g. sqlite:///./x.db -> sqlite:///file:./x.db?mode=ro&uri=true."""
+    if not url.startswith("sqlite") or _is_memory_sqlite(url) or "?" in url:
+        raise ValueError("Set EXPENSE_READ_DATABASE_URL; only a plain SQLite file URL can be reopened read-only")
+    scheme, path = url.split(":///", 1)
+    return f"{scheme}:///file:{path}?mode=ro&uri=true"
+
+
+class ReadPool:
+    """The read-only engine and its sessions, with counters of where reads were served."""
+
+    def __init__(self, url: str, pool_size: int = 10):
+        options = engine_options(url)
+        if "pool_size" in options:
+            options["pool_size"] = pool_size
+        self.engine = create_engine(url, **options)
+        apply_sqlite_pragmas(self.engine, read_only=True)
+        metrics.instrument_engine(self.engine)
+        self.pool_metrics = PoolMetrics(self.engine)
+        self.sessions = sessionmaker(bind=self.engine, autoflush=False, autocommit=False)
+        self.served = 0
+        self.fallbacks = {"token": 0, "stale": 0}
+        self._lock = threading.Lock()
+
+    def count(self, fallback: str = None):
+        with self._lock:
+            if fallback is None:
+                self.served += 1
+            else:
+                self.fallbacks[fallback] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"served": self.served, "fallbacks": dict(self.fallbacks), "pool": self.pool_metrics.snapshot()}
+
+
+class WriteLog:
+    """Versions this process committed per group, with their commit times, until the read pool shows them.
+
+    Keeps at most ``maxlen`` versions per group. Beyond that the oldest are
+    dropped, and staleness is measured from the oldest version still kept.
+    """
+
+    def __init__(self, maxlen: int = 1024):
+        self.maxlen = maxlen
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def record(self, group_id: int, version: int):
+        with self._lock:
+            self._pending.setdefault(group_id, deque(maxlen=self.maxlen)).append((version, time.monotonic()))
+
+    def pending(self, group_id: int) -> bool:
+        return group_id in self._pending
+
+    def staleness(self, group_id: int, read_version: int) -> float:
+        """Seconds since the oldest write the read pool does not show yet (at ``read_version``); 0 if none."""
+        with self._lock:
+            writes = self._pending.get(group_id)
+            while writes and writes[0][0] <= read_version:
+                writes.popleft()
+            if not writes:
+                self._pending.pop(group_id, None)
+                return 0.0
+            return time.monotonic() - writes[0][1]
+
+    def clear(self):
+        with self._lock:
+            self._pending.clear()
+
+
+write_log = WriteLog()
+
+# ------------------ VERSION TOKENS --------------------
+
+class ReadState:
+    """Per-request: the client's minimum versions, and the version to report back."""
+
+    def __init__(self, min_versions: dict):
+        self.min_versions = min_versions
+        self.group_version = None
+
+
+_state: contextvars.ContextVar = contextvars.ContextVar("expense_read_state", default=None)
+
+
+def parse_tokens(header: str) -> dict:
+    """``"12:340, 7:5"`` -> {12: 340, 7: 5}; malformed tokens are ignored."""
+    tokens = {}
+    for token in (header or "").split(","):
+        group_id, _, version = token.strip().partition(":")
+        if group_id.isdigit() and version.isdigit():
+            tokens[int(group_id)] = max(int(version), tokens.get(int(group_id), 0))
+    return tokens
+
+
+def note_write(group_id: int, version: int):
+    """Called by crud after a write to the group commits."""
+    if config.READ_POOL:
+        write_log.record(group_id, version)
+    state = _state.get()
+    if state is not None:
+        state.group_version = (group_id, version)
+
+
+class ConsistencyMiddleware:
+    """ASGI middleware: reads the X-Min-Version tokens and adds the X-Group-Version token."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        header = dict(scope.get("headers") or []).get(b"x-min-version", b"").decode("latin-1")
+        state = ReadState(parse_tokens(header))
+        token = _state.set(state)
+
+        async def send_with_version(message):
+            if message["type"] == "http.response.start" and state.group_version is not None:
+                group_id, version = state.group_version
+                message = {**message, "headers": list(message.get("headers", [])) + [
+                    (b"x-group-version", f"{group_id}:{version}".encode()),
+                ]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_version)
+        finally:
+            _state.reset(token)
+
+# ------------------ READ SESSIONS --------------------
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ReadPool:
+    """The process-wide read pool, configured from config."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ReadPool(config.READ_DATABASE_URL or read_url(config.DATABASE_URL), config.READ_POOL_SIZE)
+    return _pool
+
+
+def read_session(group_id: int):
+    """A read-pool session if it may serve ``group_id`` for this request, else a primary session."""
+    pool = get_pool()
+    state = _state.get()
+    min_version = state.min_versions.get(group_id) if state is not None else None
+    db = pool.sessions()
+    # Reads that find no ledger backfill it on the primary (see crud._ensure_ledger).
+    db.info["primary"] = SessionLocal
+    if min_version is None and not write_log.pending(group_id):
+        pool.count()
+        return db
+    version = db.execute(select(models.Group.version).where(models.Group.id == group_id)).scalar()
+    if version is not None and version >= (min_version or 0) and \
+            write_log.staleness(group_id, version) <= config.READ_MAX_STALENESS_MS / 1000:
+        # The read pool may be behind the version writes published; crud keys cached reads on this one.
+        db.info["group_version"] = version
+        if state is not None:
+            state.group_version = (group_id, version)
+        pool.count()
+        return db
+    db.close()
+    pool.count("token" if min_version is not None and (version or 0) < min_version else "stale")
+    return SessionLocal()
+
+
+def get_read_db(group_id: int):
+    """get_group_db for the read endpoints under /groups/{group_id}."""
+    if not config.READ_POOL:
+        yield from get_group_db(group_id)
+        return
+    db = read_session(group_id)
+    try:
+        yield db
+    finally:
+        db.close()
@@ -10,6 +10,7 @@ class UserCreate(BaseModel):
 
 class GroupCreate(BaseModel):
     name: str
+    base_currency: Optional[str] = "USD"
 
 class AddMember(BaseModel):
     user_id: int
@@ -25,15 +26,20 @@ class ExpenseShareSchema(BaseModel):
 class ExpenseCreate(BaseModel):
     description: Optional[str] = None
     amount: Money
-    currency: Optional[str] = "USD"
+    currency: Optional[str] = None   # None means the group's base currency
     paid_by: List[ExpensePayerSchema]
     split_type: str
     splits: Optional[List[ExpenseShareSchema]] = None
     percentages: Optional[Dict[int, condecimal(max_digits=5, decimal_places=2)]] = None
     users: Optional[List[int]] = None
+    weights: Optional[Dict[int, condecimal(max_digits=12, decimal_places=4)]] = None
 
 
 class SettlementCreate(BaseModel):
     payer_id: int
     payee_id: int
-    amount: Money
\ No newline at end of file
+    amount: Money
+    currency: Optional[str] = None
+
+class SettlementBatch(BaseModel):
+    transfers: List[SettlementCreate]
@@ -0,0 +1,309 @@
+# app/sharding.py
+"""Horizontal sharding of group ledgers over several databases.
+
+Each group's rows live together in one shard database. That covers the group
+row, its members, expenses with their payers and shares, settlements, the
+balance ledger, the debt graph, checkpoints and idempotency keys. Every query
+in crud is scoped to a single group, so a request only needs a session on the
+right shard. SQLite serializes writers per database file, so groups on
+different shards stop queueing behind each other.
+
+- Shard 0 is the home database (DATABASE_URL). It also holds the users and
+  the ``group_shards`` directory. Groups created before sharding was enabled
+  stay there, so no data migration is needed.
+- Each new group gets an ID from the directory and goes to shard
+  ``group_id % SHARDS``. The directory is authoritative, not that formula,
+  so move_group can relocate a group afterwards.
+- Shard sessions bind the User model to the home engine, so crud's user
+  checks work on any shard without changes.
+
+Rebalancing tool:
+
+    python -m app.sharding status
+    python -m app.sharding move GROUP_ID SHARD
+    python -m app.sharding rebalance [--dry-run]
+
+A move first bumps the group's version on the source shard. That fences the
+group and holds the source's write lock until the move ends. The rows are
+then copied to the target with new row IDs, the directory is repointed and
+the source rows are deleted. Expense, settlement and other row IDs change;
+group and user IDs stay the same. Other processes keep sending requests to
+the old shard until their directory cache expires (SHARD_DIRECTORY_TTL).
+Writes that arrive there fail with "Group does not exist" and are not lost,
+but reads see an empty group. Move groups while they are quiet, or keep the
+TTL short.
+"""
+import argparse
+import json
+import threading
+from collections import defaultdict
+from sqlalchemy import create_engine, delete, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+from . import config, crud, metrics, models
+from .cache import TTLCache
+from .database import PoolMetrics, apply_sqlite_pragmas, engine as home_engine, engine_options, pool_metrics
+from .rates import normalize_currency
+
+
+def shard_urls(count: int, template: str) -> list:
+    """URLs of shards 1..count-1; shard 0 is the home database."""
+    return [template.format(n=n) for n in range(1, count)]
+
+
+def _ledger_tables(group_id: int) -> list:
+    """(model, filter for the group's rows, {column: table its IDs refer to}), parents first."""
+    E, C = models.Expense, models.BalanceCheckpoint
+    expense_ids = select(E.id).where(E.group_id == group_id)
+    checkpoint_ids = select(C.id).where(C.group_id == group_id)
+    return [
+        (models.Group, models.Group.id == group_id, {}),
+        (models.GroupMember, models.GroupMember.group_id == group_id, {}),
+        (E, E.group_id == group_id, {}),
+        (models.ExpensePayer, models.ExpensePayer.expense_id.in_(expense_ids), {"expense_id": "expenses"}),
+        (models.ExpenseShare, models.ExpenseShare.expense_id.in_(expense_ids), {"expense_id": "expenses"}),
+        (models.Settlement, models.Settlement.group_id == group_id, {}),
+        (models.GroupBalance, models.GroupBalance.group_id == group_id, {}),
+        (models.GroupDebt, models.GroupDebt.group_id == group_id, {}),
+        (models.IdempotencyKey, models.IdempotencyKey.group_id == group_id, {}),
+        (C, C.group_id == group_id, {}),
+        (models.BalanceCheckpointEntry, models.BalanceCheckpointEntry.checkpoint_id.in_(checkpoint_ids),
+         {"checkpoint_id": "balance_checkpoints"}),
+    ]
+
+
+class ShardRouter:
+    """Maps group IDs to shard databases and opens sessions on them."""
+
+    def __init__(self, home, urls, directory_ttl: float = 30):
+        self.home = home
+        self.engines = [home]
+        self.pool_metrics = [pool_metrics if home is home_engine else PoolMetrics(home)]
+        for url in urls:
+            engine = create_engine(url, **engine_options(url))
+            apply_sqlite_pragmas(engine)
+            metrics.instrument_engine(engine)
+            self.engines.append(engine)
+            self.pool_metrics.append(PoolMetrics(engine))
+        # Users live on the home database only; the bind lets crud query them from any shard's session.
+        self.sessions = [
+            sessionmaker(bind=engine, binds={models.User: home}, autoflush=False, autocommit=False)
+            for engine in self.engines
+        ]
+        self.directory = TTLCache(maxsize=100_000, ttl=directory_ttl)
+
+    def __len__(self):
+        return len(self.engines)
+
+    def migrate(self):
+        """Bring every shard other than the home database up to the current schema."""
+        from .migrations import run_migrations
+        for engine in self.engines[1:]:
+            run_migrations(engine)
+
+    def place(self, group_id: int) -> int:
+        """The shard a new group goes to."""
+        return group_id % len(self.engines)
+
+    def shard_of(self, group_id: int, fresh: bool = False) -> int:
+        shard = None if fresh else self.directory.get(group_id)
+        if shard is None:
+            with self.home.connect() as conn:
+                shard = conn.execute(
+                    select(models.GroupShard.shard).where(models.GroupShard.group_id == group_id)
+                ).scalar()
+            if shard is None:
+                # A group from before sharding, or no such group: the home database answers. Not cached,
+                # so a group created by another process is found as soon as it exists.
+                return 0
+            self.directory.set(group_id, shard)
+        return shard
+
+    def session_for(self, group_id: int):
+        return self.sessions[self.shard_of(group_id)]()
+
+    def create_group(self, name: str, base_currency: str = "USD"):
+        base_currency = normalize_currency(base_currency or "USD")
+        group_id = self._allocate()
+        db = self.session_for(group_id)
+        try:
+            return crud.create_group(db, name, base_currency, group_id=group_id)
+        finally:
+            db.close()
+
+    def _allocate(self) -> int:
+        """Reserve a group ID above every ID in the directory and in the home groups table."""
+        D, G = models.GroupShard, models.Group
+        while True:
+            try:
+                with self.home.begin() as conn:
+                    group_id = max(conn.execute(select(func.max(D.group_id))).scalar() or 0,
+                                   conn.execute(select(func.max(G.id))).scalar() or 0) + 1
+                    conn.execute(insert(D).values(group_id=group_id, shard=self.place(group_id)))
+            except IntegrityError:
+                continue  # Another process took the same ID first.
+            self.directory.set(group_id, self.place(group_id))
+            return group_id
+
+    def user_balance_summary(self, db, user_id: int, currency: str = None, use_cache: bool = True):
+        """crud.user_balance_summary over every shard; ``db`` is a home database session."""
+        shard_dbs = [make() for make in self.sessions[1:]]
+        try:
+            return crud.user_balance_summary(db, user_id, currency, use_cache, shard_dbs=shard_dbs)
+        finally:
+            for shard_db in shard_dbs:
+                shard_db.close()
+
+    def status(self) -> list:
+        shards = []
+        for n, engine in enumerate(self.engines):
+            with engine.connect() as conn:
+                groups = conn.execute(select(func.count()).select_from(models.Group)).scalar()
+                expenses = conn.execute(select(func.count()).select_from(models.Expense)).scalar()
+            shards.append({"shard": n, "url": str(engine.url), "groups": groups, "expenses": expenses,
+                           "pool": self.pool_metrics[n].snapshot()})
+        return shards
+
+    # ------------------ REBALANCING --------------------
+
+    def move_group(self, group_id: int, target: int) -> dict:
+        """Move a group's rows to shard ``target``; returns the number of rows copied per table."""
+        if not 0 <= target < len(self.engines):
+            raise ValueError(f"No shard {target}")
+        source = self.shard_of(group_id, fresh=True)
+        result = {"group_id": group_id, "from": source, "to": target, "rows": {}}
+        if source == target:
+            return result
+        G = models.Group
+        with self.engines[source].connect() as src, self.engines[target].connect() as dst:
+            src_tx = src.begin()
+            try:
+                # First write of the transaction: it takes the source shard's write lock until the
+                # move ends, and writers that read the old version retry (and find the group moved).
+                if not src.execute(update(G).where(G.id == group_id).values(version=G.version + 1)).rowcount:
+                    raise ValueError("Group does not exist")
+                with dst.begin():
+                    self._delete(dst, group_id)  # leftovers of an interrupted move
+                    result["rows"] = self._copy(src, dst, group_id)
+                if source == 0:
+                    # The home database is the source and src already holds its write lock.
+                    self._point(src, group_id, target)
+                else:
+                    with self.home.begin() as conn:
+                        self._point(conn, group_id, target)
+                self._delete(src, group_id)
+                src_tx.commit()
+            except BaseException:
+                src_tx.rollback()
+                raise
+        self.directory.set(group_id, target)
+        return result
+
+    def plan_rebalance(self) -> list:
+        """Moves that even out the shards' loads, weighing each group by its expenses (plus one).
+
+        Repeatedly takes the largest group on the busiest shard that is
+        smaller than the gap to the idlest shard, so every move narrows it.
+        """
+        loads = []
+        for engine in self.engines:
+            with engine.connect() as conn:
+                counts = dict(conn.execute(
+                    select(models.Expense.group_id, func.count()).group_by(models.Expense.group_id)
+                ).all())
+                group_ids = conn.execute(select(models.Group.id)).scalars().all()
+            loads.append({gid: counts.get(gid, 0) + 1 for gid in group_ids})
+        moves = []
+        while True:
+            totals = [sum(groups.values()) for groups in loads]
+            busiest, idlest = totals.index(max(totals)), totals.index(min(totals))
+            gap = totals[busiest] - totals[idlest]
+            candidates = [(weight, gid) for gid, weight in loads[busiest].items() if weight < gap]
+            if not candidates:
+                return moves
+            weight, gid = max(candidates)
+            loads[idlest][gid] = loads[busiest].pop(gid)
+            moves.append({"group_id": gid, "from": busiest, "to": idlest, "weight": weight})
+
+    def rebalance(self, dry_run: bool = False) -> list:
+        moves = self.plan_rebalance()
+        if not dry_run:
+            for move in moves:
+                move["rows"] = self.move_group(move["group_id"], move["to"])["rows"]
+        return moves
+
+    @staticmethod
+    def _point(conn, group_id: int, shard: int):
+        D = models.GroupShard
+        if not conn.execute(update(D).where(D.group_id == group_id).values(shard=shard)).rowcount:
+            conn.execute(insert(D).values(group_id=group_id, shard=shard))
+
+    @staticmethod
+    def _copy(src, dst, group_id: int) -> dict:
+        new_ids = defaultdict(dict)
+        counts = {}
+        for model, where, refs in _ledger_tables(group_id):
+            table = model.__table__
+            rows = [dict(row) for row in src.execute(select(table).where(where).order_by(table.c.id)).mappings()]
+            counts[table.name] = len(rows)
+            if not rows:
+                continue
+            if model is not models.Group:
+                # Row IDs are per shard: renumber above the target's, keeping their order.
+                start = (dst.execute(select(func.max(table.c.id))).scalar() or 0) + 1
+                for offset, row in enumerate(rows):
+                    new_ids[table.name][row["id"]] = row["id"] = start + offset
+                    for column, parent in refs.items():
+                        row[column] = new_ids[parent][row[column]]
+            dst.execute(insert(table), rows)
+        return counts
+
+    @staticmethod
+    def _delete(conn, group_id: int):
+        for model, where, _ in reversed(_ledger_tables(group_id)):
+            conn.execute(delete(model.__table__).where(where))
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router() -> ShardRouter:
+    """The process-wide router, configured from config."""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = ShardRouter(home_engine, shard_urls(config.SHARDS, config.SHARD_URL_TEMPLATE),
+                                      config.SHARD_DIRECTORY_TTL)
+    return _router
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and rebalance group shards (EXPENSE_SHARDS).")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("status", help="groups, expenses and pool metrics per shard")
+    move = commands.add_parser("move", help="move one group to another shard")
+    move.add_argument("group_id", type=int)
+    move.add_argument("shard", type=int)
+    rebalance = commands.add_parser("rebalance", help="even out expenses across shards")
+    rebalance.add_argument("--dry-run", action="store_true", help="print the moves without making them")
+    args = parser.parse_args()
+    if config.SHARDS <= 1:
+        parser.error("sharding is off; set EXPENSE_SHARDS to the number of shards")
+
+    from .migrations import run_migrations
+    run_migrations()
+    router = get_router()
+    router.migrate()
+    if args.command == "status":
+        result = router.status()
+    elif args.command == "move":
+        result = router.move_group(args.group_id, args.shard)
+    else:
+        result = router.rebalance(args.dry_run)
+    print(json.dumps(result, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
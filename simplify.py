@@ -0,0 +1,137 @@
+# app/simplify.py
+"""Debt simplification strategies.
+
+Each strategy takes ``{user_id: net}`` (positive = owed money) and returns the
+transfers that settle it as ``(payer_id, payee_id, amount)`` tuples. Nothing
+here touches the database; ``crud.simplify_debts`` records the result.
+
+- ``greedy``: repeatedly match the largest debtor with the largest creditor.
+  Never needs more than n-1 transfers, but misses subsets of members whose
+  balances already net to zero among themselves.
+- ``exact``: finds the minimum number of transfers. It splits members into
+  the largest number of zero-sum subsets with a bitmask DP, then settles each
+  subset greedily. n members in k subsets need n-k transfers. Cost is
+  O(n * 2^n), so it refuses groups above ``config.SIMPLIFY_EXACT_MAX_MEMBERS``.
+- ``auto``: ``exact`` when it is feasible, ``greedy`` otherwise.
+"""
+import heapq
+from decimal import Decimal
+from typing import Dict, List, Tuple
+from . import config
+
+Transfer = Tuple[int, int, Decimal]
+CENT = Decimal("0.01")
+
+
+def _cents(balances: Dict[int, Decimal]) -> Dict[int, int]:
+    return {uid: int((Decimal(amt) / CENT).to_integral_value()) for uid, amt in balances.items() if amt}
+
+
+def greedy(balances: Dict[int, Decimal]) -> List[Transfer]:
+    # Build min-heap for debtors and max-heap for creditors (negated for heapq)
+    debtors = []
+    creditors = []
+    for uid, amt in balances.items():
+        if amt < 0:
+            heapq.heappush(debtors, (amt, uid))        # amt negative
+        elif amt > 0:
+            heapq.heappush(creditors, (-amt, uid))     # amt positive, negate for max-heap
+
+    transfers = []
+    while debtors and creditors:
+        debt_amt, debtor_uid = heapq.heappop(debtors)
+        credit_amt, creditor_uid = heapq.heappop(creditors)
+        settle_amt = min(-debt_amt, -credit_amt)
+        transfers.append((debtor_uid, creditor_uid, settle_amt))
+
+        new_debt = debt_amt + settle_amt
+        new_credit = credit_amt + settle_amt
+        if new_debt < 0:
+            heapq.heappush(debtors, (new_debt, debtor_uid))
+        if new_credit < 0:
+            heapq.heappush(creditors, (new_credit, creditor_uid))
+    return transfers
+
+
+def _zero_sum_partition(values: List[int]) -> List[List[int]]:
+    """Split indexes of ``values`` (which sum to zero) into the most zero-sum groups."""
+    n = len(values)
+    full = (1 << n) - 1
+    sums = [0] * (full + 1)
+    dp = [0] * (full + 1)   # dp[mask]: most zero-sum groups the members in mask can form
+    for mask in range(1, full + 1):
+        low = mask & -mask
+        sums[mask] = sums[mask ^ low] + values[low.bit_length() - 1]
+        best, rest = 0, mask
+        while rest:
+            bit = rest & -rest
+            if dp[mask ^ bit] > best:
+                best = dp[mask ^ bit]
+            rest ^= bit
+        dp[mask] = best + 1 if sums[mask] == 0 else best
+
+    # Walk back from the full set, removing one member at a time along an
+    # optimal path. Every time the remainder sums to zero, the members removed
+    # since the previous zero-sum remainder form one group.
+    groups, current, mask = [], [], full
+    while mask:
+        target = dp[mask] - (1 if sums[mask] == 0 else 0)
+        rest = mask
+        while rest:
+            bit = rest & -rest
+            if dp[mask ^ bit] == target:
+                break
+            rest ^= bit
+        current.append(bit.bit_length() - 1)
+        mask ^= bit
+        if sums[mask] == 0:
+            groups.append(current)
+            current = []
+    return groups
+
+
+def exact(balances: Dict[int, Decimal]) -> List[Transfer]:
+    cents = _cents(balances)
+    if sum(cents.values()) != 0:
+        raise ValueError("Balances do not net to zero; exact simplification needs a closed group")
+
+    # A member owed exactly what another owes is always its own group in some
+    # optimal solution, so pair those off before the exponential search.
+    transfers, by_amount, remaining = [], {}, []
+    for uid in sorted(cents):
+        match = by_amount.get(-cents[uid])
+        if match:
+            other = match.pop()
+            payer, payee = (uid, other) if cents[uid] < 0 else (other, uid)
+            transfers.append((payer, payee, abs(cents[uid]) * CENT))
+        else:
+            by_amount.setdefault(cents[uid], []).append(uid)
+    for amount, uids in by_amount.items():
+        remaining.extend((uid, amount) for uid in uids)
+    remaining.sort()
+
+    if len(remaining) > config.SIMPLIFY_EXACT_MAX_MEMBERS:
+        raise ValueError(
+            f"Exact simplification supports at most {config.SIMPLIFY_EXACT_MAX_MEMBERS} "
+            f"members with open balances, got {len(remaining)}"
+        )
+    if remaining:
+        for group in _zero_sum_partition([amount for _, amount in remaining]):
+            transfers.extend(greedy({remaining[i][0]: remaining[i][1] * CENT for i in group}))
+    return transfers
+
+
+def auto(balances: Dict[int, Decimal]) -> List[Transfer]:
+    try:
+        return exact(balances)
+    except ValueError:
+        return greedy(balances)
+
+
+STRATEGIES = {"greedy": greedy, "exact": exact, "auto": auto}
+
+
+def plan_transfers(balances: Dict[int, Decimal], strategy: str = "auto") -> List[Transfer]:
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown simplification strategy {strategy!r}; choose from {', '.join(STRATEGIES)}")
+    return STRATEGIES[strategy](balances)
@@ -0,0 +1,110 @@
+# app/splits.py
+"""Split engine working in integer cents.
+
+Every splitter takes the expense total in cents and returns a dict of
+user_id -> cents that always sums to the total. Proportional splits use
+largest-remainder rounding: each user gets the floor of their exact share,
+and the cents left over go one at a time to the largest remainders, ties
+going to whoever is listed first. The result is deterministic and never
+drifts by a penny, whatever the number of participants.
+
+The work is done a column at a time (list comprehensions over plain ints,
+one sort for the remainders) rather than with per-user Decimal arithmetic.
+"""
+from decimal import ROUND_FLOOR, Decimal
+from functools import lru_cache
+from typing import Dict, Iterable, List, Tuple
+
+
+def to_cents(amount) -> int:
+    cents = Decimal(amount) * 100
+    if cents != cents.to_integral_value():
+        raise ValueError(f"Amount {amount} has more than two decimal places")
+    return int(cents)
+
+
+@lru_cache(maxsize=65536)
+def from_cents(cents: int) -> Decimal:
+    return Decimal(cents).scaleb(-2)
+
+
+def to_decimals(shares: Dict[int, int]) -> Dict[int, Decimal]:
+    """Convert a split to Decimal amounts, building each distinct amount once."""
+    amounts = {c: from_cents(c) for c in set(shares.values())}
+    return {uid: amounts[c] for uid, c in shares.items()}
+
+
+def _collect(users: List[int], cents: List[int]) -> Dict[int, int]:
+    shares = dict(zip(users, cents))
+    if len(shares) != len(users):
+        # A user listed more than once gets the sum of their parts.
+        shares = {}
+        for uid, c in zip(users, cents):
+            shares[uid] = shares.get(uid, 0) + c
+    return shares
+
+
+def _integer_weights(weights: List[Decimal]) -> List[int]:
+    """Scale decimal weights by a common power of ten so they become integers."""
+    distinct = set(weights)
+    places = max(0, max((-Decimal(w).as_tuple().exponent for w in distinct), default=0))
+    scaled = {w: int(Decimal(w).scaleb(places)) for w in distinct}
+    return [scaled[w] for w in weights]
+
+
+def apportion(total: int, users: List[int], weights: List[int]) -> Dict[int, int]:
+    """Split ``total`` cents across ``users`` in proportion to integer ``weights``."""
+    weight_sum = sum(weights)
+    if weight_sum <= 0:
+        raise ValueError("Weights must add up to more than zero")
+    exact = [total * w for w in weights]
+    cents = [q // weight_sum for q in exact]
+    leftover = total - sum(cents)
+    if leftover:
+        remainders = [q % weight_sum for q in exact]
+        # Stable sort, so equal remainders keep their input order.
+        for i in sorted(range(len(users)), key=remainders.__getitem__, reverse=True)[:leftover]:
+            cents[i] += 1
+    return _collect(users, cents)
+
+
+def round_to_total(total: int, exact: Dict[int, Decimal]) -> Dict[int, int]:
+    """Round exact, possibly negative, cent amounts to whole cents that sum to ``total``.
+
+    Largest remainder as in apportion. If the exact amounts do not add up to
+    ``total`` the difference is first spread evenly.
+    """
+    users = list(exact)
+    if not users:
+        return {}
+    cents = [int(exact[uid].to_integral_value(ROUND_FLOOR)) for uid in users]
+    remainders = [exact[uid] - c for uid, c in zip(users, cents)]
+    spread, extra = divmod(total - sum(cents), len(users))
+    cents = [c + spread for c in cents]
+    for i in sorted(range(len(users)), key=remainders.__getitem__, reverse=True)[:extra]:
+        cents[i] += 1
+    return dict(zip(users, cents))
+
+
+def equal(total: int, users: List[int]) -> Dict[int, int]:
+    base, extra = divmod(total, len(users))
+    return _collect(users, [base + 1] * extra + [base] * (len(users) - extra))
+
+
+def exact(total: int, amounts: Iterable[Tuple[int, int]]) -> Dict[int, int]:
+    users, cents = zip(*amounts)
+    if sum(cents) != total:
+        raise ValueError("Sum of exact splits must equal total amount")
+    return _collect(list(users), list(cents))
+
+
+def percentage(total: int, percentages: Iterable[Tuple[int, Decimal]]) -> Dict[int, int]:
+    users, pcts = zip(*percentages)
+    if sum(pcts) != Decimal("100"):
+        raise ValueError("Percentages must sum to 100")
+    return apportion(total, list(users), _integer_weights(list(pcts)))
+
+
+def weighted(total: int, weights: Iterable[Tuple[int, Decimal]]) -> Dict[int, int]:
+    users, values = zip(*weights)
+    return apportion(total, list(users), _integer_weights(list(values)))
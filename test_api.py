@@ -1,5 +1,7 @@
+import json
 import pytest
 from fastapi.testclient import TestClient
+from app.cache import CacheBackend
 from app.main import app
 
 client = TestClient(app)
@@ -23,6 +25,15 @@ def add_expense(group_id, payload):
     r = client.post(f"/groups/{group_id}/expenses", json=payload)
     assert r.status_code == 200
 
+@pytest.fixture
+def eur_rates():
+    from datetime import date
+    from app import crud
+    from app.rates import rate_table
+    rate_table.add("EUR", "1.10", date(2000, 1, 1))
+    yield
+    crud.reload_rates()
+
 def add_expense_should_fail(group_id, payload):
     r = client.post(f"/groups/{group_id}/expenses", json=payload)
     assert r.status_code == 400
@@ -100,6 +111,33 @@ def test_percentage_split():
     assert round(balances[u1], 2) == 80.00
     assert round(balances[u2], 2) == -80.00
 
+def test_weighted_and_percentage_splits_sum_to_total():
+    gid = create_group("Split Rounding")
+    u1, u2, u3 = create_user("User1"), create_user("User2"), create_user("User3")
+    for uid in (u1, u2, u3):
+        add_member(gid, uid)
+    add_expense(gid, {
+        "amount": 10.00,
+        "paid_by": [{"user_id": u1, "amount": 10.00}],
+        "split_type": "weighted",
+        "weights": {str(u1): 2, str(u2): 1, str(u3): 1}
+    })
+    assert get_balances(gid) == {u1: 5.0, u2: -2.5, u3: -2.5}
+    add_expense(gid, {
+        "amount": 10.00,
+        "paid_by": [{"user_id": u1, "amount": 10.00}],
+        "split_type": "percentage",
+        "percentages": {str(u1): 33.33, str(u2): 33.33, str(u3): 33.34}
+    })
+    # 3.333 / 3.333 / 3.334: the leftover cent goes to the largest remainder.
+    assert get_balances(gid) == {u1: 11.67, u2: -5.83, u3: -5.84}
+    add_expense_should_fail(gid, {
+        "amount": 10.00,
+        "paid_by": [{"user_id": u1, "amount": 10.00}],
+        "split_type": "weighted",
+        "weights": {str(u1): 0, str(u2): 0}
+    })
+
 def test_settling_debt():
     gid = create_group("Trip to Goa")
     u1, u2 = create_user("User1"), create_user("User2")
@@ -252,3 +290,1012 @@ def test_currency_mismatch():
     else:
         pass
 
+def test_balance_ledger_matches_recompute():
+    gid = create_group("Ledger Check")
+    u1, u2, u3 = create_user("User1"), create_user("User2"), create_user("User3")
+    for uid in (u1, u2, u3):
+        add_member(gid, uid)
+    add_expense(gid, {
+        "description": "Hotel",
+        "amount": 100.00,
+        "paid_by": [{"user_id": u1, "amount": 100.00}],
+        "split_type": "equal",
+        "users": [u1, u2, u3]
+    })
+    settle_debt(gid, payer_id=u2, payee_id=u1, amount=10.00)
+    simplify(gid)
+    r = client.get(f"/groups/{gid}/balances/check")
+    assert r.status_code == 200
+    assert r.json() == {"consistent": True, "mismatches": []}
+    r = client.post(f"/groups/{gid}/balances/rebuild")
+    assert r.status_code == 200
+    assert get_balances(gid) == {u1: 0.0, u2: 0.0, u3: 0.0}
+
+def test_add_member_twice_keeps_one_membership():
+    gid = create_group("Duplicate Member")
+    u1 = create_user("User1")
+    r1 = client.post(f"/groups/{gid}/members", json={"user_id": u1})
+    r2 = client.post(f"/groups/{gid}/members", json={"user_id": u1})
+    assert r1.status_code == r2.status_code == 200
+    assert r1.json()["id"] == r2.json()["id"]
+    assert list(get_balances(gid)) == [u1]
+
+def test_bulk_expenses_reports_per_item_errors():
+    gid = create_group("Bulk Import")
+    u1, u2 = create_user("User1"), create_user("User2")
+    for uid in (u1, u2):
+        add_member(gid, uid)
+    good = {
+        "description": "Lunch",
+        "amount": 20.00,
+        "paid_by": [{"user_id": u1, "amount": 20.00}],
+        "split_type": "equal",
+        "users": [u1, u2]
+    }
+    bad = dict(good, paid_by=[{"user_id": 88888, "amount": 20.00}])
+    r = client.post(f"/groups/{gid}/expenses:bulk", json=[good, bad, {"amount": "oops"}, good])
+    assert r.status_code == 200
+    body = r.json()
+    assert body["created"] == 2
+    assert [("id" in item) for item in body["results"]] == [True, False, False, True]
+    assert body["results"][1]["error"] == "User 88888 does not exist"
+    assert get_balances(gid) == {u1: 20.0, u2: -20.0}
+
+def test_bulk_expenses_atomic_and_ndjson():
+    gid = create_group("Bulk Atomic")
+    u1, u2 = create_user("User1"), create_user("User2")
+    for uid in (u1, u2):
+        add_member(gid, uid)
+    good = {
+        "amount": 10.00,
+        "paid_by": [{"user_id": u2, "amount": 10.00}],
+        "split_type": "exact",
+        "splits": [{"user_id": u1, "amount": 10.00}]
+    }
+    bad = dict(good, amount=-10.00)
+    r = client.post(f"/groups/{gid}/expenses:bulk?atomic=true", json=[good, bad])
+    assert r.status_code == 400
+    assert r.json()["detail"]["errors"][0]["index"] == 1
+    assert get_balances(gid) == {u1: 0.0, u2: 0.0}
+
+    ndjson = "\n".join(json.dumps(good) for _ in range(3))
+    r = client.post(f"/groups/{gid}/expenses:bulk", content=ndjson,
+                    headers={"Content-Type": "application/x-ndjson"})
+    assert r.status_code == 200
+    assert r.json()["created"] == 3
+    assert get_balances(gid) == {u1: -30.0, u2: 30.0}
+
+    # Chunks that split lines anywhere, with a blank line and a bad line in between.
+    body = (json.dumps(good) + "\n\n" + json.dumps(bad) + "\n" + json.dumps(good)).encode()
+    chunks = [body[i:i + 7] for i in range(0, len(body), 7)]
+    r = client.post(f"/groups/{gid}/expenses:bulk", content=iter(chunks),
+                    headers={"Content-Type": "application/x-ndjson"})
+    assert r.status_code == 200
+    assert [("id" in item, item["index"]) for item in r.json()["results"]] == [(True, 0), (False, 1), (True, 2)]
+    assert get_balances(gid) == {u1: -50.0, u2: 50.0}
+
+def test_validation_cache_counts_hits():
+    before = client.get("/admin/cache").json()["users"]
+    gid = create_group("Cache Group")
+    u1, u2 = create_user("User1"), create_user("User2")
+    for uid in (u1, u2):
+        add_member(gid, uid)
+    add_expense(gid, {
+        "amount": 10.00,
+        "paid_by": [{"user_id": u1, "amount": 10.00}],
+        "split_type": "equal",
+        "users": [u1, u2]
+    })
+    after = client.get("/admin/cache").json()["users"]
+    assert after["hits"] >= before["hits"] + 2
+    assert set(after) == {"size", "hits", "misses", "hit_ratio"}
+
+def test_async_routes_share_the_ledger():
+    pytest.importorskip("aiosqlite")
+    from fastapi import FastAPI
+    from app import database
+    from app.routers import async_groups
+
+    aengine, async_session = database.make_async_sessionmaker(
+        database.async_url(database.SQLALCHEMY_DATABASE_URL)
+    )
+
+    async def override():
+        async with async_session() as db:
+            yield db
+
+    async_app = FastAPI()
+    async_app.include_router(async_groups.router)
+    async_app.dependency_overrides[database.get_async_db] = override
+    async_client = TestClient(async_app)
+
+    gid = create_group("Async Group")
+    u1, u2 = create_user("User1"), create_user("User2")
+    for uid in (u1, u2):
+        add_member(gid, uid)
+    r = async_client.post(f"/groups/{gid}/expenses", json={
+        "amount": 40.00,
+        "paid_by": [{"user_id": u1, "amount": 40.00}],
+        "split_type": "equal",
+        "users": [u1, u2]
+    })
+    assert r.status_code == 200
+    r = async_client.post(f"/groups/{gid}/settle", json={"payer_id": u2, "payee_id": u1, "amount": 5.00})
+    assert r.status_code == 200
+    r = async_client.get(f"/groups/{gid}/expenses/balances")
+    assert {item["user_id"]: item["net"] for item in r.json()} == {u1: 15.0, u2: -15.0}
+    assert get_balances(gid) == {u1: 15.0, u2: -15.0}
+
+def test_pool_metrics_and_sqlite_pragmas():
+    from app.database import engine
+    create_group("Pool Metrics")
+    stats = client.get("/admin/pool").json()
+    assert stats["checkouts"] >= 1
+    assert stats["wait"]["count"] >= 1
+    assert stats["checked_out"] == 0  # every earlier request returned its connection
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+        assert conn.exec_driver_sql("PRAGMA busy_timeout").scalar() > 0
+
+def test_exact_simplification_uses_fewer_transfers():
+    from decimal import Decimal
+    from app.simplify import plan_transfers
+    # Two independent zero-sum triples: 2 and 3 owe 1, 5 and 6 owe 4.
+    balances = {1: Decimal("7.00"), 2: Decimal("-3.00"), 3: Decimal("-4.00"),
+                4: Decimal("6.00"), 5: Decimal("-1.00"), 6: Decimal("-5.00")}
+    greedy = plan_transfers(balances, "greedy")
+    exact = plan_transfers(balances, "exact")
+    assert len(greedy) == 5
+    assert len(exact) == 4
+    settled = dict(balances)
+    for payer, payee, amount in exact:
+        settled[payer] += amount
+        settled[payee] -= amount
+    assert all(v == 0 for v in settled.values())
+
+def test_simplify_strategy_parameter():
+    gid = create_group("Simplify Strategy")
+    u1, u2, u3 = create_user("User1"), create_user("User2"), create_user("User3")
+    for uid in (u1, u2, u3):
+        add_member(gid, uid)
+    add_expense(gid, {
+        "amount": 30.00,
+        "paid_by": [{"user_id": u1, "amount": 30.00}],
+        "split_type": "equal",
+        "users": [u1, u2, u3]
+    })
+    r = client.post(f"/groups/{gid}/simplify?strategy=bogus")
+    assert r.status_code == 400
+    r = client.post(f"/groups/{gid}/simplify?strategy=exact")
+    assert r.status_code == 200
+    assert get_balances(gid) == {u1: 0.0, u2: 0.0, u3: 0.0}
+
+def test_simplify_plan_is_read_only_and_cached():
+    gid = create_group("Plan Preview")
+    u1, u2 = create_user("User1"), create_user("User2")
+    for uid in (u1, u2):
+        add_member(gid, uid)
+    add_expense(gid, {
+        "amount": 10.00,
+        "paid_by": [{"user_id": u1, "amount": 10.00}],
+        "split_type": "equal",
+        "users": [u1, u2]
+    })
+    first = client.get(f"/groups/{gid}/simplify/plan").json()
+    assert first["transfers"] == [{"payer_id": u2, "payee_id": u1, "amount": 5.0, "currency": "USD"}]
+    assert get_balances(gid) == {u1: 5.0, u2: -5.0}
+
+    hits = client.get("/admin/cache").json()["simplify_plans"]["hits"]
+    assert client.get(f"/groups/{gid}/simplify/plan").json() == first
+    assert client.get("/admin/cache").json()["simplify_plans"]["hits"] == hits + 1
+
+    settle_debt(gid, payer_id=u2, payee_id=u1, amount=5.00)
+    after = client.get(f"/groups/{gid}/simplify/plan").json()
+    assert after["version"] > first["version"]
+    assert after["transfers"] == []
+
+def test_settlement_batch_is_validated_together_and_idempotent():
+    gid = create_group("Batch Settle")
+    u1, u2, u3 = create_user("User1"), create_user("User2"), create_user("User3")
+    for uid in (u1, u2, u3):
+        add_member(gid, uid)
+    add_expense(gid, {
+        "amount": 30.00,
+        "paid_by": [{"user_id": u1, "amount": 30.00}],
+        "split_type": "equal",
+        "users": [u1, u2, u3]
+    })
+    # Each transfer alone is fine, together they over-settle u2.
+    r = client.post(f"/groups/{gid}/settlements:batch", json={"transfers": [
+        {"payer_id": u2, "payee_id": u1, "amount": 6.00},
+        {"payer_id": u2, "payee_id": u1, "amount": 6.00},
+    ]})
+    assert r.status_code == 400
+    assert r.json()["detail"].startswith("Transfer 1:")
+    assert get_balances(gid) == {u1: 20.0, u2: -10.0, u3: -10.0}
+
+    batch = {"transfers": [
+        {"payer_id": u2, "payee_id": u1, "amount": 10.00},
+        {"payer_id": u3, "payee_id": u1, "amount": 4.00},
+    ]}
+    headers = {"Idempotency-Key": f"batch-{gid}"}
+    first = client.post(f"/groups/{gid}/settlements:batch", json=batch, headers=headers)
+    retry = client.post(f"/groups/{gid}/settlements:batch", json=batch, headers=headers)
+    assert first.status_code == retry.status_code == 200
+    assert first.json()["replayed"] is False
+    assert retry.json()["replayed"] is True
+    assert retry.json()["settlement_ids"] == first.json()["settlement_ids"]
+    assert get_balances(gid) == {u1: 6.0, u2: 0.0, u3: -6.0}
+
+    batch["transfers"][1]["amount"] = 6.00
+    r = client.post(f"/groups/{gid}/settlements:batch", json=batch, headers=headers)
+    assert r.status_code == 422
+    assert get_balances(gid) == {u1: 6.0, u2: 0.0, u3: -6.0}
+
+def test_expense_and_settlement_history_pagination(eur_rates):
+    gid = create_group("History")
+    u1, u2, u3 = create_user("User1"), create_user("User2"), create_user("User3")
+    for uid in (u1, u2, u3):
+        add_member(gid, uid)
+    for i in range(5):
+        add_expense(gid, {
+            "description": f"Coffee {i}",
+            "amount": 6.00,
+            "currency": "EUR" if i == 4 else "USD",
+            "paid_by": [{"user_id": u1, "amount": 6.00}],
+            "split_type": "exact",
+            "splits": [{"user_id": u2 if i % 2 else u3, "amount": 6.00}]
+        })
+    settle_debt(gid, payer_id=u2, payee_id=u1, amount=2.00)
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 2} if cursor is None else {"limit": 2, "cursor": cursor}
+        page = client.get(f"/groups/{gid}/expenses", params=params).json()
+        seen += [item["description"] for item in page["items"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == [f"Coffee {i}" for i in reversed(range(5))]
+
+    page = client.get(f"/groups/{gid}/expenses", params={"user_id": u2}).json()
+    assert [item["description"] for item in page["items"]] == ["Coffee 3", "Coffee 1"]
+    assert page["items"][0]["shares"] == [{"user_id": u2, "amount": 6.0}]
+    page = client.get(f"/groups/{gid}/expenses", params={"currency": "EUR"}).json()
+    assert [item["description"] for item in page["items"]] == ["Coffee 4"]
+    assert client.get(f"/groups/{gid}/expenses", params={"currency": "eur"}).json()["items"] == page["items"]
+
+    page = client.get(f"/groups/{gid}/settlements", params={"user_id": u1}).json()
+    assert [(s["payer_id"], s["payee_id"], s["amount"]) for s in page["items"]] == [(u2, u1, 2.0)]
+    assert client.get(f"/groups/{gid}/expenses", params={"cursor": "nope"}).status_code == 400
+
+def test_balances_as_of_with_checkpoints():
+    import time
+    from datetime import datetime
+
+    gid = create_group("Month End")
+    u1, u2 = create_user("User1"), create_user("User2")
+    for uid in (u1, u2):
+        add_member(gid, uid)
+    expense = {
+        "amount": 10.00,
+        "paid_by": [{"user_id": u1, "amount": 10.00}],
+        "split_type": "exact",
+        "splits": [{"user_id": u2, "amount": 10.00}]
+    }
+    add_expense(gid, expense)
+    time.sleep(0.01)
+    first_cut = datetime.utcnow().isoformat()
+    time.sleep(0.01)
+    add_expense(gid, expense)
+    r = client.post(f"/groups/{gid}/balances/checkpoints")
+    assert r.status_code == 200
+    time.sleep(0.01)
+    second_cut = datetime.utcnow().isoformat()
+    time.sleep(0.01)
+    settle_debt(gid, payer_id=u2, payee_id=u1, amount=5.00)
+
+    def as_of(ts):
+        r = client.get(f"/groups/{gid}/balances", params={"as_of": ts})
+        assert r.status_code == 200
+        return {item["user_id"]: item["net"] for item in r.json()}
+
+    assert as_of(first_cut) == {u1: 10.0, u2: -10.0}
+    assert as_of(second_cut) == {u1: 20.0, u2: -20.0}
+    assert as_of(datetime.utcnow().isoformat()) == get_balances(gid) == {u1: 15.0, u2: -15.0}
+
+def test_add_member_to_missing_group():
+    uid = create_user("Loner")
+    r = client.post("/groups/999999/members", json={"user_id": uid})
+    assert r.status_code == 400
+    assert r.json()["detail"] == "Group does not exist"
+
+def test_checkpoint_waits_for_an_uncommitted_write(monkeypatch):
+    import threading
+    import time
+    from datetime import datetime
+    from app import crud, schemas
+    from app.database import SessionLocal
+
+    gid = create_group("Checkpoint Race")
+    a, b = create_user("RaceA"), create_user("RaceB")
+    for uid in (a, b):
+        add_member(gid, uid)
+    flushed = threading.Event()
+    due = crud._checkpoint_if_due
+
+    def slow_commit(db, group_id, version):
+        due(db, group_id, version)
+        if group_id == gid:
+            db.flush()
+            flushed.set()
+            time.sleep(0.3)
+
+    monkeypatch.setattr(crud, "_checkpoint_if_due", slow_commit)
+    expense = schemas.ExpenseCreate(amount=100.0, paid_by=[{"user_id": a, "amount": 100.0}],
+                                    split_type="equal", users=[a, b])
+
+    def write():
+        db = SessionLocal()
+        try:
+            crud.add_expense(db, gid, expense)
+        finally:
+            db.close()
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    assert flushed.wait(5)
+    # The writer has flushed its expense but holds its commit back.
+    r = client.post(f"/groups/{gid}/balances/checkpoints")
+    writer.join()
+    assert r.status_code == 200
+    r = client.get(f"/groups/{gid}/balances", params={"as_of": datetime.utcnow().isoformat()})
+    assert {item["user_id"]: item["net"] for item in r.json()} == get_balances(gid) == {a: 50.0, b: -50.0}
+
+def test_future_checkpoints_are_refused_and_ignored():
+    from datetime import datetime, timedelta
+    from app import models
+    from app.database import SessionLocal
+
+    gid = create_group("Ahead")
+    u1, u2 = create_user("User1"), create_user("User2")
+    for uid in (u1, u2):
+        add_member(gid, uid)
+    expense = {
+        "amount": 10.00,
+        "paid_by": [{"user_id": u1, "amount": 10.00}],
+        "split_type": "exact",
+        "splits": [{"user_id": u2, "amount": 10.00}]
+    }
+    add_expense(gid, expense)
+    tomorrow = datetime.utcnow() + timedelta(days=1)
+    r = client.post(f"/groups/{gid}/balances/checkpoints", params={"at": tomorrow.isoformat()})
+    assert r.status_code == 400
+
+    # A future checkpoint left by an older release is not used before its time.
+    db = SessionLocal()
+    try:
+        checkpoint = models.BalanceCheckpoint(group_id=gid, taken_at=tomorrow)
+        checkpoint.entries = [models.BalanceCheckpointEntry(user_id=u1, currency="USD", net=10),
+                              models.BalanceCheckpointEntry(user_id=u2, currency="USD", net=-10)]
+        db.add(checkpoint)
+        db.commit()
+    finally:
+        db.close()
+    add_expense(gid, expense)
+    r = client.get(f"/groups/{gid}/balances", params={"as_of": (tomorrow + timedelta(days=1)).isoformat()})
+    assert {item["user_id"]: item["net"] for item in r.json()} == {u1: 20.0, u2: -20.0}
+
+def test_multi_currency_balances(eur_rates):
+    from datetime import date
+    from app.rates import rate_table
+    gid = create_group("Trip Abroad")
+    u1, u2, u3 = create_user("User1"), create_user("User2"), create_user("User3")
+    for uid in (u1, u2, u3):
+        add_member(gid, uid)
+    add_expense(gid, {
+        "amount": 30.00,
+        "paid_by": [{"user_id": u1, "amount": 30.00}],
+        "split_type": "equal",
+        "users": [u1, u2, u3]
+    })
+    add_expense(gid, {
+        "amount": 10.00,
+        "currency": "eur",
+        "paid_by": [{"user_id": u2, "amount": 10.00}],
+        "split_type": "exact",
+        "splits": [{"user_id": u3, "amount": 10.00}]
+    })
+    add_expense_should_fail(gid, {
+        "amount": 10.00,
+        "currency": "GBP",
+        "paid_by": [{"user_id": u2, "amount": 10.00}],
+        "split_type": "exact",
+        "splits": [{"user_id": u3, "amount": 10.00}]
+    })
+
+    per_currency = client.get(f"/groups/{gid}/balances/currencies").json()
+    assert {b["user_id"]: b["balances"] for b in per_currency} == {
+        u1: {"USD": 20.0}, u2: {"EUR": 10.0, "USD": -10.0}, u3: {"EUR": -10.0, "USD": -10.0},
+    }
+    assert get_balances(gid) == {u1: 20.0, u2: 1.0, u3: -21.0}
+
+    plan = client.get(f"/groups/{gid}/simplify/plan", params={"currencies": "each"}).json()
+    assert sorted((t["payer_id"], t["payee_id"], t["amount"], t["currency"]) for t in plan["transfers"]) == sorted([
+        (u2, u1, 10.0, "USD"), (u3, u1, 10.0, "USD"), (u3, u2, 10.0, "EUR"),
+    ])
+    plan = client.get(f"/groups/{gid}/simplify/plan").json()
+    assert {t["currency"] for t in plan["transfers"]} == {"USD"}
+    assert sum(t["amount"] for t in plan["transfers"]) == 21.0
+    # A new rate changes the base-currency plan without any write to the group.
+    rate_table.add("EUR", "1.20", date(2000, 1, 2))
+    plan = client.get(f"/groups/{gid}/simplify/plan").json()
+    assert sum(t["amount"] for t in plan["transfers"]) == 22.0
+
+    r = client.post(f"/groups/{gid}/settle", json={"payer_id": u3, "payee_id": u2, "amount": 10.00, "currency": "EUR"})
+    assert r.status_code == 200
+    assert get_balances(gid) == {u1: 20.0, u2: -10.0, u3: -10.0}
+    r = client.post(f"/groups/{gid}/settle", json={"payer_id": u3, "payee_id": u2, "amount": 1.00, "currency": "EUR"})
+    assert r.status_code == 400
+    assert client.get(f"/groups/{gid}/balances/check").json()["consistent"] is True
+
+def test_money_storage_conversion_round_trip(tmp_path):
+    from sqlalchemy import create_engine, text
+    from app.migrations import convert_money_storage, run_migrations
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'money.db'}")
+    run_migrations(engine)
+    convert_money_storage(engine, "decimal")
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO expense_shares (expense_id, user_id, amount) VALUES (1, 1, 12.34), (1, 2, 0.1)"))
+
+    def stored():
+        with engine.connect() as conn:
+            return conn.execute(text("SELECT amount, typeof(amount) FROM expense_shares ORDER BY id")).all()
+
+    assert convert_money_storage(engine, "cents") is True
+    assert stored() == [(1234, "integer"), (10, "integer")]
+    assert convert_money_storage(engine, "cents") is False
+    assert convert_money_storage(engine, "decimal") is True
+    assert stored() == [(12.34, "real"), (0.1, "real")]
+
+def test_export_ledger_ndjson_and_csv():
+    import csv
+    import io
+
+    gid = create_group("Archive")
+    u1, u2 = create_user("User1"), create_user("User2")
+    for uid in (u1, u2):
+        add_member(gid, uid)
+    for i in range(3):
+        add_expense(gid, {
+            "description": f"Dinner {i}",
+            "amount": 20.00,
+            "paid_by": [{"user_id": u1, "amount": 20.00}],
+            "split_type": "equal",
+            "users": [u1, u2]
+        })
+    settle_debt(gid, payer_id=u2, payee_id=u1, amount=5.00)
+
+    r = client.get(f"/groups/{gid}/export")
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    records = [json.loads(line) for line in r.text.splitlines()]
+    assert [rec["type"] for rec in records] == ["expense"] * 3 + ["settlement"]
+    assert records[0]["description"] == "Dinner 0"
+    assert records[0]["payers"] == [{"user_id": u1, "amount": 20.0}]
+    assert records[0]["shares"] == [{"user_id": u1, "amount": 10.0}, {"user_id": u2, "amount": 10.0}]
+    assert (records[3]["payer_id"], records[3]["payee_id"], records[3]["amount"]) == (u2, u1, 5.0)
+
+    r = client.get(f"/groups/{gid}/export", params={"format": "csv"})
+    assert r.status_code == 200
+    rows = list(csv.DictReader(io.StringIO(r.text)))
+    assert [row["type"] for row in rows] == ["payer", "share", "share"] * 3 + ["settlement"]
+    assert rows[-1]["payee_id"] == str(u1)
+
+    assert client.get(f"/groups/{gid}/export", params={"format": "xml"}).status_code == 400
+    assert client.get("/groups/999999/export").status_code == 400
+
+def test_user_balance_summary_across_groups():
+    g1, g2 = create_group("Flat"), create_group("Holiday")
+    u1, u2, u3 = create_user("User1"), create_user("User2"), create_user("User3")
+    for uid in (u1, u2, u3):
+        add_member(g1, uid)
+    for uid in (u1, u2):
+        add_member(g2, uid)
+    add_expense(g1, {
+        "amount": 30.00,
+        "paid_by": [{"user_id": u1, "amount": 30.00}],
+        "split_type": "equal",
+        "users": [u1, u2, u3]
+    })
+    add_expense(g2, {
+        "amount": 20.00,
+        "paid_by": [{"user_id": u2, "amount": 20.00}],
+        "split_type": "equal",
+        "users": [u1, u2]
+    })
+
+    summary = client.get(f"/users/{u1}/balances").json()
+    assert summary["total"] == 10.0
+    assert [(g["group_id"], g["net"]) for g in summary["groups"]] == [(g1, 20.0), (g2, -10.0)]
+    assert summary["counterparties"] == [{"user_id": u3, "net": 10.0}]
+
+    settle_debt(g2, payer_id=u1, payee_id=u2, amount=10.00)
+    summary = client.get(f"/users/{u1}/balances").json()
+    assert [(g["group_id"], g["net"]) for g in summary["groups"]] == [(g1, 20.0), (g2, 0.0)]
+    assert summary["counterparties"] == [{"user_id": u2, "net": 10.0}, {"user_id": u3, "net": 10.0}]
+    assert sum(c["net"] for c in summary["counterparties"]) == summary["total"]
+    assert client.get(f"/users/{u1}/balances", params={"fresh": True}).json() == summary
+    assert client.get("/users/999999/balances").status_code == 400
+
+def test_user_summary_counterparties_add_up_after_conversion(eur_rates):
+    gid = create_group("Converted")
+    u1, u2, u3, u4 = (create_user(f"User{i}") for i in range(1, 5))
+    for uid in (u1, u2, u3, u4):
+        add_member(gid, uid)
+    add_expense(gid, {
+        "amount": 30.00,
+        "paid_by": [{"user_id": u1, "amount": 30.00}],
+        "split_type": "equal",
+        "users": [u1, u2, u3, u4]
+    })
+    # 22.50 USD is 20.4545... EUR; each 7.50 share is 6.8181... EUR.
+    summary = client.get(f"/users/{u1}/balances", params={"currency": "EUR", "fresh": True}).json()
+    assert summary["total"] == 20.45
+    assert summary["counterparties"] == [
+        {"user_id": u2, "net": 6.82}, {"user_id": u3, "net": 6.82}, {"user_id": u4, "net": 6.81}]
+
+def test_pairwise_debt_graph():
+    from sqlalchemy import event
+    from app.database import engine
+    gid = create_group("Debts")
+    u1, u2, u3 = create_user("User1"), create_user("User2"), create_user("User3")
+    for uid in (u1, u2, u3):
+        add_member(gid, uid)
+    add_expense(gid, {
+        "amount": 90.00,
+        "paid_by": [{"user_id": u1, "amount": 60.00}, {"user_id": u2, "amount": 30.00}],
+        "split_type": "equal",
+        "users": [u1, u2, u3]
+    })
+    settle_debt(gid, payer_id=u3, payee_id=u1, amount=10.00)
+
+    def edge_nets():
+        nets = {uid: 0.0 for uid in (u1, u2, u3)}
+        for d in client.get(f"/groups/{gid}/debts").json():
+            nets[d["creditor_id"]] += d["amount"]
+            nets[d["debtor_id"]] -= d["amount"]
+        return {uid: round(net, 2) for uid, net in nets.items()}
+
+    def balances():
+        return {b["user_id"]: b["net"] for b in client.get(f"/groups/{gid}/expenses/balances").json()}
+
+    # Each share is split 2:1 between u1 and u2, the ratio in which they paid.
+    debts = client.get(f"/groups/{gid}/debts").json()
+    assert debts == [
+        {"debtor_id": u2, "creditor_id": u1, "currency": "USD", "amount": 10.0},
+        {"debtor_id": u3, "creditor_id": u1, "currency": "USD", "amount": 10.0},
+        {"debtor_id": u3, "creditor_id": u2, "currency": "USD", "amount": 10.0},
+    ]
+    assert edge_nets() == balances()
+    # The user summary reads the same edges.
+    for uid in (u1, u2, u3):
+        summary = client.get(f"/users/{uid}/balances", params={"fresh": True}).json()
+        owed = {d["debtor_id"]: d["amount"] for d in debts if d["creditor_id"] == uid}
+        owes = {d["creditor_id"]: -d["amount"] for d in debts if d["debtor_id"] == uid}
+        assert {c["user_id"]: c["net"] for c in summary["counterparties"]} == {**owed, **owes}
+
+    client.post(f"/groups/{gid}/balances/rebuild")
+    assert client.get(f"/groups/{gid}/debts").json() == debts
+    client.post(f"/groups/{gid}/simplify")
+    assert edge_nets() == balances() == {u1: 0.0, u2: 0.0, u3: 0.0}
+    assert client.get("/groups/999999/debts").status_code == 400
+
+    # The summary costs the same number of queries however many expenses there are.
+    def summary_statements():
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(engine, "before_cursor_execute", listener)
+        try:
+            assert client.get(f"/users/{u3}/balances", params={"fresh": True}).status_code == 200
+        finally:
+            event.remove(engine, "before_cursor_execute", listener)
+        return len(statements)
+
+    before = summary_statements()
+    for _ in range(3):
+        add_expense(gid, {"amount": 3.00, "paid_by": [{"user_id": u3, "amount": 3.00}],
+                          "split_type": "equal", "users": [u1, u2, u3]})
+    assert summary_statements() == before
+
+class FakeCache(CacheBackend):
+    """Dict-backed stand-in for the response cache backend."""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def set(self, key, value):
+        self.data[key] = value
+
+    def invalidate(self, key):
+        self.data.pop(key, None)
+
+    def clear(self):
+        self.data.clear()
+
+    def stats(self):
+        return {"size": len(self.data)}
+
+def test_cache_backend_requires_every_method():
+    class GetOnly(CacheBackend):
+        def get(self, key, default=None):
+            return default
+
+    with pytest.raises(TypeError):
+        GetOnly()
+    assert FakeCache().stats() == {"size": 0}
+
+def test_balances_response_cache_and_etag():
+    from sqlalchemy import event, update
+    from app import crud, models
+    from app.database import engine
+    fake = FakeCache()
+    previous = crud.use_response_cache(fake)
+    try:
+        gid = create_group("Cached")
+        u1, u2 = create_user("User1"), create_user("User2")
+        add_member(gid, u1)
+        add_member(gid, u2)
+        add_expense(gid, {
+            "amount": 50.00,
+            "paid_by": [{"user_id": u1, "amount": 50.00}],
+            "split_type": "equal",
+            "users": [u1, u2]
+        })
+        url = f"/groups/{gid}/expenses/balances"
+        r = client.get(url)
+        etag = r.headers["ETag"]
+        assert {b["user_id"]: b["net"] for b in r.json()} == {u1: 25.0, u2: -25.0}
+        assert any(key[0] == "balances" and key[1] == gid for key in fake.data)
+
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(engine, "before_cursor_execute", listener)
+        try:
+            r = client.get(url, headers={"If-None-Match": etag})
+        finally:
+            event.remove(engine, "before_cursor_execute", listener)
+        assert r.status_code == 304 and r.headers["ETag"] == etag
+        # Only the version lookup; nothing reads the ledger.
+        assert len(statements) <= 1 and all("group_balances" not in s for s in statements)
+
+        # A write by another process (no crud call here) is seen at once.
+        with engine.begin() as conn:
+            conn.execute(update(models.GroupBalance).where(models.GroupBalance.group_id == gid)
+                         .values(net=models.GroupBalance.net + models.GroupBalance.net))
+            conn.execute(update(models.Group).where(models.Group.id == gid)
+                         .values(version=models.Group.version + 1))
+        r = client.get(url, headers={"If-None-Match": etag})
+        assert r.status_code == 200 and r.headers["ETag"] != etag
+        assert {b["user_id"]: b["net"] for b in r.json()} == {u1: 50.0, u2: -50.0}
+        etag = r.headers["ETag"]
+
+        settle_debt(gid, payer_id=u2, payee_id=u1, amount=10.00)
+        r = client.get(url, headers={"If-None-Match": etag})
+        assert r.status_code == 200 and r.headers["ETag"] != etag
+        assert {b["user_id"]: b["net"] for b in r.json()} == {u1: 40.0, u2: -40.0}
+        simplify(gid)
+        assert client.get(url, headers={"If-None-Match": r.headers["ETag"]}).json() == [
+            {"user_id": u1, "net": 0.0}, {"user_id": u2, "net": 0.0}
+        ]
+    finally:
+        crud.use_response_cache(previous)
+
+def test_rebuild_replaces_cached_balances():
+    from app import models
+    from app.database import SessionLocal
+    gid = create_group("Rebuilt")
+    u1, u2 = create_user("User1"), create_user("User2")
+    add_member(gid, u1)
+    add_member(gid, u2)
+    add_expense(gid, {"amount": 10.00, "paid_by": [{"user_id": u1, "amount": 10.00}],
+                      "split_type": "equal", "users": [u1, u2]})
+    db = SessionLocal()
+    db.query(models.GroupBalance).filter(models.GroupBalance.group_id == gid).update({"net": 999})
+    db.commit()
+    db.close()
+    assert get_balances(gid) == {u1: 999.0, u2: 999.0}
+    assert not client.get(f"/groups/{gid}/balances/check").json()["consistent"]
+
+    client.post(f"/groups/{gid}/balances/rebuild")
+    assert get_balances(gid) == {u1: 5.0, u2: -5.0}
+    assert client.get(f"/groups/{gid}/balances/check").json()["consistent"]
+
+def test_members_added_by_another_process_show_up():
+    from app import models
+    from app.database import SessionLocal
+    gid = create_group("Joined Elsewhere")
+    u1, u2, u3 = create_user("User1"), create_user("User2"), create_user("User3")
+    add_member(gid, u1)
+    add_member(gid, u2)
+    add_expense(gid, {"amount": 10.00, "paid_by": [{"user_id": u1, "amount": 10.00}],
+                      "split_type": "equal", "users": [u1, u2]})
+    assert get_balances(gid) == {u1: 5.0, u2: -5.0}
+
+    # Another process adds u3 and an expense u3 owes 10 of, without going through this one's crud.
+    db = SessionLocal()
+    db.query(models.Group).filter(models.Group.id == gid).update({"version": models.Group.version + 1})
+    db.add(models.GroupMember(group_id=gid, user_id=u3))
+    db.add(models.GroupBalance(group_id=gid, user_id=u3, currency="USD", net=-10))
+    db.query(models.GroupBalance).filter(models.GroupBalance.group_id == gid,
+                                         models.GroupBalance.user_id == u1).update({"net": 15})
+    db.commit()
+    db.close()
+    assert get_balances(gid) == {u1: 15.0, u2: -5.0, u3: -10.0}
+    plan = client.get(f"/groups/{gid}/simplify/plan").json()
+    assert sum(t["amount"] for t in plan["transfers"] if t["payer_id"] == u3) == 10.0
+
+def test_metrics_and_query_headers(monkeypatch):
+    from app import config
+    gid = create_group("Metrics")
+    u1, u2 = create_user("User1"), create_user("User2")
+    add_member(gid, u1)
+    add_member(gid, u2)
+    monkeypatch.setattr(config, "QUERY_HEADERS", True)
+    monkeypatch.setattr(config, "INGEST_QUEUE", False)
+    r = client.post(f"/groups/{gid}/expenses", json={
+        "amount": 10.00,
+        "paid_by": [{"user_id": u1, "amount": 10.00}],
+        "split_type": "equal",
+        "users": [u1, u2]
+    })
+    assert int(r.headers["X-Query-Count"]) > 0
+    timing = r.headers["Server-Timing"]
+    assert timing.startswith("db;dur=") and "add_expense;dur=" in timing and "total;dur=" in timing
+    monkeypatch.setattr(config, "QUERY_HEADERS", False)
+    assert "X-Query-Count" not in client.get(f"/groups/{gid}/expenses/balances").headers
+
+    text = client.get("/metrics").text
+    assert 'expense_http_request_duration_seconds_count{method="POST",route="/groups/{group_id}/expenses",status="200"}' in text
+    assert 'expense_span_duration_seconds_count{span="add_expense"}' in text
+    assert 'expense_db_query_duration_seconds_count{verb="SELECT"}' in text
+
+def test_ingest_queue_coalesces_and_acks_after_commit(monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+    from app import config, crud, ingest, schemas
+    from app.database import SessionLocal
+    g1, g2 = create_group("Ingest1"), create_group("Ingest2")
+    u1, u2 = create_user("User1"), create_user("User2")
+    for gid in (g1, g2):
+        add_member(gid, u1)
+        add_member(gid, u2)
+    payload = {
+        "amount": 10.00,
+        "paid_by": [{"user_id": u1, "amount": 10.00}],
+        "split_type": "equal",
+        "users": [u1, u2]
+    }
+
+    queue = ingest.IngestQueue(lambda group_id: SessionLocal(), batch_size=50, batch_ms=50)
+    db = SessionLocal()
+    try:
+        futures = [queue.submit(db, gid, schemas.ExpenseCreate(**payload)) for gid in (g1, g2) * 10]
+        with pytest.raises(ValueError):
+            queue.submit(db, 999999, schemas.ExpenseCreate(**payload))
+    finally:
+        db.close()
+    expenses = [f.result(timeout=10) for f in futures]
+    assert len({e.id for e in expenses}) == 20
+    stats = queue.stats()
+    assert stats["items"] == 20 and stats["commits"] < 20
+    queue.stop()
+    assert get_balances(g1) == get_balances(g2) == {u1: 50.0, u2: -50.0}
+
+    full = ingest.IngestQueue(lambda group_id: SessionLocal(), maxsize=1, enqueue_timeout_ms=10)
+    full.start = lambda: None  # no worker, so the queue stays full
+    full.enqueue(g1, None, "USD", {})
+    with pytest.raises(ingest.QueueFull):
+        full.enqueue(g1, None, "USD", {})
+
+    monkeypatch.setattr(config, "INGEST_QUEUE", True)
+    with ThreadPoolExecutor(8) as pool:
+        responses = list(pool.map(lambda _: client.post(f"/groups/{g1}/expenses", json=payload), range(8)))
+    assert [r.status_code for r in responses] == [200] * 8
+    assert {"id", "group_id", "amount", "currency", "created_at"} <= set(responses[0].json())
+    assert client.post("/groups/999999/expenses", json=payload).status_code == 400
+    assert get_balances(g1) == {u1: 90.0, u2: -90.0}
+    assert client.get("/admin/ingest").json()["items"] >= 8
+    ingest.get_queue().stop()
+
+def test_concurrent_settles_and_simplifies_never_over_settle():
+    from concurrent.futures import ThreadPoolExecutor
+    from decimal import Decimal
+    from app import crud
+    from app.database import SessionLocal
+    gid = create_group("Contended")
+    u1, u2, u3 = create_user("User1"), create_user("User2"), create_user("User3")
+    for uid in (u1, u2, u3):
+        add_member(gid, uid)
+    add_expense(gid, {
+        "amount": 300.00,
+        "paid_by": [{"user_id": u1, "amount": 300.00}],
+        "split_type": "equal",
+        "users": [u1, u2, u3]
+    })
+
+    def settle(_):
+        db = SessionLocal()
+        try:
+            crud.add_settlement(db, gid, u2, u1, Decimal("10.00"))
+            return "ok"
+        except ValueError as e:
+            return str(e)
+        finally:
+            db.close()
+
+    # 40 settles of 10 against a debt of 100: at most 10 may land.
+    with ThreadPoolExecutor(16) as pool:
+        outcomes = list(pool.map(settle, range(40)))
+    assert outcomes.count("ok") == 10
+    assert set(outcomes) - {"ok"} <= {"Payer does not owe anything", "Cannot settle more than outstanding"}
+    assert get_balances(gid) == {u1: 100.0, u2: 0.0, u3: -100.0}
+
+    def simplify_once(_):
+        db = SessionLocal()
+        try:
+            return len(crud.simplify_debts(db, gid))
+        finally:
+            db.close()
+
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(simplify_once, range(8)))
+    assert get_balances(gid) == {u1: 0.0, u2: 0.0, u3: 0.0}
+    assert len(client.get(f"/groups/{gid}/settlements").json()["items"]) == 11
+    db = SessionLocal()
+    try:
+        assert crud.check_balances(db, gid) == []
+    finally:
+        db.close()
+
+
+def test_async_write_retries_do_not_block_the_event_loop(monkeypatch):
+    from app import config, crud
+    if not config.ASYNC_DB:
+        pytest.skip("the sync routers run crud in a threadpool, where time.sleep is fine")
+    gid = create_group("Async Retry")
+    u1, u2 = create_user("Retry1"), create_user("Retry2")
+    for uid in (u1, u2):
+        add_member(gid, uid)
+    add_expense(gid, {"amount": 20.0, "paid_by": [{"user_id": u1, "amount": 20.0}],
+                      "split_type": "equal", "users": [u1, u2]})
+
+    bump = crud._bump_version
+    stale = iter([True, True])
+
+    def racing_bump(db, group_id, expected=None):
+        if expected is not None and next(stale, False):
+            raise crud.StaleVersion(f"Group {group_id} changed since version {expected}")
+        return bump(db, group_id, expected)
+
+    def blocking_sleep(seconds):
+        raise AssertionError("time.sleep on the event loop")
+
+    monkeypatch.setattr(crud, "_bump_version", racing_bump)
+    monkeypatch.setattr(crud.time, "sleep", blocking_sleep)
+    settle_debt(gid, payer_id=u2, payee_id=u1, amount=10.0)
+    assert next(stale, None) is None
+    assert get_balances(gid) == {u1: 0.0, u2: 0.0}
+
+
+def test_sharded_groups_route_and_move_between_shards(tmp_path, monkeypatch):
+    from sqlalchemy import func, select
+    from app import config, database, models, sharding
+    if config.ASYNC_DB:
+        pytest.skip("sharding is served by the sync routers only")
+    router = sharding.ShardRouter(database.engine, [f"sqlite:///{tmp_path / f'shard{n}.db'}" for n in (1, 2)])
+    router.migrate()
+    monkeypatch.setattr(config, "SHARDS", 3)
+    monkeypatch.setattr(config, "READ_POOL", False)
+    monkeypatch.setattr(sharding, "_router", router)
+
+    def expenses_on(shard, gid):
+        with router.engines[shard].connect() as conn:
+            return conn.execute(select(func.count()).select_from(models.Expense).where(
+                models.Expense.group_id == gid)).scalar()
+
+    a, b, c = create_user("ShardA"), create_user("ShardB"), create_user("ShardC")
+    gids = [create_group(f"Shard {n}") for n in range(3)]
+    for gid in gids:
+        assert router.shard_of(gid) == gid % 3
+        for uid in (a, b, c):
+            add_member(gid, uid)
+        add_expense(gid, {"amount": 30.0, "paid_by": [{"user_id": a, "amount": 30.0}],
+                          "split_type": "equal", "users": [a, b, c]})
+        assert [expenses_on(shard, gid) for shard in range(3)] == [int(shard == gid % 3) for shard in range(3)]
+    settle_debt(gids[0], b, a, 5.0)
+
+    def summary():
+        r = client.get(f"/users/{a}/balances", params={"fresh": True})
+        assert r.status_code == 200
+        return r.json()
+
+    before = summary()
+    assert [g["group_id"] for g in before["groups"]] == gids
+    assert before["total"] == 55.0
+    assert {p["user_id"]: p["net"] for p in before["counterparties"]} == {b: 25.0, c: 30.0}
+
+    # Move every group one shard along; shard 0 (the home database) is a source once.
+    for gid in gids:
+        source, target = gid % 3, (gid + 1) % 3
+        moved = router.move_group(gid, target)
+        assert (moved["from"], moved["to"]) == (source, target)
+        assert moved["rows"]["expenses"] == 1 and moved["rows"]["group_members"] == 3
+        assert expenses_on(source, gid) == 0 and expenses_on(target, gid) == 1
+        assert router.shard_of(gid, fresh=True) == target
+        assert client.get(f"/groups/{gid}/balances/check").json()["consistent"]
+    assert summary() == before
+    assert get_balances(gids[0]) == {a: 15.0, b: -5.0, c: -10.0}
+
+    add_expense(gids[0], {"amount": 9.0, "paid_by": [{"user_id": b, "amount": 9.0}],
+                          "split_type": "equal", "users": [a, b, c]})
+    assert expenses_on((gids[0] + 1) % 3, gids[0]) == 2
+    r = client.get(f"/groups/{gids[0]}/expenses")
+    assert [e["amount"] for e in r.json()["items"]] == [9.0, 30.0]
+    assert client.get("/admin/shards").json()["enabled"]
+    for engine in router.engines[1:]:
+        engine.dispose()
+
+
+def test_read_pool_routing_with_staleness_and_version_tokens(monkeypatch):
+    from sqlalchemy import text
+    from sqlalchemy.exc import OperationalError
+    from app import config, replica
+    if config.ASYNC_DB:
+        pytest.skip("read routing is served by the sync routers only")
+    pool = replica.ReadPool(replica.read_url(config.DATABASE_URL))
+    monkeypatch.setattr(config, "READ_POOL", True)
+    monkeypatch.setattr(config, "READ_MAX_STALENESS_MS", 0)
+    monkeypatch.setattr(replica, "_pool", pool)
+    replica.write_log.clear()
+
+    gid = create_group("Replica")
+    u1, u2 = create_user("Reader1"), create_user("Reader2")
+    for uid in (u1, u2):
+        add_member(gid, uid)
+    add_expense(gid, {"amount": 40.0, "paid_by": [{"user_id": u1, "amount": 40.0}],
+                      "split_type": "equal", "users": [u1, u2]})
+    r = client.post(f"/groups/{gid}/settle", json={"payer_id": u2, "payee_id": u1, "amount": 10.0})
+    token = r.headers["x-group-version"]
+    group_id, version = map(int, token.split(":"))
+    assert group_id == gid
+
+    # Read-your-writes: the read pool has the token's version, so it answers.
+    r = client.get(f"/groups/{gid}/expenses/balances", headers={"X-Min-Version": token})
+    assert r.headers["x-group-version"] == token
+    assert {item["user_id"]: item["net"] for item in r.json()} == {u1: 10.0, u2: -10.0}
+    assert (pool.served, pool.fallbacks) == (1, {"token": 0, "stale": 0})
+
+    # A token ahead of the read pool goes to the primary.
+    r = client.get(f"/groups/{gid}/expenses", headers={"X-Min-Version": f"{gid}:{version + 1}"})
+    assert r.status_code == 200 and len(r.json()["items"]) == 1
+    assert pool.fallbacks["token"] == 1
+
+    # A write the read pool does not show yet: primary at zero tolerance, read pool within it.
+    replica.write_log.record(gid, version + 1)
+    assert client.get(f"/groups/{gid}/debts").status_code == 200
+    assert pool.fallbacks["stale"] == 1
+    monkeypatch.setattr(config, "READ_MAX_STALENESS_MS", 60_000)
+    r = client.get(f"/groups/{gid}/debts")
+    assert r.headers["x-group-version"] == token
+    assert pool.served == 2
+    assert client.get("/admin/reads").json()["served"] == 2
+
+    with pool.sessions() as db:
+        with pytest.raises(OperationalError):
+            db.execute(text("DELETE FROM users"))
+    replica.write_log.clear()
+    pool.engine.dispose()
@@ -1,7 +1,8 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from .. import crud, schemas
+from .. import config, crud, schemas, sharding
 from ..database import get_db
+from typing import Optional
 
 router = APIRouter(
     prefix="/users",
@@ -11,3 +12,26 @@ router = APIRouter(
 @router.post("")
 def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
     return crud.create_user(db, user.name, user.email)
+
+@router.get("/{user_id}/balances", summary="A user's balances across all their groups")
+def get_user_balances(user_id: int, currency: Optional[str] = None, fresh: bool = False,
+                      db: Session = Depends(get_db)):
+    """
+    Net per group (in each group's base currency), the total and the net with
+    each counterparty (in ``currency``). Served from a per-user cache that
+    writes invalidate; ``fresh=true`` recomputes.
+    """
+    try:
+        if config.SHARDS > 1:
+            summary = sharding.get_router().user_balance_summary(db, user_id, currency, use_cache=not fresh)
+        else:
+            summary = crud.user_balance_summary(db, user_id, currency, use_cache=not fresh)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "user_id": summary["user_id"],
+        "currency": summary["currency"],
+        "total": float(summary["total"]),
+        "groups": [dict(g, net=float(g["net"])) for g in summary["groups"]],
+        "counterparties": [{"user_id": c["user_id"], "net": float(c["net"])} for c in summary["counterparties"]],
+    }